@@ -1,21 +1,38 @@
 import os
 import json
+import base64
+import zlib
 import hmac
 import hashlib
 import secrets
 import random
+import time
 import jwt
-from functools import wraps
+from functools import wraps, partial
+from contextlib import nullcontext
 from datetime import datetime, timedelta
 from pathlib import Path
 from werkzeug.utils import secure_filename
-from flask import Flask, request, jsonify, send_from_directory, render_template, make_response, redirect
+from flask import Flask, request, jsonify, g, render_template, make_response, redirect, Response, stream_with_context
 import requests
-from PIL import Image
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, join_room, leave_room, rooms
+import click
+from storage import (JsonFileStore, SqliteStore, open_store, import_json_tree, gps_of,
+                     date_shard, shard_path, shard_directory)
+from geo import parse_bbox, in_bbox, ClusterIndex
+from rollups import DepthRollup, parse_bucket, parse_time, format_time, MAX_BUCKETS, STATUSES, GROUPS
+from media import derivative_paths, perceptual_hash, process_photo, ImagePolicy, ThumbnailQueue
+from dedup import DuplicateIndex
+from blobs import BlobStore, BlobRefs, UploadRequest, blob_name, blob_digest, iter_blobs
+from http_client import HttpClient
+from realtime import (socketio_options, RoomBatcher, viewport_rooms, point_rooms, is_feed_room,
+                      LEGACY_ROOM)
+from turnstile import TurnstileVerifier, VALID, UNAVAILABLE
+from response_cache import ResponseCache, ENCODINGS
+from file_response import send_media, OFFLOAD_MODES
+from metrics import Metrics, SIZE_BUCKETS, CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
-socketio = SocketIO(app, cors_allowed_origins='*', async_mode='threading')
 app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 10MB
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 31536000  # 1 year cache for static files
 
@@ -44,6 +61,15 @@ SCRAPED_NEWS_DIR = DATA_DIR / 'scraped_news'
 for d in [DATA_DIR, SUBMISSIONS_DIR, IMAGES_DIR, THUMBNAILS_DIR, INTEL_DIR, VOLUNTEERS_DIR, SCRAPED_NEWS_DIR]:
     d.mkdir(parents=True, exist_ok=True)
 
+# Photos are stored once per content, as images/<aa>/<sha256>.<ext>; uploads
+# stream straight into its staging area while being hashed
+photos = BlobStore(IMAGES_DIR, DATA_DIR / '.locks')
+
+class PhotoUploadRequest(UploadRequest):
+    blob_store = photos
+
+app.request_class = PhotoUploadRequest
+
 # Load config from .env
 from dotenv import load_dotenv
 load_dotenv()
@@ -58,32 +84,347 @@ TURNSTILE_SECRET = os.getenv('TURNSTILE_PRIVATE_KEY', '')  # Cloudflare Turnstil
 X_BEARER_TOKEN = os.getenv('X_BEARER_TOKEN', '')
 OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY', '')
 OPENROUTER_MODEL = os.getenv('OPENROUTER_MODEL', 'openrouter/auto')
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json').lower()  # json or sqlite
+JOURNAL_FSYNC = os.getenv('JOURNAL_FSYNC', 'batch').lower()  # batch (group commit) or off; json backend
+JSON_LAYOUT = os.getenv('JSON_LAYOUT', 'files').lower()  # files or segments; where the json backend writes submissions
+SQLITE_PATH = os.getenv('SQLITE_PATH', str(DATA_DIR / 'crowd.db'))
+ADMIN_PAGE_SIZE = int(os.getenv('ADMIN_PAGE_SIZE', 50))  # admin list page size
+ADMIN_PAGE_MAX = 500
+
+# Outbound services; override the URLs to point at a local stub (tools/stub_upstream.py)
+TURNSTILE_VERIFY_URL = os.getenv('TURNSTILE_VERIFY_URL', 'https://challenges.cloudflare.com/turnstile/v0/siteverify')
+X_API_BASE = os.getenv('X_API_BASE', 'https://api.twitter.com')
+OPENROUTER_API_BASE = os.getenv('OPENROUTER_API_BASE', 'https://api.openrouter.ai/v1')
+AI_API_BASE = os.getenv('AI_API_BASE', 'http://127.0.0.1:9103')
+SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE', '')  # unix[:///dir], redis://... or unset
+LIVE_BATCH_WINDOW = float(os.getenv('LIVE_BATCH_WINDOW', 0.2))  # seconds live updates are coalesced
+CHANGES_PAGE_SIZE = int(os.getenv('CHANGES_PAGE_SIZE', 500))  # max changes per /api/submissions/changes call
+RESPONSE_CACHE_MB = int(os.getenv('RESPONSE_CACHE_MB', 64))  # per-worker cache of public GET responses
+SUBMISSIONS_MAX_AGE = int(os.getenv('SUBMISSIONS_MAX_AGE', 5))  # seconds clients may reuse /api/submissions
+IMAGE_FORMAT = os.getenv('IMAGE_FORMAT', 'jpeg').lower()  # jpeg (progressive), webp or original: how stored photos are re-encoded
+IMAGE_MAX_DIM = int(os.getenv('IMAGE_MAX_DIM', 2048))  # longest side of re-encoded photos, px
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', 82))  # re-encode quality, 1-100
+KEEP_ORIGINALS = os.getenv('KEEP_ORIGINALS', '').lower() in ('1', 'true', 'yes')  # also keep photos as uploaded
+MEDIA_OFFLOAD = os.getenv('MEDIA_OFFLOAD', 'off').lower()  # off, x-accel (nginx) or x-sendfile: proxy sends photos
+MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/_crowd_data/')  # internal nginx location aliased to crowd_data/
+if MEDIA_OFFLOAD not in OFFLOAD_MODES:
+    raise ValueError(f"MEDIA_OFFLOAD must be one of {', '.join(OFFLOAD_MODES)}")
+DEDUP_MODE = os.getenv('DEDUP_MODE', 'link').lower()  # off, link (kept, off the map) or merge (counted on the first report)
+DEDUP_RADIUS_M = float(os.getenv('DEDUP_RADIUS_M', 50))  # reports this close ...
+DEDUP_WINDOW_MIN = float(os.getenv('DEDUP_WINDOW_MIN', 15))  # ... and this many minutes apart can be duplicates
+DEDUP_HASH_DISTANCE = int(os.getenv('DEDUP_HASH_DISTANCE', 6))  # max differing bits of two similar photos' hashes
+TURNSTILE_TIMEOUT = float(os.getenv('TURNSTILE_TIMEOUT', 4))  # seconds submit waits for siteverify
+TURNSTILE_DEGRADED = os.getenv('TURNSTILE_DEGRADED', 'reject').lower()  # reject or quarantine
+METRICS_DIR = os.getenv('METRICS_DIR', str(DATA_DIR / '.metrics'))  # per-worker files /metrics merges
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # bearer token /metrics requires, if set
+
+# Request, submit pipeline, live update and storage metrics of every worker, at /metrics
+metrics = Metrics(METRICS_DIR)
+metrics.counter('http_requests_total', 'HTTP requests by route, method and status')
+metrics.histogram('http_request_duration_seconds', 'Seconds to build HTTP responses by route; streamed bodies excluded')
+metrics.histogram('submit_stage_seconds', 'Seconds /api/submit spends per stage; thumbnail is the background photo job')
+metrics.gauge('photo_jobs_pending', 'Background photo jobs queued or running')
+metrics.gauge('socketio_connected_clients', 'Connected Socket.IO clients')
+metrics.histogram('live_emit_seconds', 'Seconds to emit one batch of live updates to every room it changed')
+metrics.counter('live_emit_rooms_total', 'Rooms live update batches were emitted to')
+metrics.histogram('store_scan_rows', 'Submissions a storage operation went through, by operation',
+                  buckets=SIZE_BUCKETS)
+metrics.gauge('store_submissions', 'Stored submissions by verification status', aggregate='max')
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.inc('http_requests_total', method=request.method, route=route, status=str(response.status_code))
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - start,
+                        method=request.method, route=route)
+    return response
+
+def record_live_flush(rooms, seconds):
+    metrics.observe('live_emit_seconds', seconds)
+    metrics.inc('live_emit_rooms_total', rooms)
+
+# Emits reach clients of every worker through the message queue, if configured
+socketio = SocketIO(app, cors_allowed_origins='*', async_mode='threading',
+                    **socketio_options(SOCKETIO_MESSAGE_QUEUE))
+# Report changes go out in batches to the geohash rooms map clients subscribe to
+live_updates = RoomBatcher(socketio, 'submissions', window=LIVE_BATCH_WINDOW, on_flush=record_live_flush)
+
+# Pooled client for every outbound call; timeouts are (connect, read) seconds
+http = HttpClient()
+http.register('turnstile', TURNSTILE_VERIFY_URL, timeout=(3.05, 5), retries=1)
+http.register('x', X_API_BASE, timeout=(3.05, 15))
+http.register('openrouter', OPENROUTER_API_BASE, timeout=(3.05, 60))
+http.register('ai', AI_API_BASE, timeout=(3.05, 120), failure_threshold=3)
+
+# Turnstile tokens are verified concurrently with the upload and cached by hash
+turnstile = TurnstileVerifier(http, 'turnstile', TURNSTILE_SECRET, cache_dir=DATA_DIR / '.turnstile_cache')
+
+# Submissions, volunteers, intel and scraped news all go through this store
+store = open_store(STORAGE_BACKEND, DATA_DIR, SQLITE_PATH, fsync=JOURNAL_FSYNC != 'off', layout=JSON_LAYOUT)
+store.on_scan = lambda op, rows: metrics.observe('store_scan_rows', rows, op=op)
+metrics.collect(lambda: [('store_submissions', {'status': status}, count)
+                         for status, count in store.submission_counts().items()])
+
+# Public GET responses, rebuilt only when the data they were built from changes
+response_cache = ResponseCache(max_bytes=RESPONSE_CACHE_MB * 1024 * 1024)
+
+# Map clusters for every zoom level, updated in place on each store change
+submission_clusters = ClusterIndex(include=lambda s: s.get('verification_status') != 'quarantined'
+                                   and not s.get('duplicate_of'))
+store.subscribe(submission_clusters)
+# Depth per time bucket and zone for /api/stats/depth. Unlike the clusters it counts every
+# observation: linked duplicates and the reports merged into an earlier one included
+depth_rollup = DepthRollup(include=lambda s: s.get('verification_status') != 'quarantined')
+store.subscribe(depth_rollup)
+# Recent photo reports, to spot the same scene reported again at submit time
+recent_reports = DuplicateIndex(radius_m=DEDUP_RADIUS_M, window=DEDUP_WINDOW_MIN * 60,
+                                max_distance=DEDUP_HASH_DISTANCE,
+                                include=lambda s: s.get('verification_status') not in ('quarantined', 'invalid'))
+if DEDUP_MODE != 'off':
+    store.subscribe(recent_reports)
+# Submissions per stored photo and thumbnail, so shared files are deleted with their last report
+image_refs = BlobRefs(('image_path', 'original_path', 'thumbnail_path'))
+store.subscribe(image_refs)
+# Stored photos are re-encoded, without metadata, by the background photo job
+photo_policy = ImagePolicy(IMAGE_FORMAT, IMAGE_MAX_DIM, IMAGE_QUALITY)
+# Photos the job has processed; until then an upload still has its EXIF/GPS and is not cached
+processed_images = BlobRefs(('image_path',),
+                            include=lambda s: s.get('image_policy') == photo_policy.tag)
+store.subscribe(processed_images)
+
+def reencoded_path(submission_id):
+    """Where the photo job writes a submission's re-encoded photo before it is stored"""
+    return photos.incoming / f'reencoded_{submission_id}{photo_policy.ext}'
+
+def thumbnail_set(thumbnail_path):
+    """thumbnails dict of a submission: extra derivatives next to the main thumbnail"""
+    return {
+        name: Path(path).relative_to(BASE_DIR).as_posix()
+        for name, (path, _, _) in derivative_paths(thumbnail_path).items() if name != 'thumb'
+    }
+
+photo_jobs_started = {}   # submission id -> perf_counter() when its photo job was queued
+
+def record_thumbnail_result(submission_id, thumbnail_path, ok, attempts):
+    """Store the outcome of a background photo job on its submission"""
+    started = photo_jobs_started.pop(submission_id, None)
+    if started is not None:
+        metrics.observe('submit_stage_seconds', time.perf_counter() - started, stage='thumbnail')
+        metrics.set('photo_jobs_pending', len(photo_jobs_started))
+    reencoded = reencoded_path(submission_id) if photo_policy.active else None
+    if reencoded and not reencoded.exists():
+        reencoded = None   # failed, or the photo was already small and clean
+
+    def update(submission):
+        submission['thumbnail_status'] = 'ready' if ok else 'failed'
+        submission['thumbnail_attempts'] = attempts
+        if ok:
+            # Map popup size and WebP
+            submission['thumbnails'] = thumbnail_set(thumbnail_path)
+            if photo_policy.active:
+                submission['image_policy'] = photo_policy.tag
+        if image_rel and submission.get('image_path') != image_rel:
+            if KEEP_ORIGINALS and not submission.get('original_path'):
+                submission['original_path'] = submission.get('image_path')
+            submission['image_path'] = image_rel
+        return submission
+
+    image_rel = None
+    # The re-encoded photo is referenced before the lock on its digest is released
+    with photos.committed(reencoded, photo_policy.ext) if reencoded else nullcontext() as image_path:
+        if image_path:
+            image_rel = image_path.relative_to(BASE_DIR).as_posix()
+        old, submission = store.update_submission(submission_id, update)
+    if not old:
+        # Deleted while the photo was being processed; thumbnails are left to gc-images
+        if image_rel:
+            release_file(image_rel)
+        if not blob_digest(thumbnail_path, THUMBNAILS_DIR):
+            Path(thumbnail_path).unlink(missing_ok=True)
+        return
+    replaced = old.get('image_path')
+    if replaced and replaced not in (submission.get('image_path'), submission.get('original_path')):
+        release_file(replaced)
+    publish_change(old, submission)   # the map popup photo
+
+def settle_quarantine(submission_id, outcome):
+    """Apply a Turnstile result that arrived after the submission was quarantined"""
+    try:
+        if outcome == UNAVAILABLE:
+            return   # still unknown; an admin has to review it
+
+        def update(submission):
+            if submission.get('verification_status') != 'quarantined':
+                return None   # already reviewed by an admin
+            submission['verification_status'] = 'pending' if outcome == VALID else 'invalid'
+            return submission
+
+        _, submission = store.update_submission(submission_id, update)
+        if submission and outcome == VALID:
+            publish_submission(submission)
+    except Exception as e:
+        print(f"Quarantine settle error: {e}")
+
+def map_view(submission):
+    """The subset of a submission sent to map clients"""
+    thumbnails = submission.get('thumbnails') or {}
+    return {
+        'gps': submission['gps'],
+        'received_at': submission.get('received_at'),
+        'flood_depth_cm': submission.get('flood_depth_cm', 0),
+        'id': submission.get('id'),
+        'location': submission.get('zone') or submission.get('street', 'Unknown location'),
+        'street': submission.get('street', ''),
+        'name': submission.get('name', 'Anonymous'),
+        'vehicle_type': submission.get('vehicle_type', ''),
+        'photo': thumbnails.get('popup')
+    }
+
+def on_map(submission):
+    """Whether map clients are shown this submission; duplicates are shown as their first report"""
+    return (submission is not None and submission.get('verification_status') != 'quarantined'
+            and not submission.get('duplicate_of') and gps_of(submission)[0] is not None)
+
+def publish_submission(submission):
+    """Push a new report to the map clients watching its location"""
+    # Clients from before viewport rooms still expect one event per report
+    socketio.emit('new_submission', map_view(submission), to=LEGACY_ROOM)
+    publish_change(None, submission)
+
+def publish_change(old, new):
+    """Push a saved (old -> new) or deleted (new is None) report to the map clients watching it"""
+    old_rooms = point_rooms(*gps_of(old)) if on_map(old) else []
+    new_rooms = point_rooms(*gps_of(new)) if on_map(new) else []
+    if new_rooms and old_rooms == new_rooms and map_view(old) == map_view(new):
+        return   # nothing the map shows has changed
+    submission_id = (new or old)['id']
+    # Read after the write: at least the change's own seq, so clients that loaded
+    # or caught up to an older seq apply it and move their seq forward
+    seq = store.change_seq()
+    gone = [room for room in old_rooms if room not in new_rooms]
+    if gone:
+        live_updates.add(submission_id, None, gone, seq)
+    if new_rooms:
+        live_updates.add(submission_id, map_view(new), new_rooms, seq)
+
+# Thumbnails are generated off the request path; THUMBNAIL_POOL=process is
+# recommended under gevent workers, where threads do not run in parallel
+thumbnail_queue = ThumbnailQueue(
+    record_thumbnail_result,
+    workers=int(os.getenv('THUMBNAIL_WORKERS', 2)),
+    max_pending=int(os.getenv('THUMBNAIL_QUEUE_SIZE', 64)),
+    retries=int(os.getenv('THUMBNAIL_RETRIES', 2)),
+    use_processes=os.getenv('THUMBNAIL_POOL', 'thread').lower() == 'process',
+    job=partial(process_photo, policy=photo_policy))
+
+def queue_photo_job(submission, image_path, thumbnail_path, wait=False):
+    """Queue thumbnailing, and re-encoding unless already done, of a saved submission's photo"""
+    submission_id = submission['id']
+    reencode = photo_policy.active and submission.get('image_policy') != photo_policy.tag
+    args = (reencoded_path(submission_id),) if reencode else ()
+    photo_jobs_started[submission_id] = time.perf_counter()
+    metrics.set('photo_jobs_pending', len(photo_jobs_started))
+    while not thumbnail_queue.submit(submission_id, image_path, thumbnail_path, *args):
+        if not wait:
+            # Queue is full: process inline rather than drop the job
+            ok = thumbnail_queue.job(str(image_path), str(thumbnail_path), *args)
+            record_thumbnail_result(submission_id, str(thumbnail_path), ok, 1)
+            return
+        time.sleep(0.1)
+
+def photo_source(submission):
+    """The stored photo a job should start from: the upload as sent, if it was kept"""
+    return media_file(submission.get('original_path') or submission['image_path'])
+
+def thumbnail_target(submission, image_path):
+    """Thumbnail path of a stored photo; new ones are keyed by the uploaded photo's digest"""
+    if submission.get('thumbnail_path'):
+        return media_file(submission['thumbnail_path'])
+    digest = submission.get('photo_sha256') or photos.digest_of(image_path)
+    if digest:
+        return THUMBNAILS_DIR / blob_name(digest, '.jpg')
+    return shard_path(THUMBNAILS_DIR, f"thumb_{submission['id']}.jpg")
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
+def count_duplicate(submission):
+    submission['duplicate_count'] = submission.get('duplicate_count', 0) + 1
+    submission['last_duplicate_at'] = datetime.now().isoformat()
+    return submission
+
+# What a report merged into an earlier one (DEDUP_MODE=merge) keeps of its own
+MERGED_FIELDS = ('id', 'received_at', 'flood_depth_cm', 'name', 'phone', 'remarks')
+
+def merge_duplicate(report):
+    """Update folding a repeat report into the first one, keeping its observation in 'duplicates'"""
+    observation = {field: report.get(field) for field in MERGED_FIELDS}
+    def update(submission):
+        submission['duplicates'] = submission.get('duplicates', []) + [observation]
+        return count_duplicate(submission)
+    return update
+
+def release_file(rel_path, derived=()):
+    """Delete a stored photo or thumbnail, and the files derived from it, once no submission uses it"""
+    path = BASE_DIR / rel_path
+    if blob_digest(path, IMAGES_DIR) or blob_digest(path, THUMBNAILS_DIR):
+        def referenced():
+            store.refresh()   # other workers may have saved a report with the same photo
+            return image_refs.count(rel_path) > 0
+        return photos.release(path, referenced, [BASE_DIR / rel for rel in derived])
+    # Saved before content-addressed storage: the files are this submission's own
+    for rel in [rel_path, *derived]:
+        media_file(rel).unlink(missing_ok=True)
+    return True
+
+def remove_photo(submission):
+    """Delete a deleted submission's photos and thumbnails, unless another submission shares them"""
+    for key in ('image_path', 'original_path'):
+        if submission.get(key):
+            release_file(submission[key])
+    if submission.get('thumbnail_path'):
+        release_file(submission['thumbnail_path'], (submission.get('thumbnails') or {}).values())
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def hmac_of(s):
     return hmac.new(CAPTCHA_SECRET.encode(), s.encode(), hashlib.sha256).hexdigest()
 
+def parse_time_param(value):
+    """Normalise an ISO timestamp query parameter to the local-time format of received_at"""
+    if not value:
+        return None
+    ts = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if ts.tzinfo is not None:
+        ts = ts.astimezone().replace(tzinfo=None)
+    return ts.isoformat()
+
+def encode_cursor(submission):
+    """Opaque list cursor pointing just past the given submission"""
+    key = json.dumps([submission.get('received_at') or '', submission['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip('=')
+
+def decode_cursor(value):
+    """Inverse of encode_cursor; raises ValueError for tampered cursors"""
+    if not value:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)))
+    except Exception:
+        raise ValueError('invalid cursor')
+    if not (isinstance(key, list) and len(key) == 2 and all(isinstance(k, str) for k in key)):
+        raise ValueError('invalid cursor')
+    return tuple(key)
+
 def check_auth(username, password):
     return username == ADMIN_USER and password == ADMIN_PASS
 
-def create_thumbnail(image_path, thumbnail_path, size=(300, 300)):
-    """Create a thumbnail for the given image"""
-    try:
-        img = Image.open(image_path)
-        img.thumbnail(size, Image.Resampling.LANCZOS)
-        # Convert to RGB if necessary (for PNG with transparency)
-        if img.mode in ('RGBA', 'P'):
-            img = img.convert('RGB')
-        img.save(thumbnail_path, 'JPEG', quality=85, optimize=True)
-        return True
-    except Exception as e:
-        print(f"Thumbnail creation error: {e}")
-        return False
-
 def requires_auth(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -102,6 +443,45 @@ def requires_auth(f):
         return f(*args, **kwargs)
     return decorated
 
+def cached(max_age, version=None, compress=False, query=True):
+    """Serve a public GET view from response_cache with an ETag and 304s.
+
+    version() returns the version of the data the view reads (e.g. the store
+    change seq); the cached response is reused until it changes. Without
+    one the response is cached for the life of the process. compress=True
+    stores gzip (and brotli, if installed) bodies next to the plain one.
+    query=False keeps the query string out of the cache key, for views that
+    ignore it, so made-up query strings cannot fill the cache.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            current = version() if version else None
+            key = (request.path, request.query_string if query else b'')
+            entry = response_cache.get(key, current)
+            if entry is None:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                headers = [(k, v) for k, v in response.headers
+                           if k not in ('Content-Length', 'Set-Cookie')]
+                entry = response_cache.put(key, current, response.get_data(), response.status_code, headers,
+                                           encodings=ENCODINGS if compress else ())
+            encoding = request.accept_encodings.best_match(list(entry.encoded)) if entry.encoded else None
+            if encoding:
+                response = Response(entry.encoded[encoding], status=entry.status, headers=entry.headers)
+                response.headers['Content-Encoding'] = encoding
+                response.set_etag(f'{entry.etag}-{encoding}')   # one ETag per representation
+            else:
+                response = Response(entry.body, status=entry.status, headers=entry.headers)
+                response.set_etag(entry.etag)
+            if entry.encoded:
+                response.vary.add('Accept-Encoding')
+            response.headers['Cache-Control'] = f'public, max-age={max_age}'
+            return response.make_conditional(request)
+        return decorated
+    return decorator
+
 # Get Google API Key
 def get_google_api_key():
     return os.getenv('GOOGLE_MAP_API', '')
@@ -116,6 +496,7 @@ def index():
     return redirect('/report')
 
 @app.route('/report')
+@cached(max_age=300, compress=True, query=False)
 def report_page():
     """Flood Report submission page"""
     return render_template('report.html', 
@@ -124,6 +505,7 @@ def report_page():
         google_api_key=get_google_api_key())
 
 @app.route('/volunteer')
+@cached(max_age=300, compress=True, query=False)
 def volunteer_page():
     """Volunteer registration and sign-in page"""
     return render_template('volunteer.html', 
@@ -132,6 +514,7 @@ def volunteer_page():
         google_api_key=get_google_api_key())
 
 @app.route('/map')
+@cached(max_age=300, compress=True, query=False)
 def map_page():
     """Interactive flood map with auto-refresh"""
     return render_template('floodmap.html', 
@@ -140,6 +523,7 @@ def map_page():
         google_api_key=get_google_api_key())
 
 @app.route('/about')
+@cached(max_age=300, compress=True, query=False)
 def about_page():
     """About page with portal information"""
     return render_template('about.html', 
@@ -180,11 +564,6 @@ SUPPORTED_LANGUAGES = [
     'sk'   # Sanskrit
 ]
 
-def template_exists(template_name):
-    """Check if a template file exists"""
-    template_path = Path(app.template_folder) / template_name
-    return template_path.exists()
-
 # Language-to-template name mapping (used by all lang routes)
 LANG_NAMES = {
     'hn': 'hindi', 'bn': 'bengali', 'ta': 'tamil', 'te': 'telugu',
@@ -194,29 +573,42 @@ LANG_NAMES = {
     'kk': 'konkani', 'mp': 'manipuri', 'np': 'nepali', 'st': 'santali',
     'sd': 'sindhi', 'sk': 'sanskrit',
 }
+LANG_PAGES = ['report', 'volunteer', 'about']
+
+def find_lang_templates():
+    """(lang, page) -> template for every translation on disk, so requests never stat"""
+    templates = {}
+    for lang, name in LANG_NAMES.items():
+        for page in LANG_PAGES:
+            template = f'{lang}/{page}_{name}.html'
+            if (Path(app.template_folder) / template).exists():
+                templates[(lang, page)] = template
+    return templates
+
+LANG_TEMPLATES = find_lang_templates()
 
 def _serve_lang_page(lang, page, fallback, page_title=None):
     """Serve a language-specific page or redirect to the English fallback."""
-    if lang in SUPPORTED_LANGUAGES and lang != 'en':
-        name = LANG_NAMES.get(lang)
-        if name:
-            template = f'{lang}/{page}_{name}.html'
-            if template_exists(template):
-                return render_template(template,
-                    page=page,
-                    page_title=page_title or page.title(),
-                    google_api_key=get_google_api_key())
+    template = LANG_TEMPLATES.get((lang, page))
+    if template:
+        return render_template(template,
+            page=page,
+            page_title=page_title or page.title(),
+            google_api_key=get_google_api_key())
     return redirect(fallback)
 
 @app.route('/<lang>/report')
+@cached(max_age=300, compress=True, query=False)
 def lang_report(lang):
     return _serve_lang_page(lang, 'report', '/report', 'Report Flood')
 
 @app.route('/<lang>/volunteer')
+@cached(max_age=300, compress=True, query=False)
 def lang_volunteer(lang):
     return _serve_lang_page(lang, 'volunteer', '/volunteer', 'Volunteer Portal')
 
 @app.route('/<lang>/about')
+@cached(max_age=300, compress=True, query=False)
 def lang_about(lang):
     return _serve_lang_page(lang, 'about', '/about', 'About')
 
@@ -272,6 +664,9 @@ def captcha():
 @app.route('/api/submit', methods=['POST'])
 def submit():
     try:
+        # Parsing the form streams the photo to disk (see blobs.UploadRequest)
+        with metrics.timer('submit_stage_seconds', stage='upload'):
+            request.files
         name = request.form.get('name', '').strip()
         phone = request.form.get('phone', '').strip()
         street = request.form.get('street', '').strip()
@@ -302,34 +697,28 @@ def submit():
         if not turnstile_token:
             return jsonify({'error': 'Please complete the Turnstile verification'}), 400
         
-        if TURNSTILE_SECRET:
-            turnstile_response = requests.post('https://challenges.cloudflare.com/turnstile/v0/siteverify', data={
-                'secret': TURNSTILE_SECRET,
-                'response': turnstile_token
-            })
-            if not turnstile_response.json().get('success'):
-                return jsonify({'error': 'Turnstile verification failed. Please try again.'}), 400
+        # Verify in the background while the photo is checked for duplicates
+        verification = turnstile.start(turnstile_token, request.remote_addr) if TURNSTILE_SECRET else None
 
         # Generate timestamp and random string for submission ID
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         random_str = secrets.token_hex(4)
         
-        # Photo is optional
+        # Photo is optional; it was already written to staging and hashed while the form was parsed
+        photo = None
         image_filename = None
         thumbnail_filename = None
         if 'photo' in request.files:
             file = request.files['photo']
             if file.filename != '' and allowed_file(file.filename):
-                # Save original image
-                ext = Path(file.filename).suffix
-                image_filename = f"img_{timestamp}_{random_str}{ext}"
-                image_path = IMAGES_DIR / image_filename
-                file.save(str(image_path))
-                
-                # Generate thumbnail
-                thumbnail_filename = f"thumb_{timestamp}_{random_str}.jpg"
-                thumbnail_path = THUMBNAILS_DIR / thumbnail_filename
-                create_thumbnail(str(image_path), str(thumbnail_path))
+                photo = file.stream
+                # Stored under its digest once the submission is accepted
+                image_path = photos.path_for(photo.sha256, Path(file.filename).suffix)
+                image_filename = image_path.relative_to(IMAGES_DIR).as_posix()
+
+                # Thumbnails are shared by every report of the same photo
+                thumbnail_path = THUMBNAILS_DIR / blob_name(photo.sha256, '.jpg')
+                thumbnail_filename = thumbnail_path.relative_to(THUMBNAILS_DIR).as_posix()
 
         # Create submission
         submission_id = f"{timestamp}_{random_str}"
@@ -349,28 +738,84 @@ def submit():
             },
             'image_path': f'crowd_data/images/{image_filename}' if image_filename else None,
             'thumbnail_path': f'crowd_data/thumbnails/{thumbnail_filename}' if thumbnail_filename else None,
+            'thumbnail_status': 'pending' if thumbnail_filename else None,
             'received_at': datetime.now().isoformat(),
             'user_agent': request.headers.get('User-Agent', '')
         }
-
-        # Save submission JSON
-        submission_file = SUBMISSIONS_DIR / f"{submission_id}.json"
-        with open(submission_file, 'w', encoding='utf-8') as f:
-            json.dump(submission, f, indent=2)
+        if image_filename:
+            submission['photo_sha256'] = photo.sha256
+            if DEDUP_MODE != 'off':
+                with metrics.timer('submit_stage_seconds', stage='photo_hash'):
+                    submission['photo_dhash'] = perceptual_hash(photo.path)
+
+        quarantined = False
+        if verification is not None:
+            with metrics.timer('submit_stage_seconds', stage='turnstile'):
+                outcome = turnstile.outcome(verification, TURNSTILE_TIMEOUT)
+            quarantined = outcome == UNAVAILABLE and TURNSTILE_DEGRADED == 'quarantine'
+            if outcome != VALID and not quarantined:
+                if photo:
+                    photo.discard()
+                if outcome == UNAVAILABLE:
+                    return jsonify({'error': 'Verification service unavailable. Please try again.'}), 503
+                return jsonify({'error': 'Turnstile verification failed. Please try again.'}), 400
+            if quarantined:
+                # Verifier is down: keep the report for review but off the public map
+                submission['verification_status'] = 'quarantined'
+
+        # The same scene reported again nearby: merge into or link to the first report
+        duplicate = None
+        if DEDUP_MODE != 'off' and image_filename and not quarantined and gps_of(submission)[0] is not None:
+            with metrics.timer('submit_stage_seconds', stage='dedup'):
+                store.refresh()
+                duplicate = recent_reports.find(*gps_of(submission), submission['received_at'],
+                                                submission['photo_sha256'], submission.get('photo_dhash'))
+        if duplicate and DEDUP_MODE == 'merge':
+            original_id, _ = duplicate
+            old, original = store.update_submission(original_id, merge_duplicate(submission))
+            if old:
+                photo.discard()
+                publish_change(old, original)
+                return jsonify({'ok': True, 'id': original_id, 'duplicate_of': original_id})
+            duplicate = None   # deleted in the meantime
+        if duplicate:
+            original_id, kind = duplicate
+            submission['duplicate_of'] = original_id
+            submission['duplicate_kind'] = kind
+
+        # Save submission, with its photo locked so a report deleted meanwhile cannot take shared files along
+        needs_thumbnail = False
+        with photos.committed(photo, image_path.suffix) if photo else nullcontext():
+            if photo:
+                if all(Path(path).exists() for path, _, _ in derivative_paths(thumbnail_path).values()):
+                    # Same photo as an earlier report: its thumbnails are already there
+                    submission['thumbnail_status'] = 'ready'
+                    submission['thumbnails'] = thumbnail_set(thumbnail_path)
+                else:
+                    thumbnail_path.parent.mkdir(parents=True, exist_ok=True)
+                    needs_thumbnail = True
+            with metrics.timer('submit_stage_seconds', stage='record_write'):
+                store.save_submission(submission)
+        if duplicate:
+            old, original = store.update_submission(duplicate[0], count_duplicate)
+            if old:
+                publish_change(old, original)
+
+        if quarantined:
+            verification.add_done_callback(lambda f: settle_quarantine(submission_id, turnstile.claim(f)))
+
+        if photo and (needs_thumbnail or photo_policy.active):
+            queue_photo_job(submission, image_path, thumbnail_path)
 
         # Emit real-time event to all connected map clients
-        socketio.emit('new_submission', {
-            'id': submission_id,
-            'gps': submission['gps'],
-            'received_at': submission['received_at'],
-            'flood_depth_cm': submission['flood_depth_cm'],
-            'location': submission.get('zone') or submission.get('street', 'Unknown location'),
-            'street': submission.get('street', ''),
-            'name': submission.get('name', 'Anonymous'),
-            'vehicle_type': submission.get('vehicle_type', '')
-        })
+        if not quarantined and not duplicate:
+            with metrics.timer('submit_stage_seconds', stage='emit'):
+                publish_submission(submission)
 
-        return jsonify({'ok': True, 'id': submission_id})
+        response = {'ok': True, 'id': submission_id}
+        if duplicate:
+            response['duplicate_of'] = duplicate[0]
+        return jsonify(response)
 
     except Exception as e:
         import traceback
@@ -379,30 +824,159 @@ def submit():
         return jsonify({'error': 'Server error occurred. Please try again.'}), 500
 
 @app.route('/api/submissions')
+@cached(max_age=SUBMISSIONS_MAX_AGE, version=store.change_seq)
 def get_submissions():
-    """Get all submissions with GPS and received_at data for map display"""
+    """Get submissions with GPS and received_at data for map display.
+
+    Optional bbox=minLon,minLat,maxLon,maxLat and since=/until= (ISO timestamps)
+    limit the result to the viewer's viewport and time window.
+    """
     try:
-        submissions = []
-        for file in SUBMISSIONS_DIR.glob('*.json'):
-            with open(file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if data.get('gps') and data['gps'].get('lat') and data['gps'].get('lon'):
-                    submissions.append({
-                        'gps': data['gps'],
-                        'received_at': data.get('received_at'),
-                        'flood_depth_cm': data.get('flood_depth_cm', 0),
-                        'id': data.get('id'),
-                        'location': data.get('zone') or data.get('street', 'Unknown location'),
-                        'street': data.get('street', ''),
-                        'name': data.get('name', 'Anonymous'),
-                        'vehicle_type': data.get('vehicle_type', '')
-                    })
-        return jsonify(submissions)
+        try:
+            bbox = parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+            since = parse_time_param(request.args.get('since'))
+            until = parse_time_param(request.args.get('until'))
+        except ValueError as e:
+            return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+
+        # Read before listing, so changes since this seq cover anything the list misses
+        seq = store.change_seq()
+        submissions = [map_view(data) for data in store.list_submissions(
+            geotagged=True, bbox=bbox, since=since, until=until, newest_first=False)
+            if on_map(data)]
+        response = jsonify(submissions)
+        response.headers['X-Change-Seq'] = str(seq)
+        return response
     except Exception as e:
         print(f"Error fetching submissions: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/submissions/changes')
+def get_submission_changes():
+    """Map reports saved or deleted after change seq since=, for clients catching up.
+
+    Start from the X-Change-Seq header of /api/submissions and pass the
+    returned seq next time; fetch again while more is true. reset means
+    since is too old and the client has to reload /api/submissions. An
+    optional bbox= leaves out saved reports outside it.
+    """
+    try:
+        try:
+            since = int(request.args['since'])
+            limit = min(max(int(request.args.get('limit', CHANGES_PAGE_SIZE)), 1), CHANGES_PAGE_SIZE)
+            bbox = parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+        except KeyError:
+            return jsonify({'error': 'since is required'}), 400
+        except ValueError as e:
+            return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+
+        changes = store.changes_since(since, limit)
+        submissions, deleted = [], list(changes['deleted'])
+        for data in changes['saved']:
+            if not on_map(data):
+                deleted.append(data['id'])   # quarantined or GPS removed since it was shown
+            elif not bbox or in_bbox(*gps_of(data), bbox):
+                submissions.append(map_view(data))
+        return jsonify({'seq': changes['seq'], 'reset': changes['reset'], 'more': changes['more'],
+                        'submissions': submissions, 'deleted': deleted})
+    except Exception as e:
+        print(f"Error fetching submission changes: {e}")
+        return jsonify({'error': 'Server error'}), 500
+
+# =============================================================================
+# LIVE UPDATES - map clients subscribe to the geohash cells of their viewport
+# =============================================================================
+@socketio.on('connect')
+def on_socket_connect():
+    join_room(LEGACY_ROOM)
+    metrics.inc('socketio_connected_clients')
+
+@socketio.on('disconnect')
+def on_socket_disconnect():
+    metrics.inc('socketio_connected_clients', -1)
+
+@socketio.on('viewport')
+def on_socket_viewport(data):
+    """Replace the client's rooms with the cells covering bbox=minLon,minLat,maxLon,maxLat"""
+    try:
+        bbox = parse_bbox((data or {}).get('bbox'))
+    except (ValueError, AttributeError, TypeError) as e:
+        return {'ok': False, 'error': str(e)}
+    wanted = set(viewport_rooms(bbox))
+    current = {room for room in rooms() if is_feed_room(room)}
+    for room in current - wanted:
+        leave_room(room)
+    for room in wanted - current:
+        join_room(room)
+    return {'ok': True, 'rooms': len(wanted)}
+
+@app.route('/api/submissions/clusters')
+def get_submission_clusters():
+    """Pre-aggregated report clusters for a map zoom level (z=) and optional bbox="""
+    try:
+        try:
+            zoom = int(request.args.get('z', 12))
+            bbox = parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+        except ValueError as e:
+            return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+
+        store.refresh()
+        clusters = submission_clusters.query(zoom, bbox)
+        return jsonify({'z': zoom, 'count': len(clusters), 'clusters': clusters})
+    except Exception as e:
+        print(f"Error fetching clusters: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def depth_stats_version():
+    # The default window ends now, so it also moves on every minute
+    return store.change_seq(), int(time.time()) // 60
+
+@app.route('/api/stats/depth')
+@cached(max_age=SUBMISSIONS_MAX_AGE, version=depth_stats_version)
+def get_depth_stats():
+    """count, mean, p50, p90 and max flood depth per time bucket, optionally per zone"""
+    try:
+        try:
+            bucket = parse_bucket(request.args.get('bucket', '15m'))
+            now = parse_time(datetime.now().isoformat()) + 1
+            # Read like /api/submissions does: offsets (and Z) are converted to local time
+            until = parse_time(parse_time_param(request.args['until'])) if request.args.get('until') else now
+            since = parse_time(parse_time_param(request.args['since'])) if request.args.get('since') else until - 86400
+            status = request.args.get('status', 'all').lower()
+            group = request.args.get('group', 'none').lower()
+            if status not in STATUSES:
+                raise ValueError(f"status must be one of {', '.join(STATUSES)}")
+            if group not in GROUPS:
+                raise ValueError(f"group must be one of {', '.join(GROUPS)}")
+            if since >= until:
+                raise ValueError('since must be before until')
+            if (until - since) // bucket > MAX_BUCKETS:
+                raise ValueError(f'at most {MAX_BUCKETS} buckets per request; use a larger bucket')
+        except ValueError as e:
+            return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+
+        store.refresh()
+        buckets = depth_rollup.query(bucket, since, until, status, group)
+        return jsonify({
+            'bucket_seconds': bucket,
+            'since': format_time(since // bucket * bucket),
+            'until': format_time(until),
+            'status': status,
+            'group': group,
+            'buckets': buckets,
+        })
+    except Exception as e:
+        print(f"Error fetching depth stats: {e}")
+        return jsonify({'error': 'Server error'}), 500
+
+def portraits_version():
+    try:
+        return (BASE_DIR / 'static' / 'portraits').stat().st_mtime_ns
+    except OSError:
+        return None
+
 @app.route('/api/portraits')
+@cached(max_age=3600, version=portraits_version, query=False)
 def get_portraits():
     """Get list of available portrait images for map markers"""
     try:
@@ -428,14 +1002,51 @@ def get_portraits():
         # Return fallback portraits on error
         return jsonify({'portraits': ['m2.png', 'p2.svg', 'w1.svg', 'w2.svg', 'm1.png', 'w3.png', 'w4.png']})
 
+def sharded_name(directory, filename):
+    """filename under directory, or its date shard if it was saved or moved there"""
+    shard = date_shard(filename)
+    if shard and '/' not in filename and not (directory / filename).is_file():
+        return f'{shard}/{filename}'   # a flat URL from before shard-crowd-data
+    return filename
+
+def media_file(rel_path):
+    """Absolute path of a stored image_path/thumbnail_path, even if moved into its shard since"""
+    path = BASE_DIR / rel_path
+    return path.parent / sharded_name(path.parent, path.name)
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+def serve_media(directory, filename, cache_control, content_addressed=False):
+    """A stored media file. In a content_addressed directory a file named by its digest
+    has that as a strong ETag and never changes; others are validated by mtime and size."""
+    filename = sharded_name(directory, filename)
+    digest = content_addressed and blob_digest(directory / filename, directory)
+    return send_media(directory, filename, IMMUTABLE if digest else cache_control,
+                      etag=Path(filename).stem if digest else None, offload=MEDIA_OFFLOAD,
+                      accel_prefix=f"{MEDIA_ACCEL_PREFIX.rstrip('/')}/{directory.name}")
+
 @app.route('/crowd_data/images/<path:filename>')
 def serve_image(filename):
-    return send_from_directory(IMAGES_DIR, filename)
+    # Uploads never reuse a file name, so even pre-digest photos are immutable
+    if photo_policy.active and not image_processed(filename):
+        # Not re-encoded yet, or a kept original: no cache may hold on to its metadata
+        return serve_media(IMAGES_DIR, filename, 'no-store')
+    return serve_media(IMAGES_DIR, filename, IMMUTABLE, content_addressed=True)
+
+def image_processed(filename):
+    """Whether a stored photo is the image_path of a submission the photo job has processed"""
+    rel_path = (IMAGES_DIR / sharded_name(IMAGES_DIR, filename)).relative_to(BASE_DIR).as_posix()
+    if processed_images.count(rel_path):
+        return True
+    store.refresh()   # processed by another worker since
+    return processed_images.count(rel_path) > 0
 
 @app.route('/crowd_data/thumbnails/<path:filename>')
 def serve_thumbnail(filename):
     """Serve thumbnail images for faster admin panel loading"""
-    return send_from_directory(THUMBNAILS_DIR, filename)
+    # Named after their photo's digest, not their own bytes: backfill-thumbnails --force and
+    # pipeline changes regenerate them in place, so they are revalidated by mtime and size
+    return serve_media(THUMBNAILS_DIR, filename, 'public, max-age=86400')
 
 @app.route('/api/admin/submissions', methods=['GET'])
 @requires_auth
@@ -443,34 +1054,47 @@ def admin_submissions():
     try:
         # Get filter parameter: all, valid, invalid, pending
         filter_type = request.args.get('filter', 'all').lower()
-        
-        files = sorted(SUBMISSIONS_DIR.glob('*.json'), key=lambda x: x.stat().st_mtime, reverse=True)
+        status_filter = None if filter_type == 'all' else filter_type
+        try:
+            limit = min(max(int(request.args.get('limit', ADMIN_PAGE_SIZE)), 1), ADMIN_PAGE_MAX)
+            after = decode_cursor(request.args.get('cursor'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # One extra row tells us whether another page exists
+        page = store.list_submissions(status=status_filter, limit=limit + 1, after=after)
+        has_more = len(page) > limit
+        page = page[:limit]
+        counts = store.submission_counts()
+
         items = []
-        for f in files:
-            with open(f, 'r', encoding='utf-8') as fp:
-                obj = json.load(fp)
-                status = obj.get('verification_status', 'pending')
-                
-                # Apply filter
-                if filter_type != 'all' and status != filter_type:
-                    continue
-                
-                items.append({
-                    'id': obj['id'],
-                    'name': obj['name'],
-                    'phone': obj['phone'],
-                    'zone': obj.get('zone', ''),
-                    'street': obj.get('street', ''),
-                    'vehicle_type': obj.get('vehicle_type', ''),
-                    'flood_depth_cm': obj['flood_depth_cm'],
-                    'remarks': obj.get('remarks', ''),
-                    'received_at': obj['received_at'],
-                    'image_path': obj.get('image_path'),
-                    'thumbnail_path': obj.get('thumbnail_path'),
-                    'gps': obj.get('gps', {}),
-                    'verification_status': status
-                })
-        return jsonify({'count': len(items), 'items': items})
+        for obj in page:
+            status = obj.get('verification_status', 'pending')
+            items.append({
+                'id': obj['id'],
+                'name': obj['name'],
+                'phone': obj['phone'],
+                'zone': obj.get('zone', ''),
+                'street': obj.get('street', ''),
+                'vehicle_type': obj.get('vehicle_type', ''),
+                'flood_depth_cm': obj['flood_depth_cm'],
+                'remarks': obj.get('remarks', ''),
+                'received_at': obj['received_at'],
+                'image_path': obj.get('image_path'),
+                # Until the background job finishes the admin panel falls back to the original
+                'thumbnail_path': obj.get('thumbnail_path') if obj.get('thumbnail_status', 'ready') == 'ready' else None,
+                'thumbnail_status': obj.get('thumbnail_status'),
+                'thumbnails': obj.get('thumbnails') or {},
+                'gps': obj.get('gps', {}),
+                'verification_status': status
+            })
+        return jsonify({
+            'count': len(items),
+            'total': counts.get(status_filter, 0) if status_filter else counts['all'],
+            'counts': counts,
+            'items': items,
+            'next_cursor': encode_cursor(page[-1]) if has_more else None,
+        })
     except Exception as e:
         print(f"List error: {e}")
         return jsonify({'error': 'Server error'}), 500
@@ -480,81 +1104,118 @@ def admin_submissions():
 def delete_submission(submission_id):
     """Delete a submission and its associated images"""
     try:
-        submission_file = SUBMISSIONS_DIR / f"{submission_id}.json"
-        if not submission_file.exists():
-            return jsonify({'error': 'Submission not found'}), 404
-        
         # Load submission to get image paths
-        with open(submission_file, 'r', encoding='utf-8') as f:
-            submission = json.load(f)
-        
-        # Delete original image if exists
-        if submission.get('image_path'):
-            image_file = BASE_DIR / submission['image_path']
-            if image_file.exists():
-                image_file.unlink()
-        
-        # Delete thumbnail if exists
-        if submission.get('thumbnail_path'):
-            thumb_file = BASE_DIR / submission['thumbnail_path']
-            if thumb_file.exists():
-                thumb_file.unlink()
-        
-        # Delete submission JSON
-        submission_file.unlink()
+        submission = store.get_submission(submission_id)
+        if not submission:
+            return jsonify({'error': 'Submission not found'}), 404
+
+        # Delete the record first, so it no longer counts as a reference to its photo
+        store.delete_submission(submission_id)
+        publish_change(submission, None)
+        remove_photo(submission)
         
         return jsonify({'ok': True, 'deleted': submission_id})
     except Exception as e:
         print(f"Delete error: {e}")
         return jsonify({'error': 'Server error'}), 500
 
-@app.route('/api/admin/export.json', methods=['GET'])
-@requires_auth
-def admin_export_json():
+# =============================================================================
+# EXPORTS - streamed in batches so memory stays flat for any archive size
+# =============================================================================
+EXPORT_CSV_COLUMNS = ['id', 'name', 'phone', 'street', 'zone', 'vehicle_type',
+                      'flood_depth_cm', 'remarks', 'gps_lat', 'gps_lon', 'gps_accuracy',
+                      'image_path', 'received_at']
+EXPORT_FLUSH_ROWS = 200   # rows buffered per chunk written to the socket
+
+def export_filters():
+    """status/zone/since/until query parameters shared by every export format"""
+    status = request.args.get('status', '').lower()
+    return {
+        'status': None if status in ('', 'all') else status,
+        'zone': request.args.get('zone') or None,
+        'since': parse_time_param(request.args.get('since')),
+        'until': parse_time_param(request.args.get('until')),
+    }
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)   # wbits 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_response(chunks, filename, mimetype):
+    """Stream export chunks as a download, gzipped when ?gzip=1"""
+    if request.args.get('gzip', '').lower() in ('1', 'true', 'yes'):
+        chunks, filename, mimetype = gzip_chunks(chunks), filename + '.gz', 'application/gzip'
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}',
+                             'X-Accel-Buffering': 'no'})
+
+def csv_chunks(submissions):
+    import csv
+    from io import StringIO
+
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow(EXPORT_CSV_COLUMNS)
+    for i, item in enumerate(submissions, 1):
+        gps = item.get('gps') or {}
+        writer.writerow([
+            item['id'], item.get('name', ''), item.get('phone', ''), item.get('street', ''),
+            item.get('zone', ''), item.get('vehicle_type', ''),
+            item.get('flood_depth_cm', ''), item.get('remarks', ''),
+            gps.get('lat', ''), gps.get('lon', ''),
+            gps.get('accuracy', ''), item.get('image_path', ''), item.get('received_at', '')
+        ])
+        if i % EXPORT_FLUSH_ROWS == 0:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+    yield output.getvalue()
+
+def ndjson_chunks(submissions):
+    lines = []
+    for item in submissions:
+        lines.append(json.dumps(item, ensure_ascii=False))
+        if len(lines) >= EXPORT_FLUSH_ROWS:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+def json_array_chunks(submissions):
+    yield '['
+    for i, item in enumerate(submissions):
+        yield (',' if i else '') + json.dumps(item, ensure_ascii=False)
+    yield ']'
+
+def export_route(chunker, filename, mimetype, label):
     try:
-        files = SUBMISSIONS_DIR.glob('*.json')
-        items = []
-        for f in files:
-            with open(f, 'r', encoding='utf-8') as fp:
-                items.append(json.load(fp))
-        return jsonify(items)
+        filters = export_filters()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        return export_response(chunker(store.scan_submissions(**filters)), filename, mimetype)
     except Exception as e:
-        print(f"Export JSON error: {e}")
+        print(f"Export {label} error: {e}")
         return jsonify({'error': 'Server error'}), 500
 
+@app.route('/api/admin/export.json', methods=['GET'])
+@requires_auth
+def admin_export_json():
+    return export_route(json_array_chunks, 'submissions.json', 'application/json', 'JSON')
+
+@app.route('/api/admin/export.ndjson', methods=['GET'])
+@requires_auth
+def admin_export_ndjson():
+    return export_route(ndjson_chunks, 'submissions.ndjson', 'application/x-ndjson', 'NDJSON')
+
 @app.route('/api/admin/export.csv', methods=['GET'])
 @requires_auth
 def admin_export_csv():
-    try:
-        import csv
-        from io import StringIO
-        
-        files = SUBMISSIONS_DIR.glob('*.json')
-        items = []
-        for f in files:
-            with open(f, 'r', encoding='utf-8') as fp:
-                items.append(json.load(fp))
-        
-        output = StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['id', 'name', 'phone', 'street', 'zone', 'vehicle_type', 
-                        'flood_depth_cm', 'remarks', 'gps_lat', 'gps_lon', 'gps_accuracy', 
-                        'image_path', 'received_at'])
-        
-        for item in items:
-            writer.writerow([
-                item['id'], item['name'], item['phone'], item.get('street', ''),
-                item.get('zone', ''), item.get('vehicle_type', ''),
-                item['flood_depth_cm'], item.get('remarks', ''),
-                item.get('gps', {}).get('lat', ''), item.get('gps', {}).get('lon', ''),
-                item.get('gps', {}).get('accuracy', ''), item['image_path'], item['received_at']
-            ])
-        
-        return output.getvalue(), 200, {'Content-Type': 'text/csv', 
-                                        'Content-Disposition': 'attachment; filename=submissions.csv'}
-    except Exception as e:
-        print(f"Export CSV error: {e}")
-        return jsonify({'error': 'Server error'}), 500
+    return export_route(csv_chunks, 'submissions.csv', 'text/csv', 'CSV')
 
 @app.route('/api/admin/crawl', methods=['POST'])
 @requires_auth
@@ -567,10 +1228,14 @@ def admin_crawl():
         hashtags = data.get('hashtags', ['#flood', '#urbanflood'])
         query = ' OR '.join(hashtags)
         
-        url = f"https://api.twitter.com/2/tweets/search/recent?query={query}&tweet.fields=created_at,geo,lang&max_results=50"
+        params = {'query': query, 'tweet.fields': 'created_at,geo,lang', 'max_results': 50}
         headers = {'Authorization': f'Bearer {X_BEARER_TOKEN}'}
         
-        response = requests.get(url, headers=headers)
+        try:
+            response = http.get('x', '/2/tweets/search/recent', params=params, headers=headers)
+        except requests.RequestException as e:
+            print(f"Crawl error: {e}")
+            return jsonify({'error': 'X API unavailable'}), 503
         if not response.ok:
             return jsonify({'error': 'X API error', 'detail': response.text}), response.status_code
         
@@ -591,11 +1256,9 @@ def admin_crawl():
             'summary': summary
         }
         
-        intel_file = INTEL_DIR / f"x_intel_{intel_id}.json"
-        with open(intel_file, 'w', encoding='utf-8') as f:
-            json.dump(intel, f, indent=2)
+        saved = store.save_intel(intel)
         
-        return jsonify({'ok': True, 'saved': f'crowd_data/intel/x_intel_{intel_id}.json'})
+        return jsonify({'ok': True, 'saved': saved})
     
     except Exception as e:
         print(f"Crawl error: {e}")
@@ -612,8 +1275,8 @@ def summarize_tweets_openrouter(tweets):
         areas (array of strings), roads_impacted (array strings), depths_cm (array numbers if mentioned), 
         severity (low/medium/high), summary (string). Input posts:\n{text}"""
         
-        response = requests.post(
-            'https://api.openrouter.ai/v1/chat/completions',
+        response = http.post(
+            'openrouter', '/chat/completions',
             headers={
                 'Authorization': f'Bearer {OPENROUTER_API_KEY}',
                 'Content-Type': 'application/json'
@@ -646,6 +1309,19 @@ def summarize_tweets_openrouter(tweets):
 def health():
     return jsonify({'ok': True})
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Metrics of every worker in the Prometheus text format"""
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}'):
+        return jsonify({'error': 'Authentication required'}), 401
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/api/admin/upstreams', methods=['GET'])
+@requires_auth
+def admin_upstreams():
+    """Latency, outcome and circuit breaker state of each outbound service"""
+    return jsonify(http.snapshot())
+
 # Volunteer Registration
 @app.route('/api/volunteer/register', methods=['POST'])
 def volunteer_register():
@@ -674,9 +1350,9 @@ def volunteer_register():
             'status': 'active'
         }
         
-        volunteer_file = VOLUNTEERS_DIR / f"{volunteer_id}.json"
-        with open(volunteer_file, 'w', encoding='utf-8') as f:
-            json.dump(volunteer, f, indent=2)
+        existing = store.register_volunteer(volunteer)
+        if existing:
+            return jsonify({'error': 'This phone number is already registered'}), 409
         
         return jsonify({'ok': True, 'id': volunteer_id})
     except Exception as e:
@@ -693,11 +1369,9 @@ def volunteer_login():
             return jsonify({'error': 'Phone number required'}), 400
         
         # Find volunteer by phone
-        for f in VOLUNTEERS_DIR.glob('*.json'):
-            with open(f, 'r', encoding='utf-8') as fp:
-                vol = json.load(fp)
-                if vol.get('phone') == phone:
-                    return jsonify({'ok': True, 'volunteer': vol})
+        vol = store.find_volunteer_by_phone(phone)
+        if vol:
+            return jsonify({'ok': True, 'volunteer': vol})
         
         return jsonify({'error': 'Volunteer not found'}), 404
     except Exception as e:
@@ -715,18 +1389,15 @@ def verify_submission(submission_id):
         if status not in ['valid', 'invalid']:
             return jsonify({'error': 'Status must be valid or invalid'}), 400
         
-        submission_file = SUBMISSIONS_DIR / f"{submission_id}.json"
-        if not submission_file.exists():
+        def update(submission):
+            submission['verification_status'] = status
+            submission['verified_at'] = datetime.now().isoformat()
+            return submission
+
+        old, submission = store.update_submission(submission_id, update)
+        if not old:
             return jsonify({'error': 'Submission not found'}), 404
-        
-        with open(submission_file, 'r', encoding='utf-8') as f:
-            submission = json.load(f)
-        
-        submission['verification_status'] = status
-        submission['verified_at'] = datetime.now().isoformat()
-        
-        with open(submission_file, 'w', encoding='utf-8') as f:
-            json.dump(submission, f, indent=2)
+        publish_change(old, submission)
         
         return jsonify({'ok': True, 'status': status})
     except Exception as e:
@@ -738,20 +1409,17 @@ def verify_submission(submission_id):
 @requires_auth
 def admin_volunteers():
     try:
-        files = sorted(VOLUNTEERS_DIR.glob('*.json'), key=lambda x: x.stat().st_mtime, reverse=True)
         items = []
-        for f in files:
-            with open(f, 'r', encoding='utf-8') as fp:
-                vol = json.load(fp)
-                items.append({
-                    'id': vol['id'],
-                    'username': vol.get('username', ''),
-                    'phone': vol.get('phone', ''),
-                    'skills': vol.get('skills', []),
-                    'availability': vol.get('availability', ''),
-                    'registered_at': vol.get('registered_at', ''),
-                    'status': vol.get('status', 'active')
-                })
+        for vol in store.list_volunteers():
+            items.append({
+                'id': vol['id'],
+                'username': vol.get('username', ''),
+                'phone': vol.get('phone', ''),
+                'skills': vol.get('skills', []),
+                'availability': vol.get('availability', ''),
+                'registered_at': vol.get('registered_at', ''),
+                'status': vol.get('status', 'active')
+            })
         return jsonify({'count': len(items), 'items': items})
     except Exception as e:
         print(f"Volunteers list error: {e}")
@@ -762,18 +1430,16 @@ def admin_volunteers():
 @requires_auth
 def get_submission(submission_id):
     try:
-        submission_file = SUBMISSIONS_DIR / f"{submission_id}.json"
-        if not submission_file.exists():
+        submission = store.get_submission(submission_id)
+        if not submission:
             return jsonify({'error': 'Submission not found'}), 404
         
-        with open(submission_file, 'r', encoding='utf-8') as f:
-            return jsonify(json.load(f))
+        return jsonify(submission)
     except Exception as e:
         print(f"Get submission error: {e}")
         return jsonify({'error': 'Server error'}), 500
 
 # AI Analysis Endpoints - Proxy to external API
-AI_API_BASE = os.getenv('AI_API_BASE', 'http://127.0.0.1:9103')
 
 @app.route('/api/admin/ai/search', methods=['POST'])
 @requires_auth
@@ -787,16 +1453,18 @@ def ai_search():
         if not query:
             return jsonify({'error': 'Query is required'}), 400
         
-        response = requests.post(
-            f'{AI_API_BASE}/api/search',
+        response = http.post(
+            'ai', '/api/search',
             json={'query': query, 'max_urls': max_urls},
             headers={'Content-Type': 'application/json'},
-            timeout=60
+            timeout=(3.05, 60)
         )
         
         return jsonify(response.json()), response.status_code
     except requests.exceptions.ConnectionError:
         return jsonify({'error': 'AI API service is not available. Make sure it is running on port 5001.'}), 503
+    except requests.exceptions.Timeout:
+        return jsonify({'error': 'AI API timed out'}), 504
     except Exception as e:
         print(f"AI Search error: {e}")
         return jsonify({'error': str(e)}), 500
@@ -812,16 +1480,17 @@ def ai_extract():
         if not urls:
             return jsonify({'error': 'URLs are required'}), 400
         
-        response = requests.post(
-            f'{AI_API_BASE}/api/extract',
+        response = http.post(
+            'ai', '/api/extract',
             json={'urls': urls},
-            headers={'Content-Type': 'application/json'},
-            timeout=120
+            headers={'Content-Type': 'application/json'}
         )
         
         return jsonify(response.json()), response.status_code
     except requests.exceptions.ConnectionError:
         return jsonify({'error': 'AI API service is not available. Make sure it is running on port 5001.'}), 503
+    except requests.exceptions.Timeout:
+        return jsonify({'error': 'AI API timed out'}), 504
     except Exception as e:
         print(f"AI Extract error: {e}")
         return jsonify({'error': str(e)}), 500
@@ -849,9 +1518,7 @@ def save_scraped_news():
             'item_count': len(news_items)
         }
         
-        news_file = SCRAPED_NEWS_DIR / f"{news_id}.json"
-        with open(news_file, 'w', encoding='utf-8') as f:
-            json.dump(news_record, f, indent=2)
+        store.save_news(news_record)
         
         return jsonify({'ok': True, 'id': news_id, 'saved_count': len(news_items)})
     except Exception as e:
@@ -863,18 +1530,15 @@ def save_scraped_news():
 def get_saved_news():
     """Get all saved scraped news records"""
     try:
-        files = sorted(SCRAPED_NEWS_DIR.glob('*.json'), key=lambda x: x.stat().st_mtime, reverse=True)
         items = []
-        for f in files:
-            with open(f, 'r', encoding='utf-8') as fp:
-                record = json.load(fp)
-                items.append({
-                    'id': record['id'],
-                    'query': record.get('query', ''),
-                    'scraped_at': record.get('scraped_at', ''),
-                    'item_count': record.get('item_count', 0),
-                    'news_items': record.get('news_items', [])
-                })
+        for record in store.list_news():
+            items.append({
+                'id': record['id'],
+                'query': record.get('query', ''),
+                'scraped_at': record.get('scraped_at', ''),
+                'item_count': record.get('item_count', 0),
+                'news_items': record.get('news_items', [])
+            })
         return jsonify({'count': len(items), 'items': items})
     except Exception as e:
         print(f"Get saved news error: {e}")
@@ -885,16 +1549,134 @@ def get_saved_news():
 def delete_saved_news(news_id):
     """Delete a saved news record"""
     try:
-        news_file = SCRAPED_NEWS_DIR / f"{news_id}.json"
-        if not news_file.exists():
+        if not store.delete_news(news_id):
             return jsonify({'error': 'News record not found'}), 404
         
-        news_file.unlink()
         return jsonify({'ok': True, 'deleted': news_id})
     except Exception as e:
         print(f"Delete news error: {e}")
         return jsonify({'error': 'Server error'}), 500
 
+# =============================================================================
+# CLI - flask --app app <command>
+# =============================================================================
+
+@app.cli.command('import-crowd-data')
+@click.option('--source', default=str(DATA_DIR), show_default=True,
+              help='crowd_data directory in the JSON file layout')
+@click.option('--db', default=SQLITE_PATH, show_default=True, help='SQLite database to import into')
+def import_crowd_data(source, db):
+    """Import an existing crowd_data/ tree into the SQLite backend"""
+    counts = import_json_tree(JsonFileStore(source), SqliteStore(db))
+    click.echo(f"Imported into {db}: " + ', '.join(f"{v} {k}" for k, v in counts.items()))
+
+@app.cli.command('convert-submissions')
+@click.option('--layout', type=click.Choice(['segments', 'files']), default='segments', show_default=True,
+              help='Layout to move every submission to')
+def convert_submissions(layout):
+    """Move JSON-backend submissions between per-file and daily segment layouts"""
+    if not isinstance(store, JsonFileStore):
+        raise click.ClickException('convert-submissions only applies to STORAGE_BACKEND=json')
+    moved = store.convert(layout)
+    click.echo(f"Moved {moved} submission(s) to the {layout} layout; set JSON_LAYOUT={layout} to keep writing there")
+
+@app.cli.command('backfill-thumbnails')
+@click.option('--force', is_flag=True, help='Regenerate thumbnails that already exist')
+def backfill_thumbnails(force):
+    """Generate missing thumbnails for submissions that have a photo"""
+    queued = 0
+    for submission in list(store.iter_submissions()):
+        if not submission.get('image_path'):
+            continue
+        image_path = photo_source(submission)
+        if not image_path.exists():
+            continue
+        thumbnail_path = thumbnail_target(submission, image_path)
+        thumbnail_path.parent.mkdir(parents=True, exist_ok=True)
+        thumbnail_rel = thumbnail_path.relative_to(BASE_DIR).as_posix()
+        if (not force and thumbnail_path.exists()
+                and submission.get('thumbnail_status', 'ready') == 'ready'):
+            continue
+        if submission.get('thumbnail_path') != thumbnail_rel or submission.get('thumbnail_status') != 'pending':
+            submission = dict(submission, thumbnail_path=thumbnail_rel, thumbnail_status='pending')
+            store.save_submission(submission)
+        queue_photo_job(submission, image_path, thumbnail_path, wait=True)
+        queued += 1
+    thumbnail_queue.wait()
+    failed = sum(1 for s in store.iter_submissions() if s.get('thumbnail_status') == 'failed')
+    click.echo(f"Processed {queued} thumbnail(s); {failed} submission(s) have a failed thumbnail")
+
+@app.cli.command('shard-crowd-data')
+def shard_crowd_data():
+    """Move files saved before date sharding into crowd_data/<kind>/YYYY/MM/DD/"""
+    counts = {'images': shard_directory(IMAGES_DIR), 'thumbnails': shard_directory(THUMBNAILS_DIR)}
+    if isinstance(store, JsonFileStore):
+        counts.update(store.shard_files())
+
+    # Point the records at the moved photos; the old URLs keep working regardless
+    def moved(rel_path):
+        return media_file(rel_path).relative_to(BASE_DIR).as_posix()
+
+    def update(submission):
+        changed = {}
+        for key in ('image_path', 'thumbnail_path'):
+            if submission.get(key) and moved(submission[key]) != submission[key]:
+                changed[key] = moved(submission[key])
+        thumbnails = submission.get('thumbnails') or {}
+        if any(moved(path) != path for path in thumbnails.values()):
+            changed['thumbnails'] = {name: moved(path) for name, path in thumbnails.items()}
+        return dict(submission, **changed) if changed else None
+
+    updated = 0
+    for submission in list(store.iter_submissions()):
+        _, new = store.update_submission(submission['id'], update)
+        updated += new is not None
+    click.echo("Moved " + ', '.join(f"{v} {k}" for k, v in counts.items()) +
+               f"; updated photo paths of {updated} submission(s)")
+
+@app.cli.command('optimize-images')
+def optimize_images():
+    """Re-encode stored photos under the IMAGE_FORMAT policy, dropping their metadata"""
+    if not photo_policy.active:
+        raise click.ClickException('IMAGE_FORMAT=original keeps photos as uploaded')
+
+    def images_mb():
+        return sum(f.stat().st_size for f in IMAGES_DIR.rglob('*') if f.is_file()) / 1e6
+
+    before = images_mb()
+    queued = 0
+    for submission in list(store.iter_submissions()):
+        if not submission.get('image_path') or submission.get('image_policy') == photo_policy.tag:
+            continue
+        image_path = photo_source(submission)
+        if not image_path.exists():
+            continue
+        thumbnail_path = thumbnail_target(submission, image_path)
+        thumbnail_path.parent.mkdir(parents=True, exist_ok=True)
+        thumbnail_rel = thumbnail_path.relative_to(BASE_DIR).as_posix()
+        if submission.get('thumbnail_path') != thumbnail_rel:
+            submission = dict(submission, thumbnail_path=thumbnail_rel, thumbnail_status='pending')
+            store.save_submission(submission)
+        queue_photo_job(submission, image_path, thumbnail_path, wait=True)
+        queued += 1
+    thumbnail_queue.wait()
+    click.echo(f"Processed photos of {queued} submission(s) as {photo_policy.tag}; "
+               f"images {before:.1f} MB -> {images_mb():.1f} MB")
+
+@app.cli.command('gc-images')
+def gc_images():
+    """Delete stored photos and thumbnails no submission refers to any more"""
+    photos_removed = sum(release_file(path.relative_to(BASE_DIR).as_posix()) for path in list(photos.blobs()))
+    # Thumbnails of reports deleted while their photo job ran, with their derivatives
+    thumbnails_removed = 0
+    for thumbnail_path in {THUMBNAILS_DIR / blob_name(blob_digest(path), '.jpg') for path in iter_blobs(THUMBNAILS_DIR)}:
+        derived = [Path(path).relative_to(BASE_DIR).as_posix()
+                   for name, (path, _, _) in derivative_paths(thumbnail_path).items() if name != 'thumb']
+        thumbnails_removed += release_file(thumbnail_path.relative_to(BASE_DIR).as_posix(), derived)
+    stale = photos.sweep_incoming()
+    click.echo(f"Deleted {photos_removed} unreferenced photo(s), {thumbnails_removed} thumbnail set(s) "
+               f"and {stale} abandoned upload(s)")
+
 if __name__ == '__main__':
     socketio.run(app, host=HOST, port=int(PORT), debug=True, allow_unsafe_werkzeug=True)
     
\ No newline at end of file
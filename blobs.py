@@ -0,0 +1,248 @@
+"""
+Content-addressed photo storage.
+
+UploadRequest has Werkzeug write each uploaded file straight into a
+StagedUpload under <root>/.incoming, hashing it on the way, instead of into
+a spooled temp file that would then be copied. commit() renames the staged
+file to <root>/<aa>/<sha256><ext>, or drops it when that content is
+already stored, so identical photos are kept once and a blob's URL never
+changes content and can be cached forever.
+
+A blob is shared by every submission with the same photo. BlobRefs counts
+the submissions pointing at each one (as a store listener, so it follows
+other workers' writes too) and release() removes a blob once none do. The
+submission referencing a blob is saved inside committed(), under the same
+per-digest lock release() takes, so a release never misses a new reference.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from flask import Request
+
+try:
+    import fcntl
+except ImportError:   # Windows: the per-process lock still applies
+    fcntl = None
+
+# <aa>/<sha256>[_<derivative>][.ext]
+BLOB_NAME = re.compile(r'^([0-9a-f]{2})/([0-9a-f]{64})(_\w+)?(\.\w+)?$')
+LOCK_STRIPES = 64
+
+
+def blob_name(digest, ext=''):
+    """Path of a digest relative to a blob directory"""
+    return f'{digest[:2]}/{digest}{ext}'
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def blob_digest(path, root=None):
+    """Digest a path (under root, if given) is stored as, or None if it is not a blob"""
+    path = Path(path)
+    try:
+        name = path.relative_to(root).as_posix() if root else f'{path.parent.name}/{path.name}'
+    except ValueError:
+        return None
+    match = BLOB_NAME.match(name)
+    return match.group(2) if match and match.group(1) == match.group(2)[:2] else None
+
+def iter_blobs(root):
+    """Every blob file under root"""
+    root = Path(root)
+    if not root.exists():
+        return
+    for shard in root.iterdir():
+        if len(shard.name) == 2 and shard.is_dir():
+            for path in shard.iterdir():
+                if blob_digest(path, root):
+                    yield path
+
+
+class StagedUpload:
+    """Writable, readable upload file that hashes what is written to it"""
+
+    def __init__(self, directory):
+        directory.mkdir(parents=True, exist_ok=True)
+        self.path = directory / f'{os.getpid()}.{threading.get_ident()}.{time.time_ns()}'
+        # Unbuffered, so the file on disk is complete as soon as the parser is done
+        self._file = open(self.path, 'w+b', buffering=0)
+        self._digest = hashlib.sha256()
+        self.size = 0
+        self.committed = False
+
+    def write(self, data):
+        self._digest.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    @property
+    def sha256(self):
+        return self._digest.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)   # read, readline, seek, tell, ...
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def discard(self):
+        self._file.close()
+        if not self.committed:
+            self.path.unlink(missing_ok=True)
+
+    close = discard   # Werkzeug closes request files at the end of the request
+
+    def __del__(self):
+        try:
+            self.discard()
+        except Exception:
+            pass
+
+
+class BlobStore:
+    """<root>/<aa>/<sha256><ext> files, committed from StagedUploads"""
+
+    def __init__(self, root, locks_dir):
+        self.root = Path(root)
+        self.incoming = self.root / '.incoming'
+        self.locks_dir = Path(locks_dir)
+        self.locks_dir.mkdir(parents=True, exist_ok=True)
+        self._stripes = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    def stage(self):
+        return StagedUpload(self.incoming)
+
+    def path_for(self, digest, ext=''):
+        return self.root / blob_name(digest, ext.lower())
+
+    def digest_of(self, path):
+        return blob_digest(path, self.root)
+
+    @contextmanager
+    def lock(self, digest):
+        """Exclusive lock on one digest, across threads and worker processes"""
+        stripe = zlib.crc32(digest.encode('ascii')) % LOCK_STRIPES
+        with self._stripes[stripe]:
+            if fcntl is None:
+                yield
+                return
+            with open(self.locks_dir / f'blob-{stripe}.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def committed(self, staged, ext=''):
+        """Store a StagedUpload, or a finished file in the staging directory, under its digest.
+
+        Yields the blob path with the digest still locked: save the
+        submission that refers to it inside the block.
+        """
+        if isinstance(staged, StagedUpload):
+            staged._file.close()
+            path, digest = staged.path, staged.sha256
+            staged.committed = True
+        else:
+            path, digest = Path(staged), file_digest(staged)
+        target = self.path_for(digest, ext)
+        with self.lock(digest):
+            if target.exists():
+                path.unlink(missing_ok=True)   # already stored
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.rename(path, target)
+            yield target
+
+    def release(self, path, referenced, derived=()):
+        """Delete a blob, and files derived from it, unless referenced().
+
+        path may be under another root with the same layout (thumbnails
+        keyed by their photo's digest); it is locked by its digest either way.
+
+        Returns False if the blob is still referenced.
+        """
+        with self.lock(blob_digest(path)):
+            if referenced():
+                return False
+            for extra in derived:
+                Path(extra).unlink(missing_ok=True)
+            Path(path).unlink(missing_ok=True)
+            return True
+
+    def blobs(self):
+        return iter_blobs(self.root)
+
+    def sweep_incoming(self, max_age=86400):
+        """Remove staged uploads left behind by crashed workers; returns how many"""
+        removed = 0
+        cutoff = time.time() - max_age
+        if self.incoming.exists():
+            for path in self.incoming.iterdir():
+                try:
+                    if path.stat().st_mtime < cutoff:
+                        path.unlink()
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+
+class BlobRefs:
+    """How many references submissions hold to each path in fields; a store listener.
+    include(submission), if given, limits the count to the submissions it accepts."""
+
+    def __init__(self, fields=('image_path',), include=None):
+        self.fields = fields
+        self.include = include
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def _paths(self, submission):
+        if not submission or (self.include and not self.include(submission)):
+            return []
+        return [submission[field] for field in self.fields if submission.get(field)]
+
+    def reset(self, submissions):
+        counts = Counter(path for s in submissions for path in self._paths(s))
+        with self._lock:
+            self._counts = counts
+
+    def apply(self, old, new):
+        with self._lock:
+            for path in self._paths(old):
+                self._counts[path] -= 1
+                if self._counts[path] <= 0:
+                    del self._counts[path]
+            for path in self._paths(new):
+                self._counts[path] += 1
+
+    def count(self, value):
+        with self._lock:
+            return self._counts.get(value, 0)
+
+
+class UploadRequest(Request):
+    """Request whose uploaded files stream into a BlobStore's staging area.
+
+    Set blob_store on the subclass; requests without one fall back to
+    Werkzeug's spooled temp files.
+    """
+    blob_store = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.blob_store is None:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return self.blob_store.stage()
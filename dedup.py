@@ -0,0 +1,128 @@
+"""
+Spotting repeat reports at ingest.
+
+During heavy rain one flooded underpass is reported by many people within
+minutes, and retrying phones upload the same photo again. DuplicateIndex
+keeps the recent geotagged reports that have a photo in a GridIndex; find()
+returns the first report within radius_m metres and window seconds whose
+photo is byte-identical (same photo_sha256) or looks the same (photo_dhash
+within max_distance bits). Flat or near-uniform photos (a dark frame, a
+sheet of water or sky) have a dHash of almost all 0 or all 1 bits, so they
+look the same as each other; those only match byte-identical copies.
+"""
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+from geo import GridIndex, METRES_PER_DEG, distance_m, radius_bbox
+from media import hash_distance
+
+SAME_PHOTO = 'same_photo'
+SIMILAR_PHOTO = 'similar_photo'
+MIN_HASH_BITS = 8   # a dHash with fewer set (or clear) bits is too featureless to compare
+
+
+def parse_received_at(value):
+    try:
+        return datetime.fromisoformat(value).replace(tzinfo=None)
+    except (TypeError, ValueError):
+        return None
+
+
+def distinctive(dhash):
+    """Whether a perceptual hash has enough detail to match other photos by"""
+    if not dhash:
+        return False
+    bits = bin(int(dhash, 16)).count('1')
+    return MIN_HASH_BITS <= bits <= 64 - MIN_HASH_BITS
+
+
+class DuplicateIndex:
+    """Recent photo reports by location, kept current as a store listener.
+
+    Only reports that are not duplicates themselves are indexed, so every
+    duplicate links to the first report of its group. include(submission)
+    can exclude more, e.g. reports an admin marked invalid.
+    """
+
+    def __init__(self, radius_m=50, window=900, max_distance=6, include=None):
+        self.radius_m = radius_m
+        self.window = timedelta(seconds=window)
+        self.max_distance = max_distance
+        self.include = include
+        self.grid = GridIndex(cell_deg=max(radius_m / METRES_PER_DEG, 1e-4))
+        self._reports = {}     # id -> (lat, lon, received_at, sha256, dhash)
+        self._by_time = deque()   # (received_at, id), roughly oldest first
+        self._lock = threading.Lock()
+
+    def _entry(self, submission):
+        if (not submission or submission.get('duplicate_of')
+                or (self.include and not self.include(submission))):
+            return None
+        gps = submission.get('gps') or {}
+        when = parse_received_at(submission.get('received_at'))
+        if not (gps.get('lat') and gps.get('lon') and when) or when < datetime.now() - self.window:
+            return None
+        if not (submission.get('photo_sha256') or submission.get('photo_dhash')):
+            return None
+        return (gps['lat'], gps['lon'], when, submission.get('photo_sha256'), submission.get('photo_dhash'))
+
+    # Store listener protocol
+    def reset(self, submissions):
+        entries = [(s['id'], e) for s, e in ((s, self._entry(s)) for s in submissions) if e]
+        with self._lock:
+            self.grid = GridIndex(cell_deg=self.grid.cell_deg)
+            self._reports = {}
+            self._by_time = deque()
+            for submission_id, entry in sorted(entries, key=lambda item: item[1][2]):
+                self._add(submission_id, entry)
+
+    def apply(self, old, new):
+        submission_id = (new or old)['id']
+        entry = self._entry(new)
+        with self._lock:
+            if submission_id in self._reports:
+                del self._reports[submission_id]
+                self.grid.remove(submission_id)
+            if entry:
+                self._add(submission_id, entry)
+
+    def _add(self, submission_id, entry):
+        self._reports[submission_id] = entry
+        self.grid.add(submission_id, entry[0], entry[1])
+        self._by_time.append((entry[2], submission_id))
+
+    def _prune(self):
+        cutoff = datetime.now() - self.window
+        while self._by_time and self._by_time[0][0] < cutoff:
+            _, submission_id = self._by_time.popleft()
+            entry = self._reports.get(submission_id)
+            if entry and entry[2] < cutoff:
+                del self._reports[submission_id]
+                self.grid.remove(submission_id)
+
+    def find(self, lat, lon, received_at, sha256=None, dhash=None):
+        """(id, SAME_PHOTO or SIMILAR_PHOTO) of the earliest matching report, or None"""
+        when = parse_received_at(received_at)
+        if when is None or not (sha256 or dhash):
+            return None
+        if not distinctive(dhash):
+            dhash = None
+        with self._lock:
+            self._prune()
+            matches = []
+            for submission_id in self.grid.query(radius_bbox(lat, lon, self.radius_m)):
+                other_lat, other_lon, other_when, other_sha256, other_dhash = self._reports[submission_id]
+                if abs(other_when - when) > self.window:
+                    continue
+                if distance_m(lat, lon, other_lat, other_lon) > self.radius_m:
+                    continue
+                if sha256 and sha256 == other_sha256:
+                    matches.append((other_when, submission_id, SAME_PHOTO))
+                elif (dhash and distinctive(other_dhash)
+                      and hash_distance(dhash, other_dhash) <= self.max_distance):
+                    matches.append((other_when, submission_id, SIMILAR_PHOTO))
+        if not matches:
+            return None
+        _, submission_id, kind = min(matches)
+        return submission_id, kind
@@ -0,0 +1,102 @@
+"""
+Responses for stored photos and thumbnails.
+
+send_media() answers conditional and Range requests itself, so a photo is
+read only when its bytes are actually needed. The body is handed to the
+server as wsgi.file_wrapper where the server provides one; gunicorn's sync
+and gthread workers then send it with sendfile(2) and Python never touches
+the bytes. With offload set, the response carries only headers and a front
+proxy sends the file: 'x-accel' (nginx X-Accel-Redirect, which needs an
+internal location for accel_prefix) or 'x-sendfile' (Apache mod_xsendfile,
+lighttpd). That is the way to keep gevent workers, which have no sendfile
+path, free while reviewers page through hundreds of photos.
+"""
+import mimetypes
+import os
+import stat
+from datetime import datetime, timezone
+
+from flask import Response, abort, request
+from werkzeug.security import safe_join
+from werkzeug.wsgi import wrap_file
+
+CHUNK_SIZE = 256 * 1024   # per read when the server has no sendfile
+OFFLOAD_MODES = ('off', 'x-accel', 'x-sendfile')
+
+
+def read_range(path, start, length):
+    """Yield length bytes of path from start"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def send_media(directory, filename, cache_control, etag=None, offload='off', accel_prefix=None):
+    """Serve directory/filename with a strong ETag, 304s and byte ranges.
+
+    etag defaults to the file's mtime and size, which is strong for files
+    that are only ever replaced whole. accel_prefix is the internal URL
+    under which the proxy finds directory, for offload='x-accel'.
+    """
+    path = safe_join(str(directory), filename)
+    try:
+        st = os.stat(path) if path else None
+    except OSError:
+        st = None
+    if st is None or not stat.S_ISREG(st.st_mode):
+        abort(404)
+    size = st.st_size
+    etag = etag or f'{st.st_mtime_ns:x}-{size:x}'
+    modified = datetime.fromtimestamp(int(st.st_mtime), timezone.utc)
+
+    response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    response.set_etag(etag)
+    response.last_modified = modified
+    response.headers['Cache-Control'] = cache_control
+    response.headers['Accept-Ranges'] = 'bytes'
+
+    if request.if_none_match.contains(etag) or (
+            not request.if_none_match and request.if_modified_since and modified <= request.if_modified_since):
+        response.status_code = 304
+        return response
+
+    if offload == 'x-accel':
+        # nginx takes over, Range requests included
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + filename
+        return response
+    if offload == 'x-sendfile':
+        response.headers['X-Sendfile'] = os.path.abspath(path)
+        return response
+
+    start, stop = 0, size
+    byte_range = request.range
+    # Multiple ranges get the whole file, and so does a stale If-Range (the
+    # client's partial copy is outdated)
+    if_range = request.if_range
+    if (byte_range and len(byte_range.ranges) == 1
+            and (if_range.etag == etag or (if_range.date and modified <= if_range.date)
+                 or (if_range.etag is None and if_range.date is None))):
+        span = byte_range.range_for_length(size)
+        if span is None:
+            response.status_code = 416
+            response.headers['Content-Range'] = f'bytes */{size}'
+            return response
+        start, stop = span
+        response.status_code = 206
+        response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+
+    if stop == size:
+        # Everything from start to the end: the server may sendfile from the file's offset
+        f = open(path, 'rb')
+        f.seek(start)
+        response.response = wrap_file(request.environ, f, CHUNK_SIZE)
+    else:
+        response.response = read_range(path, start, stop - start)
+    response.direct_passthrough = True
+    response.content_length = stop - start
+    return response
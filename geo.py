@@ -0,0 +1,306 @@
+"""
+Spatial helpers for the flood map: bounding boxes and a uniform grid index.
+"""
+import math
+import threading
+
+
+def parse_bbox(value):
+    """Parse 'minLon,minLat,maxLon,maxLat' into a tuple of floats.
+
+    Raises ValueError for malformed or inverted boxes.
+    """
+    parts = [p.strip() for p in (value or '').split(',')]
+    if len(parts) != 4:
+        raise ValueError('bbox must be minLon,minLat,maxLon,maxLat')
+    min_lon, min_lat, max_lon, max_lat = (float(p) for p in parts)
+    if not all(math.isfinite(v) for v in (min_lon, min_lat, max_lon, max_lat)):
+        raise ValueError('bbox values must be finite numbers')
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError('bbox min values must not exceed max values')
+    return min_lon, min_lat, max_lon, max_lat
+
+def in_bbox(lat, lon, bbox):
+    min_lon, min_lat, max_lon, max_lat = bbox
+    return min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
+
+EARTH_RADIUS_M = 6371000.0
+METRES_PER_DEG = math.pi * EARTH_RADIUS_M / 180   # along a meridian
+
+def distance_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres (haversine)"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+def radius_bbox(lat, lon, metres):
+    """bbox enclosing the circle of the given radius around a point"""
+    dlat = metres / METRES_PER_DEG
+    dlon = metres / (METRES_PER_DEG * max(math.cos(math.radians(lat)), 0.01))
+    return lon - dlon, lat - dlat, lon + dlon, lat + dlat
+
+
+class GridIndex:
+    """Buckets point ids into fixed-size lat/lon cells.
+
+    A bbox query only visits the cells it overlaps, so the cost follows the
+    size of the viewport rather than the number of indexed points. Callers
+    still need an exact in_bbox() check on the returned candidates.
+    """
+
+    def __init__(self, cell_deg=0.05):
+        self.cell_deg = cell_deg
+        self._cells = {}    # (row, col) -> set of ids
+        self._points = {}   # id -> (row, col)
+        self._lock = threading.Lock()
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    def add(self, point_id, lat, lon):
+        cell = self._cell(lat, lon)
+        with self._lock:
+            old = self._points.get(point_id)
+            if old == cell:
+                return
+            if old is not None:
+                self._discard(point_id, old)
+            self._cells.setdefault(cell, set()).add(point_id)
+            self._points[point_id] = cell
+
+    def remove(self, point_id):
+        with self._lock:
+            cell = self._points.pop(point_id, None)
+            if cell is not None:
+                self._discard(point_id, cell)
+
+    def _discard(self, point_id, cell):
+        ids = self._cells.get(cell)
+        if ids is not None:
+            ids.discard(point_id)
+            if not ids:
+                del self._cells[cell]
+
+    def query(self, bbox):
+        """Return the ids in every cell overlapping bbox"""
+        min_lon, min_lat, max_lon, max_lat = bbox
+        row0, col0 = self._cell(min_lat, min_lon)
+        row1, col1 = self._cell(max_lat, max_lon)
+        result = []
+        with self._lock:
+            # Walk whichever is smaller: the cells in the box or the occupied cells
+            if (row1 - row0 + 1) * (col1 - col0 + 1) <= len(self._cells):
+                for row in range(row0, row1 + 1):
+                    for col in range(col0, col1 + 1):
+                        result.extend(self._cells.get((row, col), ()))
+            else:
+                for (row, col), ids in self._cells.items():
+                    if row0 <= row <= row1 and col0 <= col <= col1:
+                        result.extend(ids)
+        return result
+
+
+# =============================================================================
+# GEOHASH - cell names used as live-update rooms
+# =============================================================================
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+def _geohash_bits(precision):
+    """(lon_bits, lat_bits) of a geohash; longitude gets the extra bit"""
+    bits = 5 * precision
+    return (bits + 1) // 2, bits // 2
+
+def geohash(lat, lon, precision):
+    lon_bits, lat_bits = _geohash_bits(precision)
+    x = min(int((lon + 180.0) / 360.0 * (1 << lon_bits)), (1 << lon_bits) - 1)
+    y = min(int((lat + 90.0) / 180.0 * (1 << lat_bits)), (1 << lat_bits) - 1)
+    return _geohash_from_xy(max(x, 0), max(y, 0), precision)
+
+def _geohash_from_xy(x, y, precision):
+    lon_bits, lat_bits = _geohash_bits(precision)
+    # Interleave starting with longitude: lon, lat, lon, lat, ...
+    value = 0
+    for i in range(lon_bits + lat_bits):
+        if i % 2 == 0:
+            bit = (x >> (lon_bits - 1 - i // 2)) & 1
+        else:
+            bit = (y >> (lat_bits - 1 - i // 2)) & 1
+        value = (value << 1) | bit
+    return ''.join(GEOHASH_BASE32[(value >> (5 * (precision - 1 - i))) & 31] for i in range(precision))
+
+def geohash_cover(bbox, precision, limit=None):
+    """Geohash cells overlapping bbox, or None when there would be more than limit"""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    lon_bits, lat_bits = _geohash_bits(precision)
+    def span(lo, hi, offset, extent, bits):
+        n = 1 << bits
+        a = int((max(lo, -offset) + offset) / extent * n)
+        b = int((min(hi, offset) + offset) / extent * n)
+        return min(a, n - 1), min(b, n - 1)
+    x0, x1 = span(min_lon, max_lon, 180.0, 360.0, lon_bits)
+    y0, y1 = span(min_lat, max_lat, 90.0, 180.0, lat_bits)
+    if limit is not None and (x1 - x0 + 1) * (y1 - y0 + 1) > limit:
+        return None
+    return [_geohash_from_xy(x, y, precision) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+# =============================================================================
+# CLUSTERS - per-zoom aggregates for the flood map
+# =============================================================================
+# Cluster cells are Web Mercator tiles CLUSTER_CELL_BITS zoom levels below the
+# map zoom, i.e. a 4x4 grid of ~64px cells inside each 256px map tile. The
+# cells form a quadtree, so adding or removing a report touches one cell per
+# level and never rescans the other reports.
+CLUSTER_CELL_BITS = 2
+CLUSTER_MIN_LEVEL = CLUSTER_CELL_BITS       # map zoom 0
+CLUSTER_MAX_LEVEL = 20                      # leaf cells, ~40m at the equator
+MAX_MERCATOR_LAT = 85.05112878
+
+def tile_xy(lat, lon, level):
+    """Web Mercator tile coordinates of a point at the given zoom level"""
+    lat = max(-MAX_MERCATOR_LAT, min(MAX_MERCATOR_LAT, lat))
+    n = 1 << level
+    x = int((lon + 180.0) / 360.0 * n)
+    rad = math.radians(lat)
+    y = int((1.0 - math.log(math.tan(rad) + 1.0 / math.cos(rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def cluster_level(zoom):
+    return max(CLUSTER_MIN_LEVEL, min(CLUSTER_MAX_LEVEL, int(zoom) + CLUSTER_CELL_BITS))
+
+
+class _ClusterCell:
+    __slots__ = ('count', 'depth_sum', 'lat_sum', 'lon_sum', 'max_depth', 'latest')
+
+    def __init__(self):
+        self.count = 0
+        self.depth_sum = 0
+        self.lat_sum = 0.0
+        self.lon_sum = 0.0
+        self.max_depth = 0
+        self.latest = ''
+
+
+class ClusterIndex:
+    """Incrementally maintained report clusters for every map zoom level.
+
+    Each cell keeps count, depth and position sums plus the max depth and the
+    latest received_at of the reports below it. Subscribe it to a
+    SubmissionStore so every saved or deleted submission updates it in place.
+    """
+
+    def __init__(self, include=None):
+        # include(submission) -> bool decides which reports are clustered
+        self.include = include
+        self._levels = {level: {} for level in range(CLUSTER_MIN_LEVEL, CLUSTER_MAX_LEVEL + 1)}
+        self._members = {}   # leaf (x, y) -> {id: (lat, lon, depth, received_at)}
+        self._points = {}    # id -> leaf (x, y)
+        self._lock = threading.Lock()
+
+    def _point(self, submission):
+        if not submission or (self.include and not self.include(submission)):
+            return None
+        gps = submission.get('gps') or {}
+        if not (gps.get('lat') and gps.get('lon')):
+            return None
+        return (gps['lat'], gps['lon'], submission.get('flood_depth_cm') or 0,
+                submission.get('received_at') or '')
+
+    # Store listener protocol
+    def reset(self, submissions):
+        submissions = list(submissions)
+        with self._lock:
+            self._levels = {level: {} for level in self._levels}
+            self._members = {}
+            self._points = {}
+            for submission in submissions:
+                point = self._point(submission)
+                if point:
+                    self._add(submission['id'], point)
+
+    def apply(self, old, new):
+        submission_id = (new or old)['id']
+        point = self._point(new)
+        with self._lock:
+            if submission_id in self._points:
+                self._remove(submission_id)
+            if point:
+                self._add(submission_id, point)
+
+    def _add(self, submission_id, point):
+        lat, lon, depth, received_at = point
+        leaf = tile_xy(lat, lon, CLUSTER_MAX_LEVEL)
+        self._members.setdefault(leaf, {})[submission_id] = point
+        self._points[submission_id] = leaf
+        for level in range(CLUSTER_MAX_LEVEL, CLUSTER_MIN_LEVEL - 1, -1):
+            shift = CLUSTER_MAX_LEVEL - level
+            key = (leaf[0] >> shift, leaf[1] >> shift)
+            cell = self._levels[level].get(key)
+            if cell is None:
+                cell = self._levels[level][key] = _ClusterCell()
+            cell.count += 1
+            cell.depth_sum += depth
+            cell.lat_sum += lat
+            cell.lon_sum += lon
+            cell.max_depth = max(cell.max_depth, depth)
+            cell.latest = max(cell.latest, received_at)
+
+    def _remove(self, submission_id):
+        leaf = self._points.pop(submission_id)
+        members = self._members[leaf]
+        lat, lon, depth, _ = members.pop(submission_id)
+        if not members:
+            del self._members[leaf]
+        for level in range(CLUSTER_MAX_LEVEL, CLUSTER_MIN_LEVEL - 1, -1):
+            shift = CLUSTER_MAX_LEVEL - level
+            key = (leaf[0] >> shift, leaf[1] >> shift)
+            cells = self._levels[level]
+            cell = cells[key]
+            cell.count -= 1
+            if cell.count == 0:
+                del cells[key]
+                continue
+            cell.depth_sum -= depth
+            cell.lat_sum -= lat
+            cell.lon_sum -= lon
+            # Max and latest cannot be decremented; recompute from the leaf
+            # members or from the (at most four) child cells.
+            if level == CLUSTER_MAX_LEVEL:
+                children = [(p[2], p[3]) for p in members.values()]
+            else:
+                below = self._levels[level + 1]
+                x, y = key[0] << 1, key[1] << 1
+                children = [(c.max_depth, c.latest) for c in
+                            (below.get((x + dx, y + dy)) for dx in (0, 1) for dy in (0, 1)) if c]
+            cell.max_depth = max(d for d, _ in children)
+            cell.latest = max(t for _, t in children)
+
+    def query(self, zoom, bbox=None):
+        """Clusters for a map zoom level, optionally limited to a bbox"""
+        level = cluster_level(zoom)
+        with self._lock:
+            cells = self._levels[level]
+            if bbox:
+                min_lon, min_lat, max_lon, max_lat = bbox
+                x0, y0 = tile_xy(max_lat, min_lon, level)
+                x1, y1 = tile_xy(min_lat, max_lon, level)
+                if (x1 - x0 + 1) * (y1 - y0 + 1) <= len(cells):
+                    keys = [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1) if (x, y) in cells]
+                else:
+                    keys = [k for k in cells if x0 <= k[0] <= x1 and y0 <= k[1] <= y1]
+            else:
+                keys = list(cells)
+            clusters = []
+            for x, y in keys:
+                cell = cells[(x, y)]
+                clusters.append({
+                    'key': f'{level}/{x}/{y}',
+                    'lat': round(cell.lat_sum / cell.count, 6),
+                    'lon': round(cell.lon_sum / cell.count, 6),
+                    'count': cell.count,
+                    'max_depth_cm': cell.max_depth,
+                    'mean_depth_cm': round(cell.depth_sum / cell.count, 1),
+                    'latest_received_at': cell.latest,
+                })
+            return clusters
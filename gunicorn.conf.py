@@ -1,5 +1,6 @@
 import os
 import signal
+import sys
 
 # Server socket
 bind = "0.0.0.0:8005"
@@ -8,6 +9,8 @@ backlog = 2048
 # Worker processes
 # Use a conservative default to avoid OOM on constrained HPC nodes
 # Formula: (2 x num_cores) + 1 is standard, but we'll cap it or use env var
+# More than one worker needs SOCKETIO_MESSAGE_QUEUE (e.g. 'unix') so every
+# worker's map clients receive every emit; see realtime.py
 workers = int(os.getenv('WORKERS', 1))
 worker_class = 'geventwebsocket.gunicorn.workers.GeventWebSocketWorker'
 threads = int(os.getenv('THREADS', 1))  # Use 1 thread per worker to avoid threading issues
@@ -38,6 +41,10 @@ daemon = False
 def on_starting(server):
     """Called just before the master process is initialized."""
     print(f"Gunicorn master starting with PID {os.getpid()}")
+    # The preloaded app's metrics directory may hold a previous run's workers
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        app_module.metrics.clear()
 
 def on_reload(server):
     """Called to recycle workers during a reload via SIGHUP."""
@@ -73,6 +80,10 @@ def worker_abort(worker):
 def worker_exit(server, worker):
     """Called just after a worker has been exited."""
     print(f"Worker {worker.pid} exited")
+    # Runs in the worker: write its final counts before /metrics folds them in
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        app_module.metrics.flush()
 
 def on_exit(server):
     """Called just before the master process exits."""
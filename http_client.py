@@ -0,0 +1,179 @@
+"""
+Shared outbound HTTP client.
+
+Every upstream (Turnstile, X, OpenRouter, the AI API) gets its own pooled
+requests.Session, so connections are kept alive between calls, plus a default
+timeout, urllib3 retries with backoff, a circuit breaker and latency stats.
+"""
+import bisect
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)   # seconds
+RECENT_SAMPLES = 256   # latencies kept for the p50/p95 in snapshot()
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling an upstream whose circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures.
+
+    While open every call is rejected; after reset_after seconds a single
+    trial call is let through (half-open) and its outcome closes or re-opens
+    the circuit.
+    """
+
+    def __init__(self, failure_threshold=5, reset_after=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self.opened = 0   # times the circuit has opened
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if self._trial or time.monotonic() - self._opened_at >= self.reset_after:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._trial and time.monotonic() - self._opened_at >= self.reset_after:
+                self._trial = True
+                return True
+            return False
+
+    def record(self, ok):
+        with self._lock:
+            if ok:
+                self._failures = 0
+                self._opened_at = None
+                self._trial = False
+                return
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                if not self._trial:
+                    self.opened += 1
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+
+class UpstreamStats:
+    """Call outcomes and a latency histogram for one upstream"""
+
+    def __init__(self):
+        self.outcomes = {'ok': 0, 'http_error': 0, 'error': 0, 'rejected': 0}
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self._recent = deque(maxlen=RECENT_SAMPLES)
+        self._lock = threading.Lock()
+
+    def record(self, outcome, seconds=None):
+        with self._lock:
+            self.outcomes[outcome] += 1
+            if seconds is not None:
+                self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+                self.latency_sum += seconds
+                self.latency_count += 1
+                self._recent.append(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            recent = sorted(self._recent)
+            snap = {
+                'outcomes': dict(self.outcomes),
+                'latency_buckets': {('+Inf' if i == len(LATENCY_BUCKETS) else str(LATENCY_BUCKETS[i])): n
+                                    for i, n in enumerate(self.buckets)},
+                'latency_sum': round(self.latency_sum, 6),
+                'latency_count': self.latency_count,
+            }
+        if recent:
+            snap['p50_ms'] = round(recent[len(recent) // 2] * 1000, 1)
+            snap['p95_ms'] = round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 1)
+        return snap
+
+
+class Upstream:
+    """One remote service: base URL, pooled session, timeout, retries and breaker.
+
+    timeout is a (connect, read) tuple in seconds. Connection failures are
+    retried for every method (the request never reached the server); 502/503/
+    504 responses and read errors only for idempotent methods, so a POST that
+    may already have been processed is never sent twice.
+    """
+
+    def __init__(self, name, base_url, timeout=(3.05, 10), retries=2, backoff=0.5,
+                 failure_threshold=5, reset_after=30.0, pool_size=10):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(failure_threshold, reset_after)
+        self.stats = UpstreamStats()
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                      backoff_factor=backoff, status_forcelist=(502, 503, 504),
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method, path='', **kwargs):
+        if not self.breaker.allow():
+            self.stats.record('rejected')
+            raise CircuitOpenError(f'{self.name} is unavailable (circuit open)')
+        kwargs.setdefault('timeout', self.timeout)
+        start = time.monotonic()
+        try:
+            response = self.session.request(method, self.base_url + path, **kwargs)
+        except requests.RequestException:
+            self.stats.record('error', time.monotonic() - start)
+            self.breaker.record(False)
+            raise
+        ok = response.status_code < 500
+        self.stats.record('ok' if ok else 'http_error', time.monotonic() - start)
+        self.breaker.record(ok)
+        return response
+
+    def snapshot(self):
+        snap = self.stats.snapshot()
+        snap.update({'base_url': self.base_url, 'circuit': self.breaker.state,
+                     'circuit_opened': self.breaker.opened})
+        return snap
+
+
+class HttpClient:
+    """Registry of upstreams shared by every outbound call in the app"""
+
+    def __init__(self):
+        self.upstreams = {}
+
+    def register(self, name, base_url, **options):
+        self.upstreams[name] = Upstream(name, base_url, **options)
+        return self.upstreams[name]
+
+    def request(self, name, method, path='', **kwargs):
+        return self.upstreams[name].request(method, path, **kwargs)
+
+    def get(self, name, path='', **kwargs):
+        return self.request(name, 'GET', path, **kwargs)
+
+    def post(self, name, path='', **kwargs):
+        return self.request(name, 'POST', path, **kwargs)
+
+    def snapshot(self):
+        return {name: upstream.snapshot() for name, upstream in self.upstreams.items()}
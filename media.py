@@ -0,0 +1,276 @@
+"""
+Photo processing for submissions: thumbnail generation, re-encoding of the
+stored photo under an ImagePolicy, and the background queue that keeps both
+off the /api/submit request path.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+THUMBNAIL_SIZE = (300, 300)   # admin grid
+POPUP_SIZE = (160, 160)       # map marker popup
+
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 85, 'optimize': True},
+    'WEBP': {'quality': 80, 'method': 4},
+}
+
+
+class ImagePolicy:
+    """How stored photos are re-encoded: format 'jpeg' (progressive), 'webp' or 'original'.
+
+    Re-encoded photos are scaled down to max_dim on their longest side and
+    carry no EXIF or XMP metadata (GPS position, device, owner); the
+    orientation is applied to the pixels first.
+    """
+    FORMATS = {'jpeg': ('JPEG', '.jpg'), 'webp': ('WEBP', '.webp')}
+
+    def __init__(self, format='jpeg', max_dim=2048, quality=82):
+        if format != 'original' and format not in self.FORMATS:
+            raise ValueError(f"image format must be original, {' or '.join(self.FORMATS)}")
+        self.format = format
+        self.max_dim = max_dim
+        self.quality = quality
+
+    @property
+    def active(self):
+        return self.format != 'original'
+
+    @property
+    def ext(self):
+        return self.FORMATS[self.format][1]
+
+    @property
+    def tag(self):
+        """Recorded on re-encoded submissions, so a policy is applied once"""
+        return f'{self.format}-{self.max_dim}-q{self.quality}'
+
+    def target(self, path):
+        """create_derivatives() target writing the re-encoded photo to path"""
+        fmt = self.FORMATS[self.format][0]
+        options = ({'quality': self.quality, 'optimize': True, 'progressive': True} if fmt == 'JPEG'
+                   else {'quality': self.quality, 'method': 4})
+        return (str(path), (self.max_dim, self.max_dim), fmt, dict(options, keep_icc=True))
+
+def derivative_paths(thumbnail_path):
+    """Every derivative written for a thumbnail path, as name -> (path, size, format)"""
+    stem = Path(thumbnail_path).with_suffix('')
+    return {
+        'thumb': (str(thumbnail_path), THUMBNAIL_SIZE, 'JPEG'),
+        'popup': (f'{stem}_popup.jpg', POPUP_SIZE, 'JPEG'),
+        'webp': (f'{stem}.webp', THUMBNAIL_SIZE, 'WEBP'),
+    }
+
+def open_oriented(image_path, max_size=None):
+    """Open an image upright, decoding JPEGs at reduced scale when possible.
+
+    With max_size, JPEGs are decoded via Image.draft() at the smallest 1/2,
+    1/4 or 1/8 scale that still covers max_size, so a 12 MP phone photo is
+    never fully decoded just to be shrunk to a thumbnail.
+    """
+    with Image.open(image_path) as src:
+        if max_size and src.format == 'JPEG':
+            src.draft('RGB', max_size)
+        img = ImageOps.exif_transpose(src)
+    # Convert to RGB if necessary (for PNG with transparency)
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    return img
+
+def create_derivatives(image_path, targets):
+    """Write several downscaled copies of an image from a single decode.
+
+    targets is an iterable of (path, (width, height), format[, save options]).
+    Each size is produced from the previous, larger one, so only the first
+    resize touches the decoded image. Metadata is only written for targets
+    whose options set keep_icc, and then only the colour profile.
+    """
+    targets = sorted(targets, key=lambda t: t[1][0] * t[1][1], reverse=True)
+    largest = max(max(t[1]) for t in targets)
+    img = open_oriented(image_path, (largest, largest))
+    icc_profile = img.info.get('icc_profile')
+    try:
+        for path, size, fmt, *options in targets:
+            options = dict(options[0]) if options else SAVE_OPTIONS.get(fmt, {})
+            if options.pop('keep_icc', False) and icc_profile:
+                options['icc_profile'] = icc_profile
+            if img.width > size[0] or img.height > size[1]:
+                img.thumbnail(size, Image.Resampling.LANCZOS)
+            # Written aside and renamed, so a thumbnail shared by several reports is never seen half-written
+            tmp = Path(path).with_name(f'.{Path(path).name}.{os.getpid()}.{threading.get_ident()}.tmp')
+            try:
+                img.save(tmp, fmt, **options)
+                os.replace(tmp, path)
+            finally:
+                tmp.unlink(missing_ok=True)
+    finally:
+        img.close()
+
+def create_thumbnail(image_path, thumbnail_path, size=THUMBNAIL_SIZE):
+    """Create a thumbnail for the given image"""
+    try:
+        create_derivatives(image_path, [(thumbnail_path, size, 'JPEG')])
+        return True
+    except Exception as e:
+        print(f"Thumbnail creation error: {e}")
+        return False
+
+def create_thumbnails(image_path, thumbnail_path):
+    """Create the thumbnail plus its popup and WebP derivatives"""
+    try:
+        create_derivatives(image_path, derivative_paths(thumbnail_path).values())
+        return True
+    except Exception as e:
+        print(f"Thumbnail creation error: {e}")
+        return False
+
+def process_photo(image_path, thumbnail_path, optimized_path=None, policy=None):
+    """Create missing thumbnails and, under an active policy, the re-encoded photo, from one decode.
+
+    The re-encoded photo is written to optimized_path, except for animated
+    images and when it would be larger than a photo without metadata.
+    Returns whether the thumbnails exist; a failed re-encode only leaves
+    optimized_path unwritten.
+    """
+    targets = [t for t in derivative_paths(thumbnail_path).values() if not os.path.exists(t[0])]
+    reencode = bool(policy and policy.active and optimized_path)
+    if reencode:
+        try:
+            with Image.open(image_path) as src:
+                reencode = not getattr(src, 'is_animated', False)
+                has_metadata = bool(src.getexif() or 'xmp' in src.info or 'XML:com.adobe.xmp' in src.info)
+        except Exception as e:
+            print(f"Photo re-encode error: {e}")
+            reencode = False
+    try:
+        if targets or reencode:
+            create_derivatives(image_path, targets + ([policy.target(optimized_path)] if reencode else []))
+    except Exception as e:
+        print(f"Thumbnail creation error: {e}")
+        if optimized_path:
+            Path(optimized_path).unlink(missing_ok=True)
+        return False
+    if reencode and not has_metadata and os.path.getsize(optimized_path) >= os.path.getsize(image_path):
+        os.unlink(optimized_path)   # already small and clean
+    return True
+
+def perceptual_hash(image_path):
+    """64-bit difference hash (dHash) as 16 hex digits, or None if the image cannot be read.
+
+    Each bit says whether a pixel of the 9x8 greyscale image is brighter
+    than its right neighbour, so re-encoded, resized or lightly edited
+    copies of a photo hash to within a few bits of each other.
+    """
+    try:
+        img = open_oriented(image_path, (64, 64))
+        try:
+            pixels = list(img.convert('L').resize((9, 8), Image.Resampling.LANCZOS).getdata())
+        finally:
+            img.close()
+    except Exception as e:
+        print(f"Perceptual hash error: {e}")
+        return None
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f'{value:016x}'
+
+def hash_distance(a, b):
+    """Number of differing bits between two perceptual_hash() values"""
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+class ThumbnailQueue:
+    """Bounded background pool that generates thumbnails.
+
+    Jobs run on a thread pool, or a process pool when use_processes is set
+    (needed under gevent workers, where threads are green and would still
+    block the event loop). job(image_path, thumbnail_path, *args) does the
+    work, create_thumbnails by default; it must be picklable for a process
+    pool. Failed jobs are retried with exponential backoff;
+    on_result(submission_id, thumbnail_path, ok, attempts) is called once the
+    job succeeds or runs out of retries.
+    """
+
+    def __init__(self, on_result, workers=2, max_pending=64, retries=2, retry_delay=1.0,
+                 use_processes=False, job=create_thumbnails):
+        self.on_result = on_result
+        self.job = job
+        self.workers = workers
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.use_processes = use_processes
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+        self._executor = None
+        self._pid = None
+
+    def _get_executor(self):
+        # Pools do not survive fork, so each gunicorn worker starts its own lazily
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                pool = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+                self._executor = pool(max_workers=self.workers)
+                self._pid = os.getpid()
+            return self._executor
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def submit(self, submission_id, image_path, thumbnail_path, *args):
+        """Queue a thumbnail job; returns False when the queue is full"""
+        if not self._slots.acquire(blocking=False):
+            return False
+        with self._lock:
+            self._pending += 1
+        self._run(submission_id, str(image_path), str(thumbnail_path), args, 1)
+        return True
+
+    def _run(self, submission_id, image_path, thumbnail_path, args, attempt):
+        try:
+            future = self._get_executor().submit(self.job, image_path, thumbnail_path, *args)
+        except Exception as e:
+            print(f"Thumbnail queue error: {e}")
+            self._finish(submission_id, thumbnail_path, False, attempt)
+            return
+        future.add_done_callback(
+            lambda f: self._done(f, submission_id, image_path, thumbnail_path, args, attempt))
+
+    def _done(self, future, submission_id, image_path, thumbnail_path, args, attempt):
+        try:
+            ok = future.result()
+        except Exception as e:
+            print(f"Thumbnail worker error: {e}")
+            ok = False
+        if not ok and attempt <= self.retries:
+            timer = threading.Timer(self.retry_delay * 2 ** (attempt - 1), self._run,
+                                    (submission_id, image_path, thumbnail_path, args, attempt + 1))
+            timer.daemon = True
+            timer.start()
+            return
+        self._finish(submission_id, thumbnail_path, ok, attempt)
+
+    def _finish(self, submission_id, thumbnail_path, ok, attempts):
+        try:
+            self.on_result(submission_id, thumbnail_path, ok, attempts)
+        except Exception as e:
+            print(f"Thumbnail result error: {e}")
+        finally:
+            self._slots.release()
+            with self._lock:
+                self._pending -= 1
+                if not self._pending:
+                    self._idle.notify_all()
+
+    def wait(self):
+        """Block until every queued job has finished"""
+        with self._lock:
+            while self._pending:
+                self._idle.wait()
@@ -0,0 +1,267 @@
+"""
+Prometheus metrics shared by every gunicorn worker.
+
+Each process keeps its counters, gauges and histograms in memory and writes
+them to <directory>/<pid>.json about once per flush_interval. /metrics,
+served by whichever worker gets the scrape, merges every worker's file into
+one text exposition:
+- Counters and histograms are summed, including those of exited workers.
+  Those are folded into dead.json, so totals do not go backwards when
+  gunicorn recycles a worker.
+- Gauges are summed over live workers, or take their maximum for values
+  every worker sees the same (aggregate='max').
+
+Collectors registered with collect() are called only at scrape time, in the
+scraping process, for values read from shared state such as the store.
+"""
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:   # Windows: dead workers' files are merged without a lock
+    fcntl = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+def sample_line(name, labels, value):
+    if labels:
+        name += '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels) + '}'
+    return f'{name} {format_value(value)}'
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Metrics:
+    """Registry of one process; declare metrics first, then record and render"""
+
+    def __init__(self, directory, flush_interval=1.0):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+        self._meta = {}          # name -> (type, help, buckets or aggregate)
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._values = {}        # (name, labels) -> value, counters and gauges
+        self._histograms = {}    # (name, labels) -> [bucket counts..., sum, count]
+        self._pid = os.getpid()
+        self._flusher = None
+
+    # Declaration
+    def counter(self, name, help):
+        self._meta[name] = ('counter', help, None)
+
+    def gauge(self, name, help, aggregate='sum'):
+        self._meta[name] = ('gauge', help, aggregate)
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        self._meta[name] = ('histogram', help, tuple(buckets))
+
+    def collect(self, collector):
+        """collector() returns [(name, labels dict, value)] for gauges, at scrape time"""
+        self._collectors.append(collector)
+
+    # Recording
+    def _current(self):
+        # Called under the lock; values recorded before a fork belong to the parent
+        if self._pid != os.getpid():
+            self._reset()
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._current()
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._current()
+            self._values[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        buckets = self._meta[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._current()
+            counts = self._histograms.get(key)
+            if counts is None:
+                counts = self._histograms[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the seconds the block takes, even if it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    # Sharing between workers
+    def clear(self):
+        """Forget every process's values, e.g. those of a previous server run"""
+        for path in self.directory.glob('*.json'):
+            path.unlink(missing_ok=True)
+
+    def _snapshot(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                return None
+            return {
+                'values': [[name, labels, value] for (name, labels), value in self._values.items()],
+                'histograms': [[name, labels, counts] for (name, labels), counts in self._histograms.items()],
+            }
+
+    def flush(self):
+        """Write this process's values for other workers' scrapes"""
+        snapshot = self._snapshot()
+        if snapshot is None:
+            return
+        path = self.directory / f'{os.getpid()}.json'
+        tmp = path.with_name(f'.{path.name}.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, path)
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Metrics flush error: {e}")
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _merge(self, into, snapshot, gauges=True):
+        for name, labels, value in snapshot.get('values', []):
+            kind, _, aggregate = self._meta.get(name, (None, None, None))
+            if kind is None or (kind == 'gauge' and not gauges):
+                continue
+            key = (name, tuple(tuple(pair) for pair in labels))
+            if kind == 'gauge' and aggregate == 'max':
+                into['values'][key] = max(into['values'].get(key, value), value)
+            else:
+                into['values'][key] = into['values'].get(key, 0) + value
+        for name, labels, counts in snapshot.get('histograms', []):
+            meta = self._meta.get(name)
+            if not meta or len(counts) != len(meta[2]) + 2:
+                continue   # declared differently by another version
+            key = (name, tuple(tuple(pair) for pair in labels))
+            total = into['histograms'].setdefault(key, [0] * len(counts))
+            for i, count in enumerate(counts):
+                total[i] += count
+
+    @contextmanager
+    def _dead_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.directory / '.dead.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _fold_dead(self):
+        """Move the counters and histograms of exited workers into dead.json"""
+        with self._dead_lock():
+            dead_path = self.directory / 'dead.json'
+            dead, folded = None, []
+            for path in self.directory.glob('*.json'):
+                if not path.stem.isdigit() or pid_alive(int(path.stem)):
+                    continue
+                snapshot = self._read(path)
+                if dead is None:
+                    dead = {'values': {}, 'histograms': {}}
+                    self._merge(dead, self._read(dead_path) or {}, gauges=False)
+                if snapshot:
+                    self._merge(dead, snapshot, gauges=False)
+                folded.append(path)
+            if dead is None:
+                return
+            tmp = dead_path.with_name('.dead.json.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'values': [[n, l, v] for (n, l), v in dead['values'].items()],
+                           'histograms': [[n, l, c] for (n, l), c in dead['histograms'].items()]}, f)
+            os.replace(tmp, dead_path)
+            for path in folded:
+                path.unlink(missing_ok=True)
+
+    def render(self):
+        """Every worker's metrics in the Prometheus text format"""
+        self.flush()
+        self._fold_dead()
+        merged = {'values': {}, 'histograms': {}}
+        for path in self.directory.glob('*.json'):
+            snapshot = self._read(path)
+            if snapshot:
+                self._merge(merged, snapshot, gauges=path.stem != 'dead')
+        for collector in self._collectors:
+            try:
+                for name, labels, value in collector():
+                    merged['values'][(name, tuple(sorted(labels.items())))] = value
+            except Exception as e:
+                print(f"Metrics collector error: {e}")
+
+        lines = []
+        for name, (kind, help, extra) in sorted(self._meta.items()):
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'histogram':
+                for (sample, labels), counts in sorted(merged['histograms'].items()):
+                    if sample != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(extra + (math.inf,), counts[:-2] + [counts[-1] - sum(counts[:-2])]):
+                        cumulative += count
+                        lines.append(sample_line(f'{name}_bucket', labels + (('le', format_value(bound)),), cumulative))
+                    lines.append(sample_line(f'{name}_sum', labels, counts[-2]))
+                    lines.append(sample_line(f'{name}_count', labels, counts[-1]))
+            else:
+                for (sample, labels), value in sorted(merged['values'].items()):
+                    if sample == name:
+                        lines.append(sample_line(name, labels, value))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,200 @@
+"""
+Cross-process Socket.IO fan-out.
+
+Each gunicorn worker only knows the map clients connected to it, so an emit
+has to be relayed to the other workers. socketio_options() turns the
+SOCKETIO_MESSAGE_QUEUE setting into SocketIO() keyword arguments:
+
+    (unset)             single process, no relay
+    unix[:///dir]       UnixSocketManager below, for workers on one host
+    redis://host:6379   python-socketio's RedisManager (needs the redis package)
+    amqp://..., kafka://..., zmq+tcp://...
+                        any other queue URL Flask-SocketIO understands
+
+Map clients subscribe to geohash rooms covering their viewport and receive
+new, updated and deleted reports in batches through RoomBatcher.
+"""
+import atexit
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from socketio import PubSubManager
+
+from geo import geohash, geohash_cover
+
+DEFAULT_SOCKET_DIR = os.path.join(tempfile.gettempdir(), 'crowd-flood-socketio')
+
+
+class UnixSocketManager(PubSubManager):
+    """Socket.IO pub/sub over Unix datagram sockets, one per process.
+
+    Every process binds <directory>/<pid>.sock when its listener starts and
+    publishes by sending the message to every other socket in the directory.
+    No broker process is needed; sockets left behind by dead workers are
+    removed the first time a send to them is refused.
+    """
+    name = 'unix'
+
+    def __init__(self, directory=DEFAULT_SOCKET_DIR, channel='flask-socketio', write_only=False,
+                 logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self.directory = os.path.join(directory, channel)
+        os.makedirs(self.directory, exist_ok=True)
+        self._path = None
+        self._sender = None
+        self._lock = threading.Lock()
+
+    # gunicorn forks workers from a preloaded app, so a host_id fixed in
+    # __init__ would be shared by every worker and they would ignore each
+    # other's messages as their own.
+    @property
+    def host_id(self):
+        return f'{self._host_prefix}-{os.getpid()}'
+
+    @host_id.setter
+    def host_id(self, value):
+        self._host_prefix = value
+
+    def _get_sender(self):
+        with self._lock:
+            if self._sender is None:
+                self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                # A peer whose queue is full blocks sendto; give up rather than stall the emit
+                self._sender.settimeout(1.0)
+            return self._sender
+
+    def _publish(self, data):
+        message = self.json.dumps(data).encode('utf-8')
+        sender = self._get_sender()
+        with os.scandir(self.directory) as entries:
+            peers = [e.path for e in entries if e.name.endswith('.sock') and e.path != self._path]
+        for path in peers:
+            try:
+                sender.sendto(message, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                try:
+                    os.unlink(path)   # the worker that bound it has exited
+                except OSError:
+                    pass
+            except OSError as e:
+                # e.g. EMSGSIZE or a full receive buffer; drop rather than block the emit
+                self._get_logger().warning(f'Socket.IO relay to {path} failed: {e}')
+
+    def _bind(self):
+        path = os.path.join(self.directory, f'{os.getpid()}.sock')
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+        listener.bind(path)
+        self._path = path
+        atexit.register(self._unlink)
+        return listener
+
+    def _unlink(self):
+        try:
+            os.unlink(self._path)
+        except OSError:
+            pass
+
+    def _listen(self):
+        # Runs in the listener thread of the worker, i.e. after the fork
+        listener = self._bind()
+        while True:
+            yield listener.recv(1 << 20)
+
+
+def socketio_options(queue_url):
+    """SocketIO() keyword arguments for a SOCKETIO_MESSAGE_QUEUE value"""
+    if not queue_url:
+        return {}
+    if queue_url == 'unix' or queue_url.startswith('unix://'):
+        directory = queue_url[len('unix://'):] if queue_url.startswith('unix://') else ''
+        return {'client_manager': UnixSocketManager(directory or DEFAULT_SOCKET_DIR)}
+    return {'message_queue': queue_url}
+
+
+# =============================================================================
+# VIEWPORT ROOMS
+# =============================================================================
+# A client joins the cells of the finest precision that covers its viewport
+# with at most VIEWPORT_MAX_ROOMS cells; a report is published to its cell at
+# every precision, so it reaches each subscriber exactly once.
+ROOM_PRECISIONS = (5, 4, 3, 2)   # ~4.9km, ~39x20km, ~156km, ~1250x625km cells
+VIEWPORT_MAX_ROOMS = 48
+WORLD_ROOM = 'world'             # viewports too large for any precision
+LEGACY_ROOM = 'all'              # clients that never sent a viewport
+
+def viewport_rooms(bbox):
+    for precision in ROOM_PRECISIONS:
+        cells = geohash_cover(bbox, precision, VIEWPORT_MAX_ROOMS)
+        if cells is not None:
+            return [f'gh:{cell}' for cell in cells]
+    return [WORLD_ROOM]
+
+def point_rooms(lat, lon):
+    return [f'gh:{geohash(lat, lon, precision)}' for precision in ROOM_PRECISIONS] + [WORLD_ROOM]
+
+def is_feed_room(room):
+    return room.startswith('gh:') or room in (WORLD_ROOM, LEGACY_ROOM)
+
+
+class RoomBatcher:
+    """Coalesces events per room and emits each room's batch once per window.
+
+    add() queues an item for some rooms, or a deletion when item is None;
+    the first add of a window schedules a flush window seconds later, which
+    emits {'submissions': [...], 'deleted': [keys]} to each room that got
+    changes. A key added twice in one window is sent once, in its latest form.
+    Items added with a seq (the store change they come from) also send
+    'seqs' ({key: seq}) and 'seq', the highest of them, so clients can skip
+    changes they already have.
+    on_flush(rooms, seconds), if given, is called after each flush with the
+    number of rooms emitted to and the time the emits took.
+    """
+
+    def __init__(self, socketio, event, window=0.2, on_flush=None):
+        self.socketio = socketio
+        self.event = event
+        self.window = window
+        self.on_flush = on_flush
+        self._pending = {}   # room -> {key: item}
+        self._scheduled = False
+        self._lock = threading.Lock()
+
+    def add(self, key, item, rooms, seq=None):
+        with self._lock:
+            for room in rooms:
+                self._pending.setdefault(room, {})[key] = (item, seq)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.socketio.start_background_task(self._flush_later)
+
+    def _flush_later(self):
+        self.socketio.sleep(self.window)
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._scheduled = False
+        start = time.perf_counter()
+        for room, items in pending.items():
+            batch = {'submissions': [item for item, _ in items.values() if item is not None],
+                     'deleted': [key for key, (item, _) in items.items() if item is None]}
+            seqs = {key: seq for key, (_, seq) in items.items() if seq is not None}
+            if seqs:
+                batch['seqs'] = seqs
+                batch['seq'] = max(seqs.values())
+            try:
+                self.socketio.emit(self.event, batch, to=room)
+            except Exception as e:
+                print(f"Live update emit error: {e}")
+        if self.on_flush and pending:
+            self.on_flush(len(pending), time.perf_counter() - start)
@@ -0,0 +1,94 @@
+"""
+In-process cache for rendered GET responses.
+
+Entries are keyed by request path and query string and tagged with the
+version of the data they were built from (the store's change seq for
+submissions); an entry whose version is no longer current is rebuilt on the
+next hit, so writes from any worker invalidate it without extra signalling.
+Each entry carries a strong ETag hashed from its body, which is the same in
+every worker and lets browsers and CDNs revalidate with If-None-Match.
+
+Entries stored with encodings= are compressed once, when they are built,
+so pages are served gzip- or brotli-encoded without per-request work.
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:   # optional; gzip only
+    brotli = None
+
+# Content-Encodings put() can precompute, in order of preference
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+MIN_COMPRESS_BYTES = 1024
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body)
+    return gzip.compress(body, compresslevel=9, mtime=0)
+
+
+class CachedResponse:
+    __slots__ = ('version', 'body', 'status', 'headers', 'etag', 'encoded')
+
+    def __init__(self, version, body, status, headers, encodings=()):
+        self.version = version
+        self.body = body
+        self.status = status
+        self.headers = headers
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.encoded = {}   # Content-Encoding -> compressed body
+        if len(body) >= MIN_COMPRESS_BYTES:
+            for encoding in encodings:
+                if encoding in ENCODINGS:
+                    self.encoded[encoding] = compress(body, encoding)
+
+    @property
+    def size(self):
+        return len(self.body) + sum(len(b) for b in self.encoded.values())
+
+
+class ResponseCache:
+    """LRU of CachedResponse bounded by total body size"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> CachedResponse
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, version, body, status=200, headers=(), encodings=()):
+        entry = CachedResponse(version, body, status, list(headers), encodings)
+        if entry.size > self.max_bytes // 4:
+            return entry   # served, but too big to be worth evicting everything else for
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old.size
+            self._entries[key] = entry
+            self._size += entry.size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
@@ -0,0 +1,161 @@
+"""
+Flood depth over time, rolled up as reports arrive.
+
+DepthRollup keeps, for every ROLLUP_STEP of received_at and every zone, a
+histogram of the flood_depth_cm values reported in it: one set counting every
+report it includes and one counting only verified ('valid') reports. Depths
+are whole centimetres, so the histograms are small and give exact
+percentiles, and a report that is re-verified or deleted is simply taken out
+of the ones it was counted in. Coarser buckets are built at query time by
+merging steps.
+"""
+import bisect
+import re
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+ROLLUP_STEP = 300   # seconds; every bucket is a multiple of this
+BUCKET_UNITS = {'m': 60, 'h': 3600, 'd': 86400}
+MAX_BUCKET_SECONDS = 30 * 86400
+MAX_BUCKETS = 2000   # buckets one query may span
+EPOCH = datetime(1970, 1, 1)
+STATUSES = ('all', 'valid')
+GROUPS = ('none', 'zone')
+
+
+def parse_bucket(value):
+    """'15m', '1h', '1d', ... -> seconds; raises ValueError unless a multiple of ROLLUP_STEP"""
+    match = re.fullmatch(r'(\d+)([mhd])', (value or '').strip().lower())
+    if not match:
+        raise ValueError('bucket must look like 15m, 1h or 1d')
+    seconds = int(match.group(1)) * BUCKET_UNITS[match.group(2)]
+    if not seconds or seconds % ROLLUP_STEP or seconds > MAX_BUCKET_SECONDS:
+        raise ValueError(f'bucket must be a multiple of {ROLLUP_STEP // 60}m, at most 30d')
+    return seconds
+
+def parse_time(value):
+    """Seconds since EPOCH of an ISO timestamp as stored in received_at (local, naive).
+
+    A timestamp with an offset is converted to local time first.
+    """
+    when = datetime.fromisoformat(value)
+    if when.tzinfo is not None:
+        when = when.astimezone().replace(tzinfo=None)
+    return int((when - EPOCH).total_seconds())
+
+def format_time(seconds):
+    return (EPOCH + timedelta(seconds=seconds)).isoformat()
+
+def summarize(histogram):
+    """count, mean, p50, p90 and max of a depth -> count histogram"""
+    count = sum(histogram.values())
+    depths = sorted(histogram.items())
+    percentiles = {}
+    seen = 0
+    targets = [('p50', 0.5), ('p90', 0.9)]
+    for depth, n in depths:
+        seen += n
+        # Nearest-rank percentile: the smallest depth covering that share of reports
+        while targets and seen >= targets[0][1] * count:
+            percentiles[targets.pop(0)[0]] = depth
+    return {
+        'count': count,
+        'mean_depth_cm': round(sum(d * n for d, n in depths) / count, 1),
+        'p50_depth_cm': percentiles['p50'],
+        'p90_depth_cm': percentiles['p90'],
+        'max_depth_cm': depths[-1][0],
+    }
+
+
+class DepthRollup:
+    """Depth histograms per ROLLUP_STEP and zone, kept current as a store listener.
+
+    Subscribe it to a SubmissionStore; include(submission) decides which
+    reports are counted at all (the 'valid' set is a subset of those).
+    Observations merged into a report (its 'duplicates' list) are counted
+    at their own time and depth, in the report's zone and status.
+    """
+
+    def __init__(self, include=None):
+        self.include = include
+        self._steps = {status: {} for status in STATUSES}   # step -> {zone: Counter(depth)}
+        self._keys = {status: [] for status in STATUSES}    # sorted steps that have reports
+        self._lock = threading.Lock()
+
+    def _entries(self, submission):
+        """(step, zone, depth, valid) of each observation a submission is counted under"""
+        if not submission or (self.include and not self.include(submission)):
+            return []
+        zone = submission.get('zone') or ''
+        valid = submission.get('verification_status') == 'valid'
+        entries = []
+        for observation in [submission] + (submission.get('duplicates') or []):
+            try:
+                step = parse_time(observation.get('received_at') or '') // ROLLUP_STEP * ROLLUP_STEP
+            except ValueError:
+                continue
+            entries.append((step, zone, observation.get('flood_depth_cm') or 0, valid))
+        return entries
+
+    # Store listener protocol
+    def reset(self, submissions):
+        entries = [e for s in submissions for e in self._entries(s)]
+        with self._lock:
+            self._steps = {status: {} for status in STATUSES}
+            self._keys = {status: [] for status in STATUSES}
+            for entry in entries:
+                self._add(entry, 1)
+
+    def apply(self, old, new):
+        old_entries, new_entries = self._entries(old), self._entries(new)
+        if old_entries == new_entries:
+            return
+        with self._lock:
+            for entry in old_entries:
+                self._add(entry, -1)
+            for entry in new_entries:
+                self._add(entry, 1)
+
+    def _add(self, entry, delta):
+        step, zone, depth, valid = entry
+        for status in (STATUSES if valid else ('all',)):
+            steps = self._steps[status]
+            zones = steps.get(step)
+            if zones is None:
+                zones = steps[step] = {}
+                bisect.insort(self._keys[status], step)
+            histogram = zones.setdefault(zone, Counter())
+            histogram[depth] += delta
+            if histogram[depth] <= 0:
+                del histogram[depth]
+                if not histogram:
+                    del zones[zone]
+                    if not zones:
+                        del steps[step]
+                        keys = self._keys[status]
+                        del keys[bisect.bisect_left(keys, step)]
+
+    def query(self, bucket, since, until, status='all', group='none'):
+        """Summaries of the non-empty buckets in [since, until), oldest first.
+
+        bucket is in seconds and since/until in seconds since EPOCH; buckets
+        are aligned to multiples of bucket. With group='zone' there is one
+        row per zone and bucket.
+        """
+        since = since // bucket * bucket
+        merged = {}   # (bucket start, zone) -> Counter
+        with self._lock:
+            steps, keys = self._steps[status], self._keys[status]
+            for step in keys[bisect.bisect_left(keys, since):bisect.bisect_left(keys, until)]:
+                start = step // bucket * bucket
+                for zone, histogram in steps[step].items():
+                    merged.setdefault((start, zone if group == 'zone' else None), Counter()).update(histogram)
+        rows = []
+        for (start, zone), histogram in sorted(merged.items(), key=lambda item: (item[0][0], item[0][1] or '')):
+            row = {'start': format_time(start)}
+            if group == 'zone':
+                row['zone'] = zone
+            row.update(summarize(histogram))
+            rows.append(row)
+        return rows
@@ -8,6 +8,8 @@ let currentSearchQuery = '';
 let currentUrls = [];
 let currentExtractedNews = [];
 let currentSubmissionId = null;
+let nextCursor = null;
+let submissionCounts = null;
 
 // Check for existing valid session on page load
 async function checkExistingSession() {
@@ -21,7 +23,8 @@ async function checkExistingSession() {
             document.getElementById('adminControls').classList.add('active');
             const data = await response.json();
             allSubmissions = data.items;
-            updateStats(data.items);
+            nextCursor = data.next_cursor;
+            updateStats(data.counts);
             displaySubmissions(data.items);
         }
     } catch (e) {
@@ -111,6 +114,7 @@ async function logout() {
     } catch (e) { }
 
     allSubmissions = [];
+    nextCursor = null;
     document.getElementById('adminControls').classList.remove('active');
     document.getElementById('authCard').style.display = 'block';
     document.getElementById('admin_user').value = '';
@@ -127,32 +131,36 @@ function setFilter(filter) {
     refreshSubmissions();
 }
 
+// Fetch one page of submissions; the server returns a cursor for the next one
+async function fetchSubmissionsPage(cursor) {
+    const params = new URLSearchParams();
+    if (currentFilter !== 'all') params.set('filter', currentFilter);
+    if (cursor) params.set('cursor', cursor);
+    const query = params.toString();
+    const response = await fetch(`/api/admin/submissions${query ? '?' + query : ''}`, {
+        credentials: 'same-origin'
+    });
+
+    if (!response.ok) {
+        if (response.status === 401) {
+            logout();
+            throw new Error('Session expired, please login again');
+        }
+        throw new Error('Failed to fetch submissions');
+    }
+    return response.json();
+}
+
 // Refresh submissions with filter support
 async function refreshSubmissions() {
     const list = document.getElementById('submissionsList');
     list.innerHTML = '<div class="card" style="padding: 3rem; text-align: center;"><p style="color: var(--text-secondary);">Loading...</p></div>';
 
     try {
-        const url = `/api/admin/submissions${currentFilter !== 'all' ? '?filter=' + currentFilter : ''}`;
-        const response = await fetch(url, {
-            credentials: 'same-origin'
-        });
-
-        if (!response.ok) {
-            if (response.status === 401) {
-                logout();
-                throw new Error('Session expired, please login again');
-            }
-            throw new Error('Failed to fetch submissions');
-        }
-
-        const data = await response.json();
+        const data = await fetchSubmissionsPage(null);
         allSubmissions = data.items;
-
-        if (currentFilter === 'all') {
-            updateStats(data.items);
-        }
-
+        nextCursor = data.next_cursor;
+        updateStats(data.counts);
         displaySubmissions(data.items);
 
     } catch (error) {
@@ -160,25 +168,49 @@ async function refreshSubmissions() {
     }
 }
 
-// Update statistics
-function updateStats(items) {
-    const total = items.length;
-    const critical = items.filter(i => i.flood_depth_cm > 100).length;
-    const pending = items.filter(i => !i.verification_status || i.verification_status === 'pending').length;
-    const verified = items.filter(i => i.verification_status === 'valid').length;
+// Append the next page to the list
+async function loadMoreSubmissions() {
+    if (!nextCursor) return;
+    const button = document.getElementById('loadMoreBtn');
+    if (button) {
+        button.disabled = true;
+        button.textContent = 'Loading...';
+    }
 
-    document.getElementById('totalReports').textContent = total;
-    document.getElementById('criticalAreas').textContent = critical;
-    document.getElementById('pendingReports').textContent = pending;
-    document.getElementById('verifiedReports').textContent = verified;
+    try {
+        const data = await fetchSubmissionsPage(nextCursor);
+        allSubmissions = allSubmissions.concat(data.items);
+        nextCursor = data.next_cursor;
+        updateStats(data.counts);
+        filterSubmissions();
+    } catch (error) {
+        alert('Error: ' + error.message);
+        if (button) {
+            button.disabled = false;
+            button.textContent = 'Load more';
+        }
+    }
+}
+
+// Update statistics from the server-side totals (the list itself is paged)
+function updateStats(counts) {
+    if (!counts) return;
+    submissionCounts = counts;
+    document.getElementById('totalReports').textContent = counts.all || 0;
+    document.getElementById('criticalAreas').textContent = counts.critical || 0;
+    document.getElementById('pendingReports').textContent = counts.pending || 0;
+    document.getElementById('verifiedReports').textContent = counts.valid || 0;
 }
 
 // Display submissions with thumbnails and delete button
 function displaySubmissions(items) {
     const list = document.getElementById('submissionsList');
 
+    const loadMore = nextCursor ?
+        '<div style="text-align: center; padding: 1rem;"><button id="loadMoreBtn" class="filter-btn" onclick="loadMoreSubmissions()">Load more</button></div>' : '';
+
     if (items.length === 0) {
-        list.innerHTML = '<div class="card" style="padding: 3rem; text-align: center;"><p style="color: var(--text-secondary);">No submissions found</p></div>';
+        list.innerHTML = '<div class="card" style="padding: 3rem; text-align: center;"><p style="color: var(--text-secondary);">No submissions found</p></div>' + loadMore;
         return;
     }
 
@@ -186,8 +218,9 @@ function displaySubmissions(items) {
         const status = item.verification_status || 'pending';
         const statusClass = status === 'valid' ? 'valid' : status === 'invalid' ? 'invalid' : 'pending';
         const thumbSrc = item.thumbnail_path ? '/' + item.thumbnail_path : (item.image_path ? '/' + item.image_path : '');
+        const webpSrc = item.thumbnail_path && item.thumbnails && item.thumbnails.webp ? '/' + item.thumbnails.webp : '';
         const imgHtml = thumbSrc ?
-            `<img src="${thumbSrc}" alt="Flood photo" class="submission-thumb" onerror="this.style.display='none'">` :
+            `<picture>${webpSrc ? `<source srcset="${webpSrc}" type="image/webp">` : ''}<img src="${thumbSrc}" alt="Flood photo" class="submission-thumb" loading="lazy" onerror="this.style.display='none'"></picture>` :
             `<div class="submission-thumb" style="display: flex; align-items: center; justify-content: center; background: var(--bg-light);"><svg width="40" height="40" viewBox="0 0 24 24" fill="none" stroke="var(--text-secondary)" stroke-width="1.5"><rect x="3" y="3" width="18" height="18" rx="2"/><circle cx="8.5" cy="8.5" r="1.5"/><path d="m21 15-5-5L5 21"/></svg></div>`;
         return `
         <div class="submission-card">
@@ -205,7 +238,7 @@ function displaySubmissions(items) {
                 <button class="delete-btn" onclick="deleteSubmission('${item.id}')">Delete</button>
             </div>
         </div>
-    `}).join('');
+    `}).join('') + loadMore;
 }
 
 // Delete submission with confirmation
@@ -312,26 +345,18 @@ function filterVolunteers() {
 }
 
 // Export CSV
-async function exportCSV() {
-    try {
-        const response = await fetch('/api/admin/export.csv', {
-            credentials: 'same-origin'
-        });
-
-        if (!response.ok) throw new Error('Export failed');
-
-        const blob = await response.blob();
-        const url = window.URL.createObjectURL(blob);
-        const a = document.createElement('a');
-        a.href = url;
-        a.download = `submissions_${Date.now()}.csv`;
-        document.body.appendChild(a);
-        a.click();
-        window.URL.revokeObjectURL(url);
-        document.body.removeChild(a);
-    } catch (error) {
-        alert('Export failed: ' + error.message);
-    }
+function exportCSV() {
+    // Navigate to the export so the browser streams it to disk instead of
+    // buffering the whole file in memory as a blob; the session cookie authenticates.
+    const params = new URLSearchParams();
+    if (currentFilter !== 'all') params.set('status', currentFilter);
+    const query = params.toString();
+    const a = document.createElement('a');
+    a.href = `/api/admin/export.csv${query ? '?' + query : ''}`;
+    a.download = `submissions_${Date.now()}.csv`;
+    document.body.appendChild(a);
+    a.click();
+    document.body.removeChild(a);
 }
 
 // Step 1: Search for URLs
@@ -810,10 +835,17 @@ async function verifySubmission(status) {
         const data = await response.json();
         if (data.ok) {
             const item = allSubmissions.find(s => s.id === currentSubmissionId);
-            if (item) item.verification_status = status;
+            if (item) {
+                const previous = item.verification_status || 'pending';
+                item.verification_status = status;
+                if (submissionCounts && previous !== status) {
+                    submissionCounts[previous] = Math.max((submissionCounts[previous] || 0) - 1, 0);
+                    submissionCounts[status] = (submissionCounts[status] || 0) + 1;
+                    updateStats(submissionCounts);
+                }
+            }
 
             displaySubmissions(allSubmissions);
-            updateStats(allSubmissions);
             closeModal();
         } else {
             throw new Error(data.error || 'Unknown error');
@@ -7,7 +7,10 @@
 // CONFIGURATION
 // =============================================================================
 const DEFAULT_BOUNDS = { minLat: 8.0, maxLat: 37.0, minLng: 68.0, maxLng: 97.5 };
+const DEFAULT_BBOX   = [DEFAULT_BOUNDS.minLng, DEFAULT_BOUNDS.minLat, DEFAULT_BOUNDS.maxLng, DEFAULT_BOUNDS.maxLat];
 const MAP_CONFIG     = { defaultZoom: 12, minZoom: 5, maxZoom: 20 };
+const VIEWPORT_PAD   = 0.5;       // fetch 50% beyond each viewport edge so small pans need no refetch
+const CLUSTER_MAX_ZOOM = 13;      // at or below this zoom draw server-side clusters instead of markers
 
 // =============================================================================
 // STATE
@@ -15,17 +18,25 @@ const MAP_CONFIG     = { defaultZoom: 12, minZoom: 5, maxZoom: 20 };
 let map = null;
 let markers = [];
 let labelOverlays = [];
+let clusterOverlays = [];
+let clusterRefreshTimer = null;
 let currentBasemap = 'satellite';
 let isInitialLoad = true;
 let allSubmissions = [];          // full list (used for stats + de-dup)
 let knownIds = new Set();         // track IDs already on the map
 let latestMarkerId = null;        // ID of the marker with "latest" styling
+let loadedBbox = null;            // [minLng, minLat, maxLng, maxLat] covered by the last fetch (null = nothing or clusters)
+let changeSeq = null;             // server change seq the markers are current to (X-Change-Seq)
+let syncedSeq = null;             // seq of the last full load or catch-up; live changes at or below it are already shown
+let appliedSeqs = new Map();      // id -> seq of the last live change applied, so a late batch cannot undo a newer one
 
 // Latest-card
 let latestCardData = null;        // store for re-expand
 
 // Socket
 let socket = null;
+let subscribedBbox = null;        // viewport last sent to the server for live-update rooms
+let hasConnected = false;         // a later 'connect' is a reconnect
 
 // =============================================================================
 // POSITION PERSISTENCE
@@ -74,11 +85,16 @@ function initMap() {
         gestureHandling: 'greedy'
     });
 
-    map.addListener('idle', saveMapPosition);
+    map.addListener('idle', () => {
+        saveMapPosition();
+        loadViewportIfNeeded();
+        subscribeViewport();
+    });
     isInitialLoad = !saved;
 
-    // Initial load — all markers at once
-    loadSubmissions();
+    // Initial load — all markers at once. A restored position waits for the
+    // first 'idle', when the viewport bounds are known.
+    if (isInitialLoad) loadSubmissions();
 
     // Start WebSocket for real-time updates
     initSocket();
@@ -103,15 +119,51 @@ function setBasemap(type) {
 
 // =============================================================================
 // DATA LOADING  (initial + fallback)
-// =============================================================================
+// Every fetch is bounded by ?bbox=. The first visit requests DEFAULT_BOUNDS so
+// the map can fit the reports in it; after that only the padded viewport.
+// =============================================================================
+function paddedViewportBbox() {
+    const b = map && map.getBounds();
+    if (!b) return null;
+    const sw = b.getSouthWest(), ne = b.getNorthEast();
+    const padLat = (ne.lat() - sw.lat()) * VIEWPORT_PAD;
+    const padLng = (ne.lng() - sw.lng()) * VIEWPORT_PAD;
+    return [sw.lng() - padLng, sw.lat() - padLat, ne.lng() + padLng, ne.lat() + padLat];
+}
+
+function inClusterMode() {
+    return map && map.getZoom() <= CLUSTER_MAX_ZOOM;
+}
+
+function loadViewportIfNeeded() {
+    if (isInitialLoad) return;
+    if (inClusterMode()) { loadClusters(); return; }
+    if (clusterOverlays.length) { loadSubmissions(); return; }
+    if (!loadedBbox) { loadSubmissions(); return; }
+    const b = map.getBounds();
+    if (!b) return;
+    const sw = b.getSouthWest(), ne = b.getNorthEast();
+    const covered = sw.lng() >= loadedBbox[0] && sw.lat() >= loadedBbox[1] &&
+                    ne.lng() <= loadedBbox[2] && ne.lat() <= loadedBbox[3];
+    if (!covered) loadSubmissions();
+}
+
 async function loadSubmissions() {
     try {
         showRefreshIndicator(true);
-        const res = await fetch('/api/submissions');
+        const bbox = (!isInitialLoad && paddedViewportBbox()) || DEFAULT_BBOX;
+        const url = `/api/submissions?bbox=${bbox.map(v => v.toFixed(5)).join(',')}`;
+        const res = await fetch(url);
         const submissions = await res.json();
+        changeSeq = parseInt(res.headers.get('X-Change-Seq'), 10);
+        if (isNaN(changeSeq)) changeSeq = null;
+        syncedSeq = changeSeq;
+        appliedSeqs = new Map();
         submissions.sort((a, b) => new Date(a.received_at || 0) - new Date(b.received_at || 0));
         allSubmissions = submissions;
+        loadedBbox = bbox;
         knownIds = new Set(submissions.map(s => s.id));
+        clearClusters();
         clearMarkers();
         displayAllMarkers(submissions);
         updateStats(submissions);
@@ -123,6 +175,80 @@ async function loadSubmissions() {
     }
 }
 
+// =============================================================================
+// CLUSTERS  (city-wide zoom levels)
+// Aggregated per zoom level by /api/submissions/clusters, so the number of
+// overlays stays bounded however many reports exist.
+// =============================================================================
+async function loadClusters() {
+    try {
+        showRefreshIndicator(true);
+        const bbox = paddedViewportBbox();
+        let url = `/api/submissions/clusters?z=${map.getZoom()}`;
+        if (bbox) url += `&bbox=${bbox.map(v => v.toFixed(5)).join(',')}`;
+        const res = await fetch(url);
+        const data = await res.json();
+        clearMarkers();
+        clearClusters();
+        loadedBbox = null;
+        (data.clusters || []).forEach(c => {
+            const ov = createClusterOverlay(c);
+            ov.setMap(map);
+            clusterOverlays.push(ov);
+        });
+        const total = (data.clusters || []).reduce((n, c) => n + c.count, 0);
+        const el = document.getElementById('fmReportCount');
+        if (el) el.textContent = `${total} report${total !== 1 ? 's' : ''}`;
+        showRefreshIndicator(false);
+    } catch (err) {
+        console.error('Error loading clusters:', err);
+        showRefreshIndicator(false);
+    }
+}
+
+function scheduleClusterRefresh() {
+    clearTimeout(clusterRefreshTimer);
+    clusterRefreshTimer = setTimeout(loadClusters, 1000);
+}
+
+function createClusterOverlay(cluster) {
+    const color = getDepthColor(cluster.max_depth_cm);
+    const size  = Math.round(28 + Math.min(32, Math.log2(cluster.count) * 6));
+    const div = document.createElement('div');
+    div.className = 'fm-cluster';
+    div.title = `${cluster.count} report${cluster.count !== 1 ? 's' : ''} · ` +
+        `mean ${(cluster.mean_depth_cm / 100).toFixed(2)} m · max ${(cluster.max_depth_cm / 100).toFixed(2)} m · ` +
+        `latest ${formatDateTime(new Date(cluster.latest_received_at))}`;
+    div.style.cssText = `position:absolute;width:${size}px;height:${size}px;border-radius:50%;background:${color};` +
+        'color:white;font:600 12px/1 Inter,Arial,sans-serif;display:flex;align-items:center;justify-content:center;' +
+        'box-shadow:0 0 0 4px rgba(255,255,255,0.35),0 2px 8px rgba(0,0,0,0.3);cursor:pointer;';
+    div.textContent = cluster.count;
+
+    const pos = new google.maps.LatLng(cluster.lat, cluster.lon);
+    const ov = new google.maps.OverlayView();
+    ov.onAdd = function () {
+        this.getPanes().overlayMouseTarget.appendChild(div);
+        div.addEventListener('click', (e) => {
+            e.preventDefault(); e.stopPropagation();
+            map.panTo(pos);
+            map.setZoom(Math.min(map.getZoom() + 2, MAP_CONFIG.maxZoom));
+        });
+    };
+    ov.draw = function () {
+        const proj = this.getProjection(); if (!proj) return;
+        const pt = proj.fromLatLngToDivPixel(pos); if (!pt) return;
+        div.style.left = (pt.x - size / 2) + 'px';
+        div.style.top  = (pt.y - size / 2) + 'px';
+    };
+    ov.onRemove = function () { if (div.parentElement) div.parentElement.removeChild(div); };
+    return ov;
+}
+
+function clearClusters() {
+    clusterOverlays.forEach(o => o.setMap(null));
+    clusterOverlays = [];
+}
+
 // =============================================================================
 // DISPLAY ALL MARKERS (instant, no animation)
 // Highlights only the most recent submission.
@@ -177,12 +303,29 @@ function initSocket() {
         console.log('WebSocket connected, transport:', socket.io.engine.transport.name);
         setConnectionState('live');
         disconnectedAt = null;
+        // Rooms do not survive a reconnect; subscribe again
+        subscribedBbox = null;
+        subscribeViewport();
+        if (hasConnected) {
+            hideConnBanner();
+            showToast('Back online', 'success');
+            // Fetch only what changed while we were away
+            catchUp();
+        }
+        hasConnected = true;
     });
 
+    // Sent only until the viewport subscription is in place
     socket.on('new_submission', (sub) => {
-        const t0 = performance.now();
         handleNewSubmission(sub);
-        console.log(`[ws] new_submission displayed in ${(performance.now() - t0).toFixed(1)}ms`, sub.id);
+    });
+
+    // Batched new, updated and deleted reports for the geohash cells around the viewport
+    socket.on('submissions', (batch) => {
+        if (!batch) return;
+        const t0 = performance.now();
+        const n = applyLiveBatch(batch);
+        console.log(`[ws] ${n} change(s) applied in ${(performance.now() - t0).toFixed(1)}ms`);
     });
 
     socket.on('disconnect', (reason) => {
@@ -197,33 +340,98 @@ function initSocket() {
         }, 10000);
     });
 
-    socket.on('reconnect', (attemptNumber) => {
-        console.log('WebSocket reconnected after', attemptNumber, 'attempts');
-        setConnectionState('live');
-        hideConnBanner();
-        showToast('Back online', 'success');
-        // Reload all data to catch anything missed during disconnect
-        loadSubmissions();
-    });
-
     socket.on('connect_error', () => {
         setConnectionState('reconnecting');
     });
 }
 
+// Join the live-update rooms covering the (padded) viewport
+function subscribeViewport() {
+    if (!socket || !socket.connected) return;
+    const bbox = paddedViewportBbox();
+    if (!bbox) return;
+    const key = bbox.map(v => v.toFixed(3)).join(',');
+    if (key === subscribedBbox) return;
+    subscribedBbox = key;
+    socket.emit('viewport', { bbox: key });
+}
+
 function manualReconnect() {
     if (socket) { socket.connect(); }
 }
 
+// =============================================================================
+// DELTA SYNC  (after a reconnect)
+// /api/submissions/changes returns what was saved or deleted since changeSeq
+// =============================================================================
+async function catchUp() {
+    if (inClusterMode() && !isInitialLoad) { loadClusters(); return; }
+    if (changeSeq === null) { loadSubmissions(); return; }
+    try {
+        let more = true;
+        while (more) {
+            let url = `/api/submissions/changes?since=${changeSeq}`;
+            if (loadedBbox) url += `&bbox=${loadedBbox.map(v => v.toFixed(5)).join(',')}`;
+            const res = await fetch(url);
+            const data = await res.json();
+            if (!res.ok) throw new Error(data.error || res.status);
+            if (data.reset) { loadSubmissions(); return; }
+            const n = applyChanges(data.submissions || [], data.deleted || [], false);
+            changeSeq = data.seq;
+            more = data.more;
+            console.log(`[sync] ${n} change(s) caught up to seq ${changeSeq}`);
+        }
+        syncedSeq = changeSeq;
+    } catch (err) {
+        console.error('Error catching up, reloading:', err);
+        loadSubmissions();
+    }
+}
+
+// A live batch carries the change seq of each report ('seqs') and the highest
+// of them ('seq'). Changes the last load or catch-up already covered, or older
+// than one applied before, are skipped; the rest advance changeSeq so a
+// catch-up after a reconnect starts from them instead of refetching.
+function applyLiveBatch(batch) {
+    let subs = batch.submissions || [], deleted = batch.deleted || [];
+    const seqs = batch.seqs;
+    if (typeof batch.seq === 'number' && seqs) {
+        if (syncedSeq !== null && batch.seq <= syncedSeq) return 0;
+        const isNew = id => {
+            const seq = seqs[id];
+            if (typeof seq !== 'number') return true;
+            if (syncedSeq !== null && seq <= syncedSeq) return false;
+            const applied = appliedSeqs.get(id);
+            return applied === undefined || seq > applied;
+        };
+        subs = subs.filter(s => isNew(s.id));
+        deleted = deleted.filter(isNew);
+        subs.forEach(s => { if (typeof seqs[s.id] === 'number') appliedSeqs.set(s.id, seqs[s.id]); });
+        deleted.forEach(id => { if (typeof seqs[id] === 'number') appliedSeqs.set(id, seqs[id]); });
+        if (changeSeq !== null && batch.seq > changeSeq) changeSeq = batch.seq;
+    }
+    return applyChanges(subs, deleted, true);
+}
+
+// Returns the number of reports added, updated or removed
+function applyChanges(subs, deleted, announce) {
+    deleted.forEach(removeSubmission);
+    const fresh = subs.filter(s => !knownIds.has(s.id));
+    subs.filter(s => knownIds.has(s.id)).forEach(updateSubmission);
+    fresh.forEach((sub, i) => handleNewSubmission(sub, announce && i === fresh.length - 1));
+    return subs.length + deleted.length;
+}
+
 // =============================================================================
 // HANDLE NEW SUBMISSION  (instant display)
 // =============================================================================
-function handleNewSubmission(sub) {
+// announce=false adds the marker quietly (all but the last report of a batch)
+function handleNewSubmission(sub, announce = true) {
     if (!sub || !sub.gps || !sub.gps.lat || !sub.gps.lon) return;
     if (knownIds.has(sub.id)) return; // duplicate guard
 
     // Demote previous latest marker
-    if (latestMarkerId) {
+    if (announce && latestMarkerId) {
         demoteLatestMarker(latestMarkerId);
     }
 
@@ -231,18 +439,49 @@ function handleNewSubmission(sub) {
     knownIds.add(sub.id);
     allSubmissions.push(sub);
 
+    // Zoomed out: clusters are aggregated server-side, just refresh them
+    if (inClusterMode() && !isInitialLoad) {
+        scheduleClusterRefresh();
+        if (announce) {
+            showLatestCard(sub);
+            showToast(`New report: ${(sub.flood_depth_cm / 100).toFixed(2)} m`, 'info');
+        }
+        return;
+    }
+
     // Create marker as "latest"
-    const marker = createMarker(sub, true);
+    const marker = createMarker(sub, announce);
     if (marker) {
         markers.push(marker);
-        map.panTo(marker.getPosition());
+        if (announce) map.panTo(marker.getPosition());
     }
-    latestMarkerId = sub.id;
+    if (announce) latestMarkerId = sub.id;
 
     // Update stats + latest card
     updateStats(allSubmissions);
-    showLatestCard(sub);
-    showToast(`New report: ${(sub.flood_depth_cm / 100).toFixed(2)} m`, 'info');
+    if (announce) {
+        showLatestCard(sub);
+        showToast(`New report: ${(sub.flood_depth_cm / 100).toFixed(2)} m`, 'info');
+    }
+}
+
+function updateSubmission(sub) {
+    const i = allSubmissions.findIndex(s => s.id === sub.id);
+    if (i !== -1) allSubmissions[i] = sub;
+    if (inClusterMode() && !isInitialLoad) { scheduleClusterRefresh(); return; }
+    removeMarker(sub.id);
+    const marker = createMarker(sub, sub.id === latestMarkerId);
+    if (marker) markers.push(marker);
+}
+
+function removeSubmission(id) {
+    if (!knownIds.has(id)) return;
+    knownIds.delete(id);
+    allSubmissions = allSubmissions.filter(s => s.id !== id);
+    if (latestMarkerId === id) latestMarkerId = null;
+    removeMarker(id);
+    if (inClusterMode() && !isInitialLoad) scheduleClusterRefresh();
+    updateStats(allSubmissions);
 }
 
 function demoteLatestMarker(id) {
@@ -293,6 +532,7 @@ function createMarker(sub, isLatest) {
             </div>
             <div style="font-size:20px;font-weight:700;color:${color};margin-bottom:2px;">${depthM} m</div>
             <div style="font-size:10px;color:#666;margin-bottom:8px;">${getDepthLabel(depthCm)}</div>
+            ${sub.photo ? `<img src="/${sub.photo}" alt="" loading="lazy" style="display:block;width:100%;max-height:120px;object-fit:cover;border-radius:4px;margin-bottom:6px;">` : ''}
             <div style="border-top:1px solid #eee;padding-top:6px;">
                 <div style="font-size:10px;color:#555;margin-bottom:3px;">📅 ${dateStr}</div>
                 <div style="font-size:10px;color:#666;margin-bottom:3px;">📍 ${sub.location || sub.street || 'Unknown'}</div>
@@ -404,6 +644,22 @@ function clearMarkers() {
     labelOverlays = [];
 }
 
+function removeMarker(id) {
+    const idx = markers.findIndex(m => m._subId === id);
+    if (idx !== -1) {
+        const m = markers[idx];
+        if (m.infoWindow) m.infoWindow.close();
+        if (m._pulseOverlay) m._pulseOverlay.setMap(null);
+        m.setMap(null);
+        markers.splice(idx, 1);
+    }
+    labelOverlays = labelOverlays.filter(o => {
+        if (o._subId !== id) return true;
+        o.setMap(null);
+        return false;
+    });
+}
+
 function showRefreshIndicator(show) {
     const el = document.getElementById('refreshIndicator');
     if (el) el.classList.toggle('active', show);
@@ -523,7 +779,8 @@ function toggleFullscreen() {
 // MANUAL REFRESH
 // =============================================================================
 function manualRefresh() {
-    loadSubmissions();
+    if (inClusterMode() && !isInitialLoad) loadClusters();
+    else loadSubmissions();
 }
 
 // =============================================================================
@@ -0,0 +1,1942 @@
+"""
+Storage backends for crowd_data.
+
+JsonFileStore keeps the original layout (one JSON file per record under
+crowd_data/), SqliteStore keeps the same records in a single WAL-mode
+database. app.py only talks to the SubmissionStore interface, so the backend
+can be switched with the STORAGE_BACKEND environment variable.
+"""
+import os
+import re
+import json
+import bisect
+import secrets
+import sqlite3
+import threading
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from geo import GridIndex, in_bbox
+
+try:
+    import fcntl
+except ImportError:   # Windows: the per-process lock still applies
+    fcntl = None
+
+
+CRITICAL_DEPTH_CM = 100   # deeper reports count as critical in the admin stats
+CHANGE_LOG_KEEP = 10000   # submission changes retained for changes_since()
+JOURNAL_CHECKPOINT_BYTES = 4 * 1024 * 1024   # journal size that triggers a checkpoint
+LOCK_STRIPES = 64         # per-submission locks are striped over this many lock files
+# Repeated strings stored once per segment file and referenced by number
+INTERNED_FIELDS = ('user_agent', 'zone', 'street', 'vehicle_type', 'verification_status', 'thumbnail_status')
+SEGMENT_COMPACT_MIN = 256   # superseded segment lines tolerated before a rewrite
+
+def gps_of(submission):
+    """Return (lat, lon) for a submission, or (None, None) when not geotagged"""
+    gps = submission.get('gps') or {}
+    if gps.get('lat') and gps.get('lon'):
+        return gps['lat'], gps['lon']
+    return None, None
+
+def normalize_phone(phone):
+    """Digits only, keeping the last 10 so +91 / leading-0 variants match"""
+    digits = ''.join(c for c in str(phone or '') if c.isdigit())
+    return digits[-10:]
+
+def time_key(submission):
+    """Sort key for received_at order; also the position encoded in list cursors"""
+    return (submission.get('received_at') or '', submission['id'])
+
+def segment_day(submission):
+    """Name of the segment file a submission is packed into: its received_at date"""
+    day = (submission.get('received_at') or '')[:10]
+    if len(day) == 10 and day[4] == day[7] == '-' and (day[:4] + day[5:7] + day[8:]).isdigit():
+        return day
+    return 'undated'
+
+# Ids and media files are named after their creation time: 20261017_101500_ab12cd34,
+# img_20261017_101500_ab12cd34.jpg, news_20261017_101500_ab12cd34.json, ...
+DATED_NAME = re.compile(r'(?:^|_)(\d{4})(\d{2})(\d{2})_\d{6}_')
+
+def date_shard(name):
+    """'YYYY/MM/DD' directory a dated file name belongs in, or None if it carries no date"""
+    match = DATED_NAME.search(name)
+    return '/'.join(match.groups()) if match else None
+
+def shard_path(directory, name):
+    """Where name is stored under a date-sharded directory, found without a scan"""
+    shard = date_shard(name)
+    return Path(directory) / shard / name if shard else Path(directory) / name
+
+def find_file(directory, name):
+    """Existing path of name in directory, sharded or still flat; None if missing"""
+    for path in (shard_path(directory, name), Path(directory) / name):
+        if path.exists():
+            return path
+    return None
+
+def iter_files(directory, suffix=''):
+    """DirEntry of every file in directory and its shards, skipping hidden and temp files"""
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_files(entry.path, suffix)
+            elif entry.name.endswith(suffix):
+                yield entry
+
+def shard_directory(directory, move=os.rename):
+    """Move the dated files left at the top of directory into their shards; returns how many moved.
+
+    move(src, dst) does the move, so a store can take its own locks; a file
+    whose shard already holds a copy is left for move to resolve.
+    """
+    directory = Path(directory)
+    moved = 0
+    with os.scandir(directory) as entries:
+        names = [e.name for e in entries if e.is_file() and not e.name.startswith('.')]
+    for name in names:
+        target = shard_path(directory, name)
+        if target.parent == directory:
+            continue   # undated; stays flat
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if move(directory / name, target) is not False:
+            moved += 1
+    for shard in {shard_path(directory, n).parent for n in names} | {directory}:
+        Journal._fsync_path(shard)   # make the renames durable
+    return moved
+
+def submission_matches(submission, status=None, zone=None, since=None, until=None,
+                       geotagged=False, bbox=None):
+    """Python version of the filters SqliteStore applies in SQL"""
+    if status and submission.get('verification_status', 'pending') != status:
+        return False
+    if zone and submission.get('zone', '') != zone:
+        return False
+    received_at = submission.get('received_at') or ''
+    if since and received_at < since:
+        return False
+    if until and received_at > until:
+        return False
+    if geotagged or bbox:
+        lat, lon = gps_of(submission)
+        if lat is None:
+            return False
+        if bbox and not in_bbox(lat, lon, bbox):
+            return False
+    return True
+
+
+class SubmissionStore:
+    """Interface implemented by every storage backend.
+
+    Submissions, volunteers, intel and scraped news are plain dicts with an
+    'id' key, exactly as they are serialised to JSON.
+    """
+
+    def __init__(self):
+        self._listeners = []
+        self.on_scan = None   # on_scan(op, rows): how many records an operation went through
+
+    def _scanned(self, op, rows):
+        if self.on_scan:
+            try:
+                self.on_scan(op, rows)
+            except Exception as e:
+                print(f"Store scan hook error: {e}")
+
+    def subscribe(self, listener):
+        """Keep an in-memory view (clusters, rollups, ...) in sync with the submissions.
+
+        listener.reset(submissions) is called now and whenever the backend
+        cannot tell what changed; listener.apply(old, new) is called for every
+        saved (old is None for new ids) or deleted (new is None) submission,
+        including changes picked up from other worker processes.
+        """
+        self._listeners.append(listener)
+        listener.reset(self.iter_submissions())
+
+    def refresh(self):
+        """Pick up submissions changed by other worker processes"""
+
+    def _notify(self, old, new, listeners=None):
+        for listener in self._listeners if listeners is None else listeners:
+            try:
+                listener.apply(old, new)
+            except Exception as e:
+                print(f"Store listener error: {e}")
+
+    def _reset_listeners(self, listeners=None, submissions=None):
+        for listener in self._listeners if listeners is None else listeners:
+            try:
+                listener.reset(self.iter_submissions() if submissions is None else submissions)
+            except Exception as e:
+                print(f"Store listener reset error: {e}")
+
+    # Submissions
+    def get_submission(self, submission_id):
+        raise NotImplementedError
+
+    def save_submission(self, submission):
+        raise NotImplementedError
+
+    def delete_submission(self, submission_id):
+        """Delete a submission, returning True if it existed"""
+        raise NotImplementedError
+
+    def update_submission(self, submission_id, update):
+        """Read-modify-write a submission under its lock, so concurrent updates are not lost.
+
+        update(submission) gets a copy of the stored record and returns the
+        record to save, or None to leave it as it is. Returns (old, new);
+        new is None if nothing was saved and old is None if there is no
+        such submission.
+        """
+        raise NotImplementedError
+
+    def list_submissions(self, status=None, zone=None, since=None, until=None,
+                         geotagged=False, bbox=None, newest_first=True, limit=None, after=None):
+        """Filtered submissions ordered by (received_at, id).
+
+        since/until are ISO timestamps compared against received_at and bbox
+        is a (minLon, minLat, maxLon, maxLat) tuple; a bbox implies geotagged.
+        after is a time_key() of the last item of the previous page; only
+        items past it in the requested order are returned.
+        """
+        raise NotImplementedError
+
+    def count_submissions(self, status=None, zone=None, since=None, until=None):
+        raise NotImplementedError
+
+    def submission_counts(self):
+        """Totals for the admin stats: all, per verification status and critical"""
+        raise NotImplementedError
+
+    def iter_submissions(self):
+        """Yield every submission in no particular order"""
+        raise NotImplementedError
+
+    def scan_submissions(self, status=None, zone=None, since=None, until=None, batch_size=500):
+        """Yield filtered submissions oldest first, fetching batch_size at a time.
+
+        Each batch resumes from the last key of the previous one, so memory
+        stays flat and no connection or lock is held between batches.
+        """
+        after = None
+        while True:
+            batch = self.list_submissions(status=status, zone=zone, since=since, until=until,
+                                          newest_first=False, limit=batch_size, after=after)
+            yield from batch
+            if len(batch) < batch_size:
+                return
+            after = time_key(batch[-1])
+
+    def get_submissions(self, submission_ids):
+        """Map of id -> submission for the ids that exist"""
+        records = ((i, self.get_submission(i)) for i in submission_ids)
+        return {i: record for i, record in records if record is not None}
+
+    # Change feed
+    def change_seq(self):
+        """Sequence number of the latest submission save or delete (0 before any)"""
+        raise NotImplementedError
+
+    def _change_entries(self, since, limit):
+        """Up to limit (seq, op, id) log entries after since, plus the oldest
+        retained seq and the latest seq; op is 'put' or 'del'"""
+        raise NotImplementedError
+
+    def changes_since(self, since, limit=500):
+        """Submissions saved or deleted after change sequence number since.
+
+        Returns {'seq', 'reset', 'more', 'saved', 'deleted'}: the latest
+        state of every changed submission, the ids deleted, and the seq to
+        pass next time. reset is True when since is older than the retained
+        log (or from before the log was recreated); the caller has to reload
+        everything and continue from the returned seq.
+        """
+        entries, oldest, latest = self._change_entries(since, limit + 1)
+        if since < oldest - 1 or since > latest:
+            return {'seq': latest, 'reset': True, 'more': False, 'saved': [], 'deleted': []}
+        more = len(entries) > limit
+        entries = entries[:limit]
+        ops = {}   # id -> last op, in order of the last change
+        for _, op, submission_id in entries:
+            ops.pop(submission_id, None)
+            ops[submission_id] = op
+        records = self.get_submissions([i for i, op in ops.items() if op == 'put'])
+        return {
+            'seq': entries[-1][0] if entries else since,
+            'reset': False,
+            'more': more,
+            # A put whose record is gone was deleted by a change past this page
+            'saved': [records[i] for i in ops if i in records],
+            'deleted': [i for i in ops if i not in records],
+        }
+
+    # Volunteers
+    def save_volunteer(self, volunteer):
+        raise NotImplementedError
+
+    def register_volunteer(self, volunteer):
+        """Save a new volunteer unless the phone is taken.
+
+        Returns None on success, or the already registered volunteer whose
+        normalize_phone() matches; the check and the write are atomic.
+        """
+        raise NotImplementedError
+
+    def list_volunteers(self):
+        raise NotImplementedError
+
+    def find_volunteer_by_phone(self, phone):
+        """Look up a volunteer by any formatting of their phone number"""
+        raise NotImplementedError
+
+    # X intelligence
+    def save_intel(self, intel):
+        """Store an intel record and return a reference to where it was saved"""
+        raise NotImplementedError
+
+    # Scraped news
+    def save_news(self, record):
+        raise NotImplementedError
+
+    def list_news(self):
+        raise NotImplementedError
+
+    def delete_news(self, news_id):
+        """Delete a news record, returning True if it existed"""
+        raise NotImplementedError
+
+
+# =============================================================================
+# JSON FILE BACKEND
+# =============================================================================
+
+class FileSource:
+    """Submissions stored as one JSON file each, the original layout.
+
+    Files sit in date shards (submissions/2026/10/17/<id>.json) or, if
+    written before sharding and not migrated yet, at the top of the directory;
+    when both exist the sharded copy wins.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self._mtimes = {}   # id -> st_mtime_ns of the JSON file
+        self.listed = 0     # files the last sync() went through
+
+    def mark(self, submission_id, path):
+        """Note a file this process just wrote, so sync() does not read it back"""
+        self._mtimes[submission_id] = Path(path).stat().st_mtime_ns
+
+    def read(self, submission_id):
+        path = find_file(self.directory, f'{submission_id}.json')
+        if path is None:
+            return None
+        try:
+            mtime = path.stat().st_mtime_ns
+            with open(path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._mtimes[submission_id] = mtime
+        return record
+
+    def changed(self, submission_ids):
+        """(records, removed ids) among submission_ids, reading only the files that changed"""
+        records, removed = [], []
+        for submission_id in submission_ids:
+            path = find_file(self.directory, f'{submission_id}.json')
+            try:
+                mtime = path.stat().st_mtime_ns if path else None
+            except FileNotFoundError:
+                mtime = None
+            if mtime is None:
+                if self._mtimes.pop(submission_id, None) is not None:
+                    removed.append(submission_id)
+                continue
+            if self._mtimes.get(submission_id) == mtime:
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    records.append(json.load(f))
+                self._mtimes[submission_id] = mtime
+            except (OSError, ValueError) as e:
+                print(f"Index load error for {submission_id}.json: {e}")
+        self.listed = len(submission_ids)
+        return records, removed
+
+    def sync(self):
+        """(records, removed ids) for files whose mtime changed since the last call"""
+        found = {}   # id -> (path, mtime)
+        flat = str(self.directory)
+        for entry in iter_files(self.directory, '.json'):
+            submission_id = entry.name[:-5]
+            if submission_id in found and os.path.dirname(entry.path) == flat:
+                continue   # a migrated copy exists
+            try:
+                found[submission_id] = (entry.path, entry.stat().st_mtime_ns)
+            except FileNotFoundError:
+                continue
+        self.listed = len(found)
+        removed = [i for i in self._mtimes if i not in found]
+        for submission_id in removed:
+            del self._mtimes[submission_id]
+        records = []
+        for submission_id, (path, mtime) in found.items():
+            if self._mtimes.get(submission_id) == mtime:
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    records.append(json.load(f))
+                self._mtimes[submission_id] = mtime
+            except (OSError, ValueError) as e:
+                print(f"Index load error for {submission_id}.json: {e}")
+        return records, removed
+
+
+class SubmissionIndex:
+    """Process-wide cache of submission records keyed by submission id.
+
+    Every worker keeps the parsed submissions in memory instead of re-reading
+    the whole directory per request. Writers append to the ChangeLog; other
+    gunicorn workers read the entries past the last seq they applied and
+    re-read only those ids from each source (FileSource, SegmentSource). The
+    whole tree is walked only at startup and when those entries have been
+    pruned from the log. When an id is in more than one source, the later
+    source in the list wins. Geotagged records are also bucketed into
+    a GridIndex, the ids are kept in received_at order and per-status counts
+    are maintained, so bbox, time window, paging and counting queries avoid
+    a full scan.
+    """
+
+    def __init__(self, sources, changes, on_change=None, on_scan=None):
+        self.sources = list(sources)
+        self.changes = changes
+        self.on_change = on_change   # on_change(old, new) after every record change
+        self.on_scan = on_scan       # on_scan(op, rows) after every sync and query
+        self._lock = threading.RLock()
+        self._records = {}   # id -> submission dict
+        self._owner = {}     # id -> position in sources of the record's source
+        self._stamp = None   # (mtime, size) of the change log when last read
+        self._seq = None     # latest change log entry applied; None before the first sync
+        self.grid = GridIndex()
+        self._by_time = []   # sorted time_key()s; rebuilt after bulk loads
+        self._by_time_dirty = True
+        self._status_counts = Counter()
+        self._critical = 0
+
+    def _current_stamp(self):
+        try:
+            st = self.changes.path.stat()
+            return st.st_mtime_ns, st.st_size
+        except FileNotFoundError:
+            return None
+
+    def _apply(self, rank, records, removed):
+        if len(records) + len(removed) > 64:
+            # Cheaper to re-sort once than to insert each key
+            self._by_time_dirty = True
+        for record in records:
+            if self._owner.get(record['id'], rank) <= rank:
+                self._set(record, rank)
+        for submission_id in removed:
+            if self._owner.get(submission_id) == rank:
+                self._fall_back(submission_id, rank)
+
+    def _sync(self):
+        """Apply the changes logged since the last sync, or everything in each source at first"""
+        stamp = self._current_stamp()   # taken first: a change logged meanwhile is seen next time
+        if stamp == self._stamp and self._seq is not None:
+            return
+        if self._seq is not None:
+            entries, oldest, latest = self.changes.after(self._seq, 2 * CHANGE_LOG_KEEP + 1)
+            if oldest - 1 <= self._seq <= latest:
+                if entries:
+                    ids = list(dict.fromkeys(submission_id for _, _, submission_id in entries))
+                    for rank, source in enumerate(self.sources):
+                        self._apply(rank, *source.changed(ids))
+                    self._seq = entries[-1][0]
+                    self._scanned_sources()
+                self._stamp = stamp
+                return
+        # First sync, or the entries since the last one were pruned (or the log recreated)
+        latest = self.changes.latest()
+        for rank, source in enumerate(self.sources):
+            self._apply(rank, *source.sync())
+        self._seq, self._stamp = latest, stamp
+        self._scanned_sources()
+
+    def _scanned_sources(self):
+        if self.on_scan:
+            self.on_scan('sync', sum(getattr(source, 'listed', 0) for source in self.sources))
+
+    def _fall_back(self, submission_id, rank):
+        """Drop an id its source no longer has, unless an earlier source still does"""
+        for lower in range(rank - 1, -1, -1):
+            read = getattr(self.sources[lower], 'read', None)
+            record = read(submission_id) if read else None
+            if record is not None:
+                self._set(record, lower)
+                return
+        self._drop(submission_id)
+
+    def _count(self, submission, delta):
+        self._status_counts[submission.get('verification_status', 'pending')] += delta
+        if (submission.get('flood_depth_cm') or 0) > CRITICAL_DEPTH_CM:
+            self._critical += delta
+
+    def _unsort(self, submission):
+        if not self._by_time_dirty:
+            key = time_key(submission)
+            i = bisect.bisect_left(self._by_time, key)
+            if i < len(self._by_time) and self._by_time[i] == key:
+                del self._by_time[i]
+
+    def _set(self, submission, rank):
+        submission_id = submission['id']
+        old = self._records.get(submission_id)
+        self._records[submission_id] = submission
+        self._owner[submission_id] = rank
+        lat, lon = gps_of(submission)
+        if lat is None:
+            self.grid.remove(submission_id)
+        else:
+            self.grid.add(submission_id, lat, lon)
+        if old is not None:
+            self._count(old, -1)
+            self._unsort(old)
+        self._count(submission, 1)
+        if not self._by_time_dirty:
+            bisect.insort(self._by_time, time_key(submission))
+        if self.on_change:
+            self.on_change(old, submission)
+
+    def _drop(self, submission_id):
+        old = self._records.pop(submission_id, None)
+        self._owner.pop(submission_id, None)
+        self.grid.remove(submission_id)
+        if old is None:
+            return
+        self._count(old, -1)
+        self._unsort(old)
+        if self.on_change:
+            self.on_change(old, None)
+
+    def refresh(self):
+        with self._lock:
+            self._sync()
+
+    def get(self, submission_id):
+        with self._lock:
+            self._sync()
+            return self._records.get(submission_id)
+
+    def values(self):
+        with self._lock:
+            self._sync()
+            if self.on_scan:
+                self.on_scan('all', len(self._records))
+            return list(self._records.values())
+
+    def source_of(self, submission_id):
+        with self._lock:
+            self._sync()
+            rank = self._owner.get(submission_id)
+            return None if rank is None else self.sources[rank]
+
+    def in_bbox(self, bbox):
+        """Submissions whose GPS point lies inside bbox"""
+        with self._lock:
+            self._sync()
+            candidates = self.grid.query(bbox)
+            if self.on_scan:
+                self.on_scan('bbox', len(candidates))
+            records = (self._records.get(i) for i in candidates)
+            return [r for r in records if r is not None and in_bbox(*gps_of(r), bbox)]
+
+    def _sorted_keys(self):
+        if self._by_time_dirty:
+            self._by_time = sorted(time_key(r) for r in self._records.values())
+            self._by_time_dirty = False
+        return self._by_time
+
+    def in_window(self, since=None, until=None):
+        """Submissions with since <= received_at <= until"""
+        with self._lock:
+            self._sync()
+            self._sorted_keys()
+            lo = bisect.bisect_left(self._by_time, (since,)) if since else 0
+            hi = bisect.bisect_right(self._by_time, (until, '\uffff')) if until else len(self._by_time)
+            return [self._records[i] for _, i in self._by_time[lo:hi]]
+
+    def page(self, newest_first=True, after=None, since=None, until=None, predicate=None, limit=None):
+        """Walk submissions in received_at order from a cursor, stopping after limit matches"""
+        with self._lock:
+            self._sync()
+            keys = self._sorted_keys()
+            # Index range [lo, hi) allowed by the time window and the cursor
+            lo = bisect.bisect_left(keys, (since,)) if since else 0
+            hi = bisect.bisect_right(keys, (until, '\uffff')) if until else len(keys)
+            if after and newest_first:
+                hi = min(hi, bisect.bisect_left(keys, tuple(after)))
+            elif after:
+                lo = max(lo, bisect.bisect_right(keys, tuple(after)))
+            positions = range(hi - 1, lo - 1, -1) if newest_first else range(lo, hi)
+            items = []
+            examined = 0
+            for i in positions:
+                examined += 1
+                record = self._records[keys[i][1]]
+                if predicate is None or predicate(record):
+                    items.append(record)
+                    if limit and len(items) >= limit:
+                        break
+            if self.on_scan:
+                self.on_scan('page', examined)
+            return items
+
+    def counts(self):
+        with self._lock:
+            self._sync()
+            counts = {status: n for status, n in self._status_counts.items() if n}
+            counts['all'] = len(self._records)
+            counts['critical'] = self._critical
+            return counts
+
+    def _logged(self, seq):
+        # Our own change needs no re-read, unless another process logged one before it
+        if self._seq is not None and seq == self._seq + 1:
+            self._seq = seq
+
+    def put(self, submission, source):
+        """Record a submission this process just wrote to source"""
+        with self._lock:
+            self._set(submission, self.sources.index(source))
+            self._logged(self.changes.append('put', submission['id']))
+
+    def remove(self, submission_id):
+        with self._lock:
+            self._drop(submission_id)
+            self._logged(self.changes.append('del', submission_id))
+
+
+class ChangeLog:
+    """Append-only log of submission changes shared by the JSON store's workers.
+
+    Each line is "<seq> <op> <id>" with op 'put' or 'del'. Appends hold an
+    flock so sequence numbers are unique across processes, and every process
+    tails the file into memory. Once it holds twice CHANGE_LOG_KEEP entries
+    the log is rewritten with only the newest CHANGE_LOG_KEEP; the random
+    header line of each rewrite tells tailing processes to start over.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        self._entries = []   # (seq, op, id), oldest first
+        self._offset = 0     # bytes of the file already in _entries
+        self._header = None
+
+    @contextmanager
+    def _exclusive(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.path.with_name(f'{self.path.name}.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _tail(self):
+        """Read lines appended since the last call; start over if the file was replaced"""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            self._entries, self._offset, self._header = [], 0, None
+            return
+        with f:
+            header = f.readline()
+            if not header.endswith(b'\n'):
+                return   # still being created
+            if header != self._header:
+                self._entries, self._offset, self._header = [], len(header), header
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1   # a line still being written is picked up next time
+        for line in data[:end].decode('utf-8').splitlines():
+            try:
+                seq, op, submission_id = line.split(' ', 2)
+                self._entries.append((int(seq), op, submission_id))
+            except ValueError:
+                print(f"Change log: skipping malformed line {line!r}")
+        self._offset += end
+
+    def _rewrite(self, entries):
+        tmp = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(f'# {secrets.token_hex(8)}\n')
+            f.writelines(f'{seq} {op} {i}\n' for seq, op, i in entries)
+        os.replace(tmp, self.path)
+        self._tail()
+
+    def append(self, op, submission_id):
+        """Record a change and return its sequence number"""
+        with self._exclusive():
+            self._tail()
+            if self._header is None:
+                self._rewrite([])
+            seq = self._entries[-1][0] + 1 if self._entries else 1
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(f'{seq} {op} {submission_id}\n')
+            self._tail()
+            if len(self._entries) > 2 * CHANGE_LOG_KEEP:
+                self._rewrite(self._entries[-CHANGE_LOG_KEEP:])
+            return seq
+
+    def latest(self):
+        with self._lock:
+            self._tail()
+            return self._entries[-1][0] if self._entries else 0
+
+    def after(self, since, limit):
+        """(entries, oldest, latest) as SubmissionStore._change_entries() returns them"""
+        with self._lock:
+            self._tail()
+            latest = self._entries[-1][0] if self._entries else 0
+            oldest = self._entries[0][0] if self._entries else latest + 1
+            i = bisect.bisect_left(self._entries, (since + 1,))
+            return self._entries[i:i + limit], oldest, latest
+
+
+class GroupCommit:
+    """Shares one fsync between every writer waiting for one.
+
+    A writer takes a ticket once its write is done and passes it to wait();
+    the first waiter runs sync() on behalf of everyone who wrote before it
+    started and the others sleep until a sync covering their ticket is done.
+    """
+
+    def __init__(self, sync):
+        self.sync = sync
+        self._cond = threading.Condition()
+        self._written = 0   # tickets handed out
+        self._synced = 0    # tickets known to be on disk
+        self._syncing = False
+
+    def ticket(self):
+        with self._cond:
+            self._written += 1
+            return self._written
+
+    def wait(self, ticket):
+        with self._cond:
+            while self._synced < ticket:
+                if self._syncing:
+                    self._cond.wait()
+                    continue
+                self._syncing = True
+                target = self._written
+                self._cond.release()
+                try:
+                    self.sync()
+                finally:
+                    self._cond.acquire()
+                    self._syncing = False
+                    self._cond.notify_all()
+                self._synced = max(self._synced, target)
+
+
+class Journal:
+    """Write-ahead journal that makes JsonFileStore writes atomic and durable.
+
+    write() appends the record to the journal, waits for an fsync shared
+    with every write that arrived in the meantime (group commit) and only
+    then replaces the target through a temp file and a rename, so readers
+    never see a partial file and a crash can always be redone from the
+    journal. Writers hold a shared flock; checkpoint() takes it exclusively,
+    fsyncs the files the journal covers and empties it. replay() redoes
+    whatever is in the journal and runs when the store opens.
+    """
+
+    def __init__(self, path, root, fsync=True, checkpoint_bytes=JOURNAL_CHECKPOINT_BYTES):
+        self.path = Path(path)
+        self.root = Path(root)
+        self.fsync = fsync
+        self.checkpoint_bytes = checkpoint_bytes
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._commits = GroupCommit(lambda: os.fsync(self._fd))
+        self._local = threading.RLock()   # stands in for flock where there is none
+
+    @contextmanager
+    def _flock(self, exclusive=False):
+        # A fresh descriptor per holder, so threads of one process exclude each other too
+        if fcntl is None:
+            with self._local:
+                yield
+            return
+        with open(self.path.with_name(f'{self.path.name}.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _append(self, entry):
+        """Append an entry and return once it is on disk"""
+        os.write(self._fd, (json.dumps(entry, separators=(',', ':')) + '\n').encode('utf-8'))
+        if self.fsync:
+            self._commits.wait(self._commits.ticket())
+
+    @staticmethod
+    def _replace(path, record, fsync=False):
+        tmp = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            f = open(tmp, 'w', encoding='utf-8')
+        except FileNotFoundError:
+            path.parent.mkdir(parents=True, exist_ok=True)   # first record of a new shard
+            f = open(tmp, 'w', encoding='utf-8')
+        with f:
+            json.dump(record, f, indent=2)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def write(self, path, record):
+        path = Path(path)
+        with self._flock():
+            self._append({'op': 'put', 'path': path.relative_to(self.root).as_posix(), 'record': record})
+            self._replace(path, record)
+        self._maybe_checkpoint()
+
+    def delete(self, path):
+        """Remove a record file, returning True if it existed"""
+        path = Path(path)
+        if not path.exists():
+            return False
+        with self._flock():
+            self._append({'op': 'del', 'path': path.relative_to(self.root).as_posix()})
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                return False
+        self._maybe_checkpoint()
+        return True
+
+    def _entries(self):
+        """Latest journal entry per path"""
+        latest = {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue   # torn by a crash mid-append; it was never acknowledged
+                latest.pop(entry['path'], None)
+                latest[entry['path']] = entry
+        return latest
+
+    @staticmethod
+    def _fsync_path(path, flags=os.O_RDONLY):
+        try:
+            fd = os.open(path, flags)
+        except FileNotFoundError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _truncate(self, paths):
+        for directory in {(self.root / p).parent for p in paths}:
+            self._fsync_path(directory)
+        os.ftruncate(self._fd, 0)
+
+    def _maybe_checkpoint(self):
+        if os.fstat(self._fd).st_size >= self.checkpoint_bytes:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Make the files written so far durable and empty the journal"""
+        with self._flock(exclusive=True):
+            latest = self._entries()
+            for rel, entry in latest.items():
+                if entry['op'] == 'put':
+                    self._fsync_path(self.root / rel)
+            self._truncate(latest)
+
+    def replay(self):
+        """Redo the journal after a crash; returns the relative paths that had to be fixed"""
+        fixed = []
+        with self._flock(exclusive=True):
+            latest = self._entries()
+            for rel, entry in latest.items():
+                path = self.root / rel
+                if entry['op'] == 'del':
+                    if path.exists():
+                        path.unlink()
+                        fixed.append(rel)
+                    continue
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        if json.load(f) == entry['record']:
+                            self._fsync_path(path)
+                            continue
+                except (OSError, ValueError):
+                    pass   # missing or truncated
+                self._replace(path, entry['record'], fsync=True)
+                fixed.append(rel)
+            self._truncate(latest)
+        return fixed
+
+
+class Segment:
+    """One day of submissions packed into a single append-only file.
+
+    Every line is a minified JSON array:
+
+        ["h", token]         header; a new token means the file was rewritten
+        ["s", n, string]     defines string number n of this segment
+        ["p", record]        a saved submission; INTERNED_FIELDS hold string numbers
+        ["d", id]            a deleted submission
+
+    A later line for an id supersedes earlier ones. SegmentSource holds the
+    lock while lines are appended; a line torn by a crash is skipped.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._stat = None
+        self._reset()
+        self.pending = {}   # id -> record, or None once deleted, read since the last sync
+
+    def _reset(self):
+        self._header = None
+        self._offset = 0
+        self._strings = []
+        self._string_ids = {}
+        self.live = set()
+        self.lines = 0      # record lines; those beyond len(live) are superseded
+
+    def tail(self):
+        """Read lines appended since the last call into pending"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            for submission_id in self.live:
+                self.pending[submission_id] = None
+            self._reset()
+            self._stat = None
+            return
+        stat = (st.st_ino, st.st_size, st.st_mtime_ns)
+        if stat == self._stat:
+            return
+        with open(self.path, 'rb') as f:
+            header = f.readline()
+            if not header.endswith(b'\n'):
+                return   # still being created
+            if header != self._header:
+                # Rewritten: read it again from the top
+                gone = self.live
+                self._reset()
+                self._header, self._offset = header, len(header)
+                for submission_id in gone:
+                    self.pending[submission_id] = None
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            try:
+                self._apply(json.loads(line))
+            except (ValueError, LookupError, TypeError):
+                print(f"Segment {self.path.name}: skipping malformed line")
+        self._offset += end
+        self._stat = stat if end == len(data) else None
+
+    def _apply(self, entry):
+        kind = entry[0]
+        if kind == 's':
+            n, value = entry[1], entry[2]
+            self._strings.extend([None] * (n + 1 - len(self._strings)))
+            self._strings[n] = value
+            self._string_ids[value] = n
+        elif kind == 'p':
+            record = entry[1]
+            for field in INTERNED_FIELDS:
+                value = record.get(field)
+                if isinstance(value, int) and not isinstance(value, bool):
+                    record[field] = self._strings[value]
+                elif isinstance(value, dict):
+                    record[field] = value.get('=')
+            self.live.add(record['id'])
+            self.lines += 1
+            self.pending[record['id']] = record
+        elif kind == 'd':
+            self.live.discard(entry[1])
+            self.lines += 1
+            self.pending[entry[1]] = None
+
+    def _encode(self, record):
+        """Lines saving record, defining any string the segment does not have yet"""
+        lines = []
+        record = dict(record)
+        for field in INTERNED_FIELDS:
+            value = record.get(field)
+            if isinstance(value, str):
+                n = self._string_ids.get(value)
+                if n is None:
+                    n = self._string_ids[value] = len(self._strings)
+                    self._strings.append(value)
+                    lines.append(['s', n, value])
+                record[field] = n
+            elif value is not None:
+                record[field] = {'=': value}   # not a string; stored as is
+        lines.append(['p', record])
+        return lines
+
+    @staticmethod
+    def _dump(lines):
+        return ''.join(json.dumps(line, ensure_ascii=False, separators=(',', ':')) + '\n'
+                       for line in lines).encode('utf-8')
+
+    def _rewrite(self, lines):
+        tmp = self.path.with_name(f'.{self.path.name}.{os.getpid()}.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(self._dump([['h', secrets.token_hex(8)]] + lines))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def append(self, saved=(), deleted=()):
+        """Append saves and deletes; the caller holds SegmentSource's lock"""
+        self.tail()
+        if self._header is None:
+            self._rewrite([])   # new file, or one whose creation was torn
+            self.tail()
+        strings = len(self._strings)
+        try:
+            lines = [line for record in saved for line in self._encode(record)]
+            lines += [['d', submission_id] for submission_id in deleted]
+            data = self._dump(lines)
+            with open(self.path, 'ab') as f:
+                if f.seek(0, os.SEEK_END) > self._offset:
+                    data = b'\n' + data   # terminate a line torn by a crash
+                f.write(data)
+        except Exception:
+            for value in self._strings[strings:]:
+                del self._string_ids[value]
+            del self._strings[strings:]
+            raise
+        self.tail()
+        # Our own changes are applied by the writer, not picked up by sync()
+        for submission_id in [r['id'] for r in saved] + list(deleted):
+            self.pending.pop(submission_id, None)
+
+    def compact(self):
+        """Rewrite with only the live records; the caller holds SegmentSource's lock"""
+        self.tail()
+        fresh = Segment(self.path)
+        fresh.tail()
+        records = [r for r in fresh.pending.values() if r is not None]
+        pending = self.pending
+        if not records:
+            self.path.unlink()
+        else:
+            fresh._reset()
+            self._rewrite([line for record in records for line in fresh._encode(record)])
+        self.tail()
+        self.pending = pending   # same records as before, nothing for sync() to report
+
+    def fsync(self):
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return   # compacted away; the rewrite was fsynced
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class SegmentSource:
+    """Submissions packed into one Segment file per received_at day.
+
+    Replaces hundreds of thousands of small files with a few hundred, and
+    stores minified JSON with user agents, zones and other repeated strings
+    interned per segment. Appends are fsynced before save returns, with one
+    fsync shared by concurrent writers; a segment is rewritten once its
+    superseded lines outnumber the live ones.
+    """
+
+    def __init__(self, directory, fsync=True):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.fsync = fsync
+        self._segments = {}   # file name -> Segment
+        self._lock = threading.RLock()
+        self._commits = {}    # file name -> GroupCommit
+        self.listed = 0       # records the last sync() read
+
+    @contextmanager
+    def _exclusive(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.directory / '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _segment(self, name):
+        segment = self._segments.get(name)
+        if segment is None:
+            segment = self._segments[name] = Segment(self.directory / name)
+            self._commits[name] = GroupCommit(segment.fsync)
+        return segment
+
+    def sync(self):
+        """(records, removed ids) appended by other processes since the last call"""
+        with self._lock:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.seg'):
+                        self._segment(entry.name)
+            changes = {}
+            for name, segment in list(self._segments.items()):
+                segment.tail()
+                changes.update(segment.pending)
+                segment.pending = {}
+                if segment._stat is None and not segment.live:
+                    del self._segments[name]   # file removed
+            self.listed = len(changes)
+            return ([r for r in changes.values() if r is not None],
+                    [i for i, r in changes.items() if r is None])
+
+    def changed(self, submission_ids):
+        # Tailing the segments only reads what was appended to them
+        return self.sync()
+
+    def _write(self, day, saved=(), deleted=()):
+        name = f'{day}.seg'
+        with self._exclusive():
+            segment = self._segment(name)
+            segment.append(saved, deleted)
+            commits = self._commits[name]
+            ticket = commits.ticket()
+            compact = segment.lines - len(segment.live) > max(SEGMENT_COMPACT_MIN, len(segment.live))
+        if self.fsync:
+            commits.wait(ticket)
+        if compact:
+            self.compact(day)
+
+    def put(self, submission, old=None):
+        """Save a submission; old is its previous version, if any"""
+        if old is not None and segment_day(old) != segment_day(submission):
+            self._write(segment_day(old), deleted=[old['id']])
+        self._write(segment_day(submission), saved=[submission])
+
+    def delete(self, submission):
+        self._write(segment_day(submission), deleted=[submission['id']])
+
+    def compact(self, day=None):
+        """Rewrite one day's segment (or all of them) without superseded lines"""
+        with self._exclusive():
+            names = [f'{day}.seg'] if day else [n for n in os.listdir(self.directory) if n.endswith('.seg')]
+            for name in names:
+                self._segment(name).compact()
+
+
+class PhoneIndex:
+    """Persistent normalized phone -> volunteer id map for the JSON backend.
+
+    Stored as one JSON file next to the volunteers directory and rebuilt from
+    the volunteer files if it is missing. Workers reload it when its mtime
+    changes; registrations take an flock so two workers cannot claim the
+    same phone.
+    """
+
+    def __init__(self, path, volunteers_dir):
+        self.path = Path(path)
+        self.volunteers_dir = Path(volunteers_dir)
+        self._lock = threading.RLock()
+        self._phones = {}
+        self._stamp = None
+        self._depth = 0
+
+    @contextmanager
+    def _exclusive(self):
+        with self._lock:
+            if fcntl is None or self._depth:
+                # flock is per open file, so re-entering would deadlock on ourselves
+                self._depth += 1
+                try:
+                    yield
+                finally:
+                    self._depth -= 1
+                return
+            with open(self.path.with_suffix('.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._depth = 1
+                try:
+                    yield
+                finally:
+                    self._depth = 0
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self):
+        try:
+            stamp = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            with self._exclusive():
+                if not self.path.exists():
+                    self._rebuild()
+                    return
+            stamp = self.path.stat().st_mtime_ns
+        if stamp == self._stamp:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._phones = json.load(f)
+            self._stamp = stamp
+        except (OSError, ValueError) as e:
+            print(f"Phone index load error: {e}")
+            with self._exclusive():
+                self._rebuild()
+
+    def _rebuild(self):
+        # Oldest registration wins when legacy data already has duplicates
+        phones = {}
+        volunteers = []
+        for entry in os.scandir(self.volunteers_dir):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                with open(entry.path, 'r', encoding='utf-8') as f:
+                    volunteers.append(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"Phone index load error for {entry.name}: {e}")
+        for vol in sorted(volunteers, key=lambda v: v.get('registered_at') or ''):
+            key = normalize_phone(vol.get('phone'))
+            if key:
+                phones.setdefault(key, vol['id'])
+        self._phones = phones
+        self._save()
+
+    def _save(self):
+        tmp = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self._phones, f)
+        os.replace(tmp, self.path)
+        self._stamp = self.path.stat().st_mtime_ns
+
+    def get(self, phone):
+        key = normalize_phone(phone)
+        if not key:
+            return None
+        with self._lock:
+            self._load()
+            return self._phones.get(key)
+
+    def claim(self, phone, volunteer_id):
+        """Map phone to volunteer_id; returns the existing id if already taken"""
+        key = normalize_phone(phone)
+        with self._exclusive():
+            self._load()
+            existing = self._phones.get(key)
+            if key and existing and existing != volunteer_id:
+                return existing
+            self._assign(key, volunteer_id)
+            return None
+
+    def set(self, phone, volunteer_id):
+        """Map phone to volunteer_id unconditionally (updates and imports)"""
+        with self._exclusive():
+            self._load()
+            self._assign(normalize_phone(phone), volunteer_id)
+
+    def _assign(self, key, volunteer_id):
+        stale = [k for k, v in self._phones.items() if v == volunteer_id and k != key]
+        if not stale and (not key or self._phones.get(key) == volunteer_id):
+            return
+        for k in stale:
+            del self._phones[k]
+        if key:
+            self._phones[key] = volunteer_id
+        self._save()
+
+    def discard(self, phone, volunteer_id):
+        """Forget a mapping whose volunteer file no longer exists"""
+        with self._exclusive():
+            self._load()
+            key = normalize_phone(phone)
+            if self._phones.get(key) == volunteer_id:
+                del self._phones[key]
+                self._save()
+
+
+class JsonFileStore(SubmissionStore):
+    """The original crowd_data/ layout: one pretty-printed JSON file per record.
+
+    Every record write goes through the Journal; fsync=False keeps the
+    journal and the atomic renames but skips the fsyncs. With
+    layout='segments' submissions are instead packed into daily segment
+    files under crowd_data/segments/; records still in either layout are
+    read, and convert() moves them all to one.
+    """
+
+    def __init__(self, data_dir, fsync=True, layout='files'):
+        super().__init__()
+        self.data_dir = Path(data_dir)
+        self.submissions_dir = self.data_dir / 'submissions'
+        self.intel_dir = self.data_dir / 'intel'
+        self.volunteers_dir = self.data_dir / 'volunteers'
+        self.news_dir = self.data_dir / 'scraped_news'
+        self.locks_dir = self.data_dir / '.locks'
+        for d in [self.submissions_dir, self.intel_dir, self.volunteers_dir, self.news_dir, self.locks_dir]:
+            d.mkdir(parents=True, exist_ok=True)
+        self.journal = Journal(self.data_dir / '.journal', self.data_dir, fsync=fsync)
+        self.changes = ChangeLog(self.data_dir / '.submission_changes')
+        self._stripes = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        # Redo writes a crash interrupted; submissions fixed that way enter the change feed
+        for rel in self.journal.replay():
+            path = self.data_dir / rel
+            if self.submissions_dir in path.parents:
+                self.changes.append('put' if path.exists() else 'del', path.stem)
+        if layout not in ('files', 'segments'):
+            raise ValueError(f'Unknown submission layout: {layout}')
+        self.layout = layout
+        self.files = FileSource(self.submissions_dir)
+        self.segments = SegmentSource(self.data_dir / 'segments', fsync=fsync)
+        self.index = SubmissionIndex([self.files, self.segments], self.changes, on_change=self._notify,
+                                     on_scan=self._scanned)
+        self.index.refresh()
+        self.phones = PhoneIndex(self.data_dir / 'volunteer_phones.json', self.volunteers_dir)
+
+    def refresh(self):
+        self.index.refresh()
+
+    def _write(self, path, record):
+        self.journal.write(path, record)
+
+    @contextmanager
+    def _submission_lock(self, submission_id):
+        """Exclusive lock on one submission id, across threads and worker processes"""
+        stripe = zlib.crc32(submission_id.encode('utf-8')) % LOCK_STRIPES
+        with self._stripes[stripe]:
+            if fcntl is None:
+                yield
+                return
+            with open(self.locks_dir / f'{stripe}.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _read_dir(directory):
+        """Load every JSON file in a directory and its shards, newest file first"""
+        files = sorted(iter_files(directory, '.json'), key=lambda e: e.stat().st_mtime, reverse=True)
+        for f in files:
+            with open(f.path, 'r', encoding='utf-8') as fp:
+                yield json.load(fp)
+
+    @staticmethod
+    def _record_paths(directory, name):
+        """Sharded path a record is written to, then the flat one it may still have"""
+        path = shard_path(directory, name)
+        return [path] if path.parent == directory else [path, directory / name]
+
+    # Submissions
+    def get_submission(self, submission_id):
+        return self.index.get(submission_id)
+
+    def _put_submission(self, submission, layout=None):
+        submission_file, *flat = self._record_paths(self.submissions_dir, f"{submission['id']}.json")
+        old = self.index.get(submission['id'])
+        owner = self.index.source_of(submission['id'])
+        if (layout or self.layout) == 'segments':
+            self.segments.put(submission, old if owner is self.segments else None)
+            self.index.put(submission, self.segments)
+            flat.append(submission_file)   # left over from the files layout
+        else:
+            self._write(submission_file, submission)
+            self.files.mark(submission['id'], submission_file)
+            self.index.put(submission, self.files)
+            if owner is self.segments:
+                self.segments.delete(old)
+        for path in flat:
+            self.journal.delete(path)
+
+    def save_submission(self, submission):
+        with self._submission_lock(submission['id']):
+            self._put_submission(submission)
+
+    def update_submission(self, submission_id, update):
+        with self._submission_lock(submission_id):
+            old = self.index.get(submission_id)
+            new = update(dict(old)) if old is not None else None
+            if new is not None:
+                self._put_submission(new)
+            return old, new
+
+    def delete_submission(self, submission_id):
+        with self._submission_lock(submission_id):
+            old = self.index.get(submission_id)
+            if self.index.source_of(submission_id) is self.segments:
+                self.segments.delete(old)
+            deleted = [self.journal.delete(path)
+                       for path in self._record_paths(self.submissions_dir, f"{submission_id}.json")]
+            if old is None and not any(deleted):
+                return False
+            self.index.remove(submission_id)
+            return True
+
+    def convert(self, layout):
+        """Move every submission to layout ('files' or 'segments'); returns how many moved"""
+        target = self.segments if layout == 'segments' else self.files
+        moved = 0
+        for submission in self.index.values():
+            with self._submission_lock(submission['id']):
+                current = self.index.get(submission['id'])
+                if current is None or self.index.source_of(submission['id']) is target:
+                    continue
+                self._put_submission(current, layout)
+                moved += 1
+        self.segments.compact()
+        return moved
+
+    def shard_files(self):
+        """Move record files written before date sharding into their shards; returns counts"""
+        self.journal.checkpoint()   # so no journal entry can redo a write at a flat path
+
+        def move_submission(src, dst):
+            with self._submission_lock(src.stem):
+                if dst.exists():
+                    self.journal.delete(src)   # saved again since, in its shard
+                    return False
+                os.rename(src, dst)
+
+        return {'submissions': shard_directory(self.submissions_dir, move_submission),
+                'intel': shard_directory(self.intel_dir),
+                'scraped_news': shard_directory(self.news_dir)}
+
+    def list_submissions(self, status=None, zone=None, since=None, until=None,
+                         geotagged=False, bbox=None, newest_first=True, limit=None, after=None):
+        if not bbox:
+            # Walk the received_at order so a page costs O(limit), not O(archive)
+            return self.index.page(
+                newest_first, after, since, until, limit=limit,
+                predicate=lambda s: submission_matches(s, status, zone, geotagged=geotagged))
+        items = [s for s in self.index.in_bbox(bbox)
+                 if submission_matches(s, status, zone, since, until, geotagged, bbox)]
+        if after:
+            after = tuple(after)
+            items = [s for s in items if (time_key(s) < after if newest_first else time_key(s) > after)]
+        items.sort(key=time_key, reverse=newest_first)
+        return items[:limit] if limit else items
+
+    def count_submissions(self, status=None, zone=None, since=None, until=None):
+        if not (zone or since or until):
+            counts = self.index.counts()
+            return counts.get(status, 0) if status else counts['all']
+        return sum(1 for s in self.index.values()
+                   if submission_matches(s, status, zone, since, until))
+
+    def submission_counts(self):
+        return self.index.counts()
+
+    def iter_submissions(self):
+        return iter(self.index.values())
+
+    def change_seq(self):
+        return self.changes.latest()
+
+    def _change_entries(self, since, limit):
+        return self.changes.after(since, limit)
+
+    # Volunteers
+    def save_volunteer(self, volunteer):
+        self._write(self.volunteers_dir / f"{volunteer['id']}.json", volunteer)
+        self.phones.set(volunteer.get('phone'), volunteer['id'])
+
+    def register_volunteer(self, volunteer):
+        existing_id = self.phones.claim(volunteer.get('phone'), volunteer['id'])
+        if existing_id:
+            existing = self._read_volunteer(existing_id)
+            if existing:
+                return existing
+            # The file was removed by hand; let the new registration take the phone
+            self.phones.set(volunteer.get('phone'), volunteer['id'])
+        self._write(self.volunteers_dir / f"{volunteer['id']}.json", volunteer)
+        return None
+
+    def _read_volunteer(self, volunteer_id):
+        try:
+            with open(self.volunteers_dir / f"{volunteer_id}.json", 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def list_volunteers(self):
+        return list(self._read_dir(self.volunteers_dir))
+
+    def find_volunteer_by_phone(self, phone):
+        volunteer_id = self.phones.get(phone)
+        if not volunteer_id:
+            return None
+        vol = self._read_volunteer(volunteer_id)
+        if vol is None:
+            self.phones.discard(phone, volunteer_id)
+        return vol
+
+    # X intelligence
+    def save_intel(self, intel):
+        path = shard_path(self.intel_dir, f"x_intel_{intel['id']}.json")
+        self._write(path, intel)
+        return f'crowd_data/{path.relative_to(self.data_dir).as_posix()}'
+
+    # Scraped news
+    def save_news(self, record):
+        self._write(shard_path(self.news_dir, f"{record['id']}.json"), record)
+
+    def list_news(self):
+        return list(self._read_dir(self.news_dir))
+
+    def delete_news(self, news_id):
+        deleted = [self.journal.delete(path) for path in self._record_paths(self.news_dir, f"{news_id}.json")]
+        return any(deleted)
+
+
+# =============================================================================
+# SQLITE BACKEND
+# =============================================================================
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id TEXT PRIMARY KEY,
+    received_at TEXT NOT NULL DEFAULT '',
+    verification_status TEXT NOT NULL DEFAULT 'pending',
+    zone TEXT NOT NULL DEFAULT '',
+    lat REAL,
+    lon REAL,
+    flood_depth_cm INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_submissions_received_at ON submissions(received_at, id);
+CREATE INDEX IF NOT EXISTS idx_submissions_status ON submissions(verification_status, received_at);
+CREATE INDEX IF NOT EXISTS idx_submissions_zone ON submissions(zone, received_at);
+CREATE INDEX IF NOT EXISTS idx_submissions_latlon ON submissions(lat, lon);
+
+-- One row per submission write; the latest seq doubles as the store version
+-- workers compare to tell when others wrote. AUTOINCREMENT keeps seqs unique
+-- after old rows are trimmed.
+CREATE TABLE IF NOT EXISTS submission_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL,               -- 'put' or 'del'
+    submission_id TEXT NOT NULL,
+    old_data TEXT                   -- record before the write ('null' if new); NULL in older rows
+);
+
+CREATE TABLE IF NOT EXISTS volunteers (
+    id TEXT PRIMARY KEY,
+    phone TEXT NOT NULL DEFAULT '',
+    phone_key TEXT NOT NULL DEFAULT '',   -- normalize_phone(phone)
+    registered_at TEXT NOT NULL DEFAULT '',
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_volunteers_registered_at ON volunteers(registered_at);
+
+CREATE TABLE IF NOT EXISTS intel (
+    id TEXT PRIMARY KEY,
+    collected_at TEXT NOT NULL DEFAULT '',
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS scraped_news (
+    id TEXT PRIMARY KEY,
+    scraped_at TEXT NOT NULL DEFAULT '',
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_scraped_news_scraped_at ON scraped_news(scraped_at);
+"""
+
+class SqliteStore(SubmissionStore):
+    """All crowd_data records in one WAL-mode SQLite database.
+
+    The columns used for filtering and sorting are copied out of the record so
+    they can be indexed; the full record is kept as JSON in the data column.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = str(path)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._pool = []
+        self._pool_lock = threading.Lock()
+        self._pid = os.getpid()   # connections do not survive fork; see _connect()
+        self._inherited = []
+        self._version_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(SQLITE_SCHEMA)
+            self._migrate(conn)
+            self._version = self._read_version(conn)
+
+    @staticmethod
+    def _migrate(conn):
+        """Bring databases created by older versions up to SQLITE_SCHEMA"""
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(volunteers)')}
+        if 'phone_key' not in columns:
+            conn.execute("ALTER TABLE volunteers ADD COLUMN phone_key TEXT NOT NULL DEFAULT ''")
+            rows = conn.execute('SELECT id, phone FROM volunteers').fetchall()
+            conn.executemany('UPDATE volunteers SET phone_key = ? WHERE id = ?',
+                             [(normalize_phone(row['phone']), row['id']) for row in rows])
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(submission_changes)')}
+        if 'old_data' not in columns:
+            conn.execute('ALTER TABLE submission_changes ADD COLUMN old_data TEXT')
+        conn.execute('DROP TABLE IF EXISTS store_version')   # replaced by submission_changes
+        conn.execute('DROP INDEX IF EXISTS idx_volunteers_phone')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_volunteers_phone_key ON volunteers(phone_key, registered_at)')
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=30000')
+        return conn
+
+    @contextmanager
+    def _connect(self):
+        """Borrow a pooled connection; commits on success, rolls back on error"""
+        with self._pool_lock:
+            if self._pid != os.getpid():
+                # A gunicorn worker forked from the preloading master. Its connections
+                # are never used, nor closed: closing one could checkpoint or remove the
+                # WAL, and release locks, that belong to the master.
+                self._inherited.extend(self._pool)
+                self._pool = []
+                self._pid = os.getpid()
+            conn = self._pool.pop() if self._pool else None
+        if conn is None:
+            conn = self._open()
+        try:
+            with conn:
+                yield conn
+        finally:
+            with self._pool_lock:
+                self._pool.append(conn)
+
+    @staticmethod
+    def _read_version(conn):
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'submission_changes'").fetchone()
+        return row[0] if row else 0
+
+    def _bump_version(self, conn, op, submission_id, old_data):
+        seq = conn.execute('INSERT INTO submission_changes (op, submission_id, old_data) VALUES (?, ?, ?)',
+                           (op, submission_id, old_data)).lastrowid
+        if seq % 1000 == 0:
+            conn.execute('DELETE FROM submission_changes WHERE seq <= ?', (seq - CHANGE_LOG_KEEP,))
+        return seq
+
+    def _changed(self, version, old, new):
+        """Notify listeners of a committed local write"""
+        with self._version_lock:
+            if version <= self._version:
+                return   # already replayed by _catch_up()
+            if version == self._version + 1:
+                self._version = version
+                self._notify(old, new)
+            else:
+                self._catch_up()   # another process wrote in between
+
+    def _catch_up(self, fresh=()):
+        """Replay the changes listeners missed, from the records saved before each one.
+
+        Listeners in fresh are reset instead, and so is every listener once
+        the changes have been trimmed from submission_changes. The caller
+        holds _version_lock.
+        """
+        listeners = [listener for listener in self._listeners if listener not in fresh]
+        replay, current, submissions = [], {}, None
+        with self._connect() as conn:
+            conn.execute('BEGIN')   # change rows and records from one snapshot
+            latest = self._read_version(conn)
+            if latest != self._version and listeners:
+                oldest = conn.execute('SELECT MIN(seq) FROM submission_changes').fetchone()[0]
+                if oldest is not None and oldest - 1 <= self._version < latest:
+                    replay = conn.execute('SELECT submission_id, old_data FROM submission_changes '
+                                          'WHERE seq > ? ORDER BY seq', (self._version,)).fetchall()
+                if not replay or any(row['old_data'] is None for row in replay):
+                    fresh, listeners, replay = self._listeners, [], []
+            if fresh:
+                submissions = [json.loads(row['data']) for row in conn.execute('SELECT data FROM submissions')]
+            ids = list({row['submission_id'] for row in replay})
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                rows = conn.execute(f"SELECT id, data FROM submissions WHERE id IN ({','.join('?' * len(chunk))})",
+                                    chunk)
+                current.update((row['id'], json.loads(row['data'])) for row in rows)
+        self._version = latest
+        if fresh:
+            self._reset_listeners(fresh, submissions)
+        # Each change turned its old_data into the next change's old_data, or the current record
+        steps, following = [], current
+        for row in reversed(replay):
+            old = json.loads(row['old_data'])
+            steps.append((old, following.get(row['submission_id'])))
+            following[row['submission_id']] = old
+        for old, new in reversed(steps):
+            self._notify(old, new, listeners)
+
+    def subscribe(self, listener):
+        with self._version_lock:
+            self._listeners.append(listener)
+            self._catch_up(fresh=[listener])
+
+    def refresh(self):
+        with self._connect() as conn:
+            version = self._read_version(conn)
+        if version != self._version:
+            with self._version_lock:
+                self._catch_up()
+
+    @staticmethod
+    def _where(status=None, zone=None, since=None, until=None, geotagged=False, bbox=None):
+        clauses, params = [], []
+        if status:
+            clauses.append('verification_status = ?')
+            params.append(status)
+        if zone:
+            clauses.append('zone = ?')
+            params.append(zone)
+        if since:
+            clauses.append('received_at >= ?')
+            params.append(since)
+        if until:
+            clauses.append('received_at <= ?')
+            params.append(until)
+        if geotagged:
+            clauses.append('lat IS NOT NULL AND lon IS NOT NULL')
+        if bbox:
+            min_lon, min_lat, max_lon, max_lat = bbox
+            clauses.append('lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?')
+            params.extend([min_lat, max_lat, min_lon, max_lon])
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    # Submissions
+    def get_submission(self, submission_id):
+        with self._connect() as conn:
+            row = conn.execute('SELECT data FROM submissions WHERE id = ?', (submission_id,)).fetchone()
+        return json.loads(row['data']) if row else None
+
+    def _put_submission(self, conn, submission, old_data='null'):
+        lat, lon = gps_of(submission)
+        conn.execute(
+            'INSERT OR REPLACE INTO submissions '
+            '(id, received_at, verification_status, zone, lat, lon, flood_depth_cm, data) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (submission['id'], submission.get('received_at') or '',
+             submission.get('verification_status', 'pending'), submission.get('zone', ''),
+             lat, lon, submission.get('flood_depth_cm') or 0, json.dumps(submission)))
+        return self._bump_version(conn, 'put', submission['id'], old_data)
+
+    def save_submission(self, submission):
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')   # so the change row records the version it replaced
+            row = conn.execute('SELECT data FROM submissions WHERE id = ?', (submission['id'],)).fetchone()
+            version = self._put_submission(conn, submission, row['data'] if row else 'null')
+        self._changed(version, json.loads(row['data']) if row else None, submission)
+
+    def update_submission(self, submission_id, update):
+        with self._connect() as conn:
+            # Take the write lock before reading so concurrent updates serialise
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT data FROM submissions WHERE id = ?', (submission_id,)).fetchone()
+            if row is None:
+                return None, None
+            old = json.loads(row['data'])
+            new = update(json.loads(row['data']))
+            if new is None:
+                return old, None
+            version = self._put_submission(conn, new, row['data'])
+        self._changed(version, old, new)
+        return old, new
+
+    def delete_submission(self, submission_id):
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT data FROM submissions WHERE id = ?', (submission_id,)).fetchone()
+            if row is None:
+                return False
+            conn.execute('DELETE FROM submissions WHERE id = ?', (submission_id,))
+            version = self._bump_version(conn, 'del', submission_id, row['data'])
+        self._changed(version, json.loads(row['data']), None)
+        return True
+
+    def list_submissions(self, status=None, zone=None, since=None, until=None,
+                         geotagged=False, bbox=None, newest_first=True, limit=None, after=None):
+        where, params = self._where(status, zone, since, until, geotagged, bbox)
+        if after:
+            # Keyset pagination on the (received_at, id) index
+            where += (' AND ' if where else ' WHERE ') + \
+                f"(received_at, id) {'<' if newest_first else '>'} (?, ?)"
+            params.extend(after)
+        order = 'DESC' if newest_first else 'ASC'
+        sql = f'SELECT data FROM submissions{where} ORDER BY received_at {order}, id {order}'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(int(limit))
+        with self._connect() as conn:
+            rows = [json.loads(row['data']) for row in conn.execute(sql, params)]
+        self._scanned('bbox' if bbox else 'page', len(rows))
+        return rows
+
+    def count_submissions(self, status=None, zone=None, since=None, until=None):
+        where, params = self._where(status, zone, since, until)
+        with self._connect() as conn:
+            return conn.execute(f'SELECT COUNT(*) FROM submissions{where}', params).fetchone()[0]
+
+    def submission_counts(self):
+        counts = {'all': 0, 'critical': 0}
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT verification_status, COUNT(*), SUM(flood_depth_cm > ?) '
+                'FROM submissions GROUP BY verification_status', (CRITICAL_DEPTH_CM,)).fetchall()
+        for status, count, critical in rows:
+            counts[status] = count
+            counts['all'] += count
+            counts['critical'] += critical or 0
+        return counts
+
+    def iter_submissions(self):
+        rows = 0
+        with self._connect() as conn:
+            for row in conn.execute('SELECT data FROM submissions'):
+                rows += 1
+                yield json.loads(row['data'])
+        self._scanned('all', rows)
+
+    def get_submissions(self, submission_ids):
+        submission_ids = list(submission_ids)
+        records = {}
+        with self._connect() as conn:
+            for i in range(0, len(submission_ids), 500):   # stay under SQLite's variable limit
+                chunk = submission_ids[i:i + 500]
+                rows = conn.execute(f"SELECT id, data FROM submissions WHERE id IN ({','.join('?' * len(chunk))})",
+                                    chunk)
+                records.update((row['id'], json.loads(row['data'])) for row in rows)
+        return records
+
+    def change_seq(self):
+        with self._connect() as conn:
+            return self._read_version(conn)
+
+    def _change_entries(self, since, limit):
+        with self._connect() as conn:
+            rows = conn.execute('SELECT seq, op, submission_id FROM submission_changes '
+                                'WHERE seq > ? ORDER BY seq LIMIT ?', (since, limit)).fetchall()
+            # Read after the rows so latest covers them even if a write landed in between
+            latest = self._read_version(conn)
+            oldest = conn.execute('SELECT MIN(seq) FROM submission_changes').fetchone()[0]
+        return [tuple(row) for row in rows], oldest or latest + 1, latest
+
+    # Volunteers
+    @staticmethod
+    def _put_volunteer(conn, volunteer):
+        conn.execute(
+            'INSERT OR REPLACE INTO volunteers (id, phone, phone_key, registered_at, data) VALUES (?, ?, ?, ?, ?)',
+            (volunteer['id'], volunteer.get('phone', ''), normalize_phone(volunteer.get('phone')),
+             volunteer.get('registered_at', ''), json.dumps(volunteer)))
+
+    def save_volunteer(self, volunteer):
+        with self._connect() as conn:
+            self._put_volunteer(conn, volunteer)
+
+    def register_volunteer(self, volunteer):
+        key = normalize_phone(volunteer.get('phone'))
+        with self._connect() as conn:
+            # Take the write lock before the lookup so concurrent registrations serialise
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT data FROM volunteers WHERE phone_key = ? AND id != ? ORDER BY registered_at LIMIT 1',
+                (key, volunteer['id'])).fetchone() if key else None
+            if row:
+                return json.loads(row['data'])
+            self._put_volunteer(conn, volunteer)
+        return None
+
+    def list_volunteers(self):
+        with self._connect() as conn:
+            rows = conn.execute('SELECT data FROM volunteers ORDER BY registered_at DESC').fetchall()
+        return [json.loads(row['data']) for row in rows]
+
+    def find_volunteer_by_phone(self, phone):
+        if not normalize_phone(phone):
+            return None
+        with self._connect() as conn:
+            row = conn.execute('SELECT data FROM volunteers WHERE phone_key = ? ORDER BY registered_at LIMIT 1',
+                               (normalize_phone(phone),)).fetchone()
+        return json.loads(row['data']) if row else None
+
+    # X intelligence
+    def save_intel(self, intel):
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO intel (id, collected_at, data) VALUES (?, ?, ?)',
+                         (intel['id'], intel.get('collected_at', ''), json.dumps(intel)))
+        return f"sqlite:intel/{intel['id']}"
+
+    # Scraped news
+    def save_news(self, record):
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO scraped_news (id, scraped_at, data) VALUES (?, ?, ?)',
+                         (record['id'], record.get('scraped_at', ''), json.dumps(record)))
+
+    def list_news(self):
+        with self._connect() as conn:
+            rows = conn.execute('SELECT data FROM scraped_news ORDER BY scraped_at DESC').fetchall()
+        return [json.loads(row['data']) for row in rows]
+
+    def delete_news(self, news_id):
+        with self._connect() as conn:
+            cur = conn.execute('DELETE FROM scraped_news WHERE id = ?', (news_id,))
+        return cur.rowcount > 0
+
+
+def open_store(backend, data_dir, sqlite_path=None, fsync=True, layout='files'):
+    """Create the configured backend ('json' or 'sqlite')"""
+    if backend == 'sqlite':
+        return SqliteStore(sqlite_path or Path(data_dir) / 'crowd.db')
+    if backend == 'json':
+        return JsonFileStore(data_dir, fsync=fsync, layout=layout)
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+def import_json_tree(source, target):
+    """Copy every record of a JsonFileStore into another store; returns counts"""
+    counts = {'submissions': 0, 'volunteers': 0, 'intel': 0, 'scraped_news': 0}
+    for submission in source.iter_submissions():
+        target.save_submission(submission)
+        counts['submissions'] += 1
+    for volunteer in source.list_volunteers():
+        target.save_volunteer(volunteer)
+        counts['volunteers'] += 1
+    for record in source._read_dir(source.intel_dir):
+        target.save_intel(record)
+        counts['intel'] += 1
+    for record in source.list_news():
+        target.save_news(record)
+        counts['scraped_news'] += 1
+    return counts
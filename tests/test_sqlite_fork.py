@@ -0,0 +1,51 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from storage import SqliteStore
+
+
+class Listener:
+    def reset(self, submissions):
+        self.ids = {s['id'] for s in submissions}
+
+    def apply(self, old, new):
+        if old:
+            self.ids.discard(old['id'])
+        if new:
+            self.ids.add(new['id'])
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork()')
+def test_forked_worker_opens_its_own_connections(tmp_path):
+    # Like gunicorn with preload_app: the store is built, and used, before the fork
+    store = SqliteStore(tmp_path / 'crowd.db')
+    listener = Listener()
+    store.subscribe(listener)
+    store.save_submission({'id': 'master', 'flood_depth_cm': 10})
+    inherited = list(store._pool)
+    assert inherited
+
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            with store._connect() as conn:
+                fresh = all(conn is not c for c in inherited)
+            store.save_submission({'id': 'worker', 'flood_depth_cm': 20})
+            code = 0 if fresh and store.get_submission('worker') else 1
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+
+    # The master's connections still work and see the worker's write
+    assert store.get_submission('worker')['flood_depth_cm'] == 20
+    store.refresh()
+    assert listener.ids == {'master', 'worker'}
+    with store._connect() as conn:
+        assert conn.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
@@ -0,0 +1,69 @@
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from turnstile import TurnstileVerifier, VALID, INVALID
+
+
+class Response:
+    status_code = 200
+
+    def __init__(self, success):
+        self.success = success
+
+    def json(self):
+        return {'success': self.success}
+
+
+class SlowUpstream:
+    """siteverify stand-in that answers once released; like Cloudflare, a token passes once"""
+
+    def __init__(self):
+        self.calls = 0
+        self.seen = set()
+        self.release = threading.Event()
+
+    def post(self, url, data):
+        self.calls += 1
+        self.release.wait(5)
+        fresh = data['response'] not in self.seen
+        self.seen.add(data['response'])
+        return Response(fresh)
+
+
+@pytest.mark.parametrize('shared_dir', [False, True])
+def test_concurrent_submits_with_one_token_get_one_valid(tmp_path, shared_dir):
+    upstream = SlowUpstream()
+    verifier = TurnstileVerifier(upstream, 'siteverify', 'secret',
+                                 cache_dir=tmp_path / 'cache' if shared_dir else None)
+    first = verifier.start('token', '10.0.0.1')
+    second = verifier.start('token', '10.0.0.1')
+    outcomes = []
+    waiters = [threading.Thread(target=lambda f=f: outcomes.append(verifier.outcome(f, 5)))
+               for f in (first, second)]
+    for waiter in waiters:
+        waiter.start()
+    upstream.release.set()
+    for waiter in waiters:
+        waiter.join()
+    assert sorted(outcomes) == [INVALID, VALID]
+    assert upstream.calls == 1
+
+    # A later replay is not served from the cache
+    assert verifier.outcome(verifier.start('token', '10.0.0.1'), 5) == INVALID
+
+
+def test_result_of_a_timed_out_wait_stays_claimable(tmp_path):
+    upstream = SlowUpstream()
+    verifier = TurnstileVerifier(upstream, 'siteverify', 'secret', cache_dir=tmp_path / 'cache')
+    assert verifier.outcome(verifier.start('token', '10.0.0.1'), 0.05) == 'unavailable'
+    upstream.release.set()
+    verifier.start('token', '10.0.0.1').result(5)
+    retry = verifier.start('token', '10.0.0.1')
+    assert verifier.outcome(retry, 5) == VALID
+    assert upstream.calls == 1
+    assert verifier.outcome(verifier.start('token', '10.0.0.1'), 5) == INVALID
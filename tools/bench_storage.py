@@ -0,0 +1,106 @@
+"""
+Benchmark the JSON backend's submission layouts: one file per record or daily segments.
+
+    python tools/bench_storage.py --synthetic 5000 --days 90
+    python tools/bench_storage.py --corpus path/to/crowd_data
+
+Without --corpus, submissions shaped like the ones /api/submit saves are
+generated. Each layout is written to a temp directory, then reports the
+space the submissions take on disk (allocated blocks, not file sizes),
+the number of files, and how long a fresh worker takes to load its index,
+the cold scan every gunicorn worker does at startup. Run it with a cold
+page cache (echo 3 > /proc/sys/vm/drop_caches between layouts) to see the
+cost on a real disk rather than memory.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from storage import JsonFileStore
+
+ZONES = ['North', 'South', 'East', 'West', 'Central', 'Old City', 'Riverside', 'Airport']
+VEHICLES = ['', 'two_wheeler', 'car', 'bus', 'truck']
+USER_AGENTS = [
+    'Mozilla/5.0 (Linux; Android 14; SM-A546E) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/124.0.0.0 Mobile Safari/537.36',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) '
+    'Version/17.4 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (Linux; Android 13; Redmi Note 12) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/123.0.0.0 Mobile Safari/537.36',
+]
+
+def make_corpus(count, days):
+    rng = random.Random(1)
+    start = datetime(2026, 6, 1)
+    for i in range(count):
+        received = start + timedelta(seconds=rng.randrange(days * 86400))
+        submission_id = f"{received.strftime('%Y%m%d_%H%M%S')}_{i:08x}"
+        yield {
+            'id': submission_id,
+            'name': f'Reporter {i}',
+            'phone': f'98{rng.randrange(10 ** 8):08d}',
+            'street': f'Street {rng.randrange(400)}',
+            'zone': rng.choice(ZONES),
+            'vehicle_type': rng.choice(VEHICLES),
+            'flood_depth_cm': rng.randrange(0, 150),
+            'remarks': rng.choice(['', 'Water rising fast', 'Road closed near the market']),
+            'gps': {'lat': 28.4 + rng.random() * 0.5, 'lon': 77.0 + rng.random() * 0.5,
+                    'accuracy': round(rng.uniform(3, 40), 1)},
+            'image_path': f'crowd_data/images/{submission_id}.jpg',
+            'thumbnail_path': f'crowd_data/thumbnails/thumb_{submission_id}.jpg',
+            'thumbnail_status': 'ready',
+            'received_at': received.isoformat(),
+            'user_agent': rng.choice(USER_AGENTS),
+            'verification_status': rng.choice(['pending', 'verified', 'verified', 'rejected']),
+        }
+
+def footprint(directory):
+    """(bytes allocated on disk, number of files) under directory"""
+    allocated = files = 0
+    for root, _, names in os.walk(directory):
+        for name in names:
+            st = os.stat(os.path.join(root, name))
+            allocated += st.st_blocks * 512
+            files += 1
+    return allocated, files
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--corpus', help='crowd_data directory to copy submissions from')
+    parser.add_argument('--synthetic', type=int, default=5000, help='generated submissions without --corpus')
+    parser.add_argument('--days', type=int, default=60, help='days the generated submissions span')
+    args = parser.parse_args()
+
+    if args.corpus:
+        submissions = list(JsonFileStore(args.corpus).iter_submissions())
+    else:
+        submissions = list(make_corpus(args.synthetic, args.days))
+    print(f"{len(submissions)} submissions")
+    print(f"{'layout':<10} {'files':>8} {'disk MB':>9} {'bytes/rec':>10} {'write s':>8} {'load s':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for layout in ('files', 'segments'):
+            data_dir = Path(tmp) / layout
+            # No fsync: this measures the layout, not the disk's flush latency
+            store = JsonFileStore(data_dir, fsync=False, layout=layout)
+            start = time.perf_counter()
+            for submission in submissions:
+                store.save_submission(submission)
+            written = time.perf_counter() - start
+            start = time.perf_counter()
+            loaded = JsonFileStore(data_dir, fsync=False, layout=layout).count_submissions()
+            load = time.perf_counter() - start
+            assert loaded == len(submissions), loaded
+            directory = store.submissions_dir if layout == 'files' else store.segments.directory
+            allocated, files = footprint(directory)
+            print(f"{layout:<10} {files:>8} {allocated / 1e6:>9.1f} {allocated / len(submissions):>10.0f} "
+                  f"{written:>8.2f} {load:>8.2f}")
+
+if __name__ == '__main__':
+    main()
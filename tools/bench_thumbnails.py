@@ -0,0 +1,91 @@
+"""
+Benchmark the thumbnail pipeline against the original create_thumbnail().
+
+    python tools/bench_thumbnails.py --corpus path/to/phone_photos
+    python tools/bench_thumbnails.py --synthetic 20
+
+Without --corpus a set of 4032x3024 JPEGs (a typical 12 MP phone photo, half
+of them with an EXIF rotation tag) is generated in a temp directory. Reports
+per-image wall time and peak RSS of each pipeline, run in separate processes
+so the memory numbers do not mix.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image
+
+
+def legacy_create_thumbnail(image_path, thumbnail_path, size=(300, 300)):
+    """create_thumbnail() as it was before the draft-mode pipeline"""
+    img = Image.open(image_path)
+    img.thumbnail(size, Image.Resampling.LANCZOS)
+    if img.mode in ('RGBA', 'P'):
+        img = img.convert('RGB')
+    img.save(thumbnail_path, 'JPEG', quality=85, optimize=True)
+    return True
+
+def make_corpus(directory, count):
+    """12 MP photo-like JPEGs, every other one tagged as rotated 90 degrees"""
+    paths = []
+    size = (4032, 3024)
+    # Smooth gradients plus mild sensor-like noise compress like real photos
+    base = Image.merge('RGB', [
+        Image.linear_gradient('L').resize(size),
+        Image.radial_gradient('L').resize(size),
+        Image.linear_gradient('L').rotate(90).resize(size),
+    ])
+    noise = Image.effect_noise(size, 12).convert('RGB')
+    for i in range(count):
+        img = Image.blend(base, noise, 0.15 + 0.01 * i)
+        exif = Image.Exif()
+        if i % 2:
+            exif[0x0112] = 6
+        path = Path(directory) / f'photo_{i:03d}.jpg'
+        img.save(path, 'JPEG', quality=92, exif=exif)
+        paths.append(str(path))
+    return paths
+
+def run(pipeline, paths, out_dir):
+    import resource
+    from media import create_thumbnails
+    funcs = {'legacy': legacy_create_thumbnail, 'pipeline': create_thumbnails}
+    timings = []
+    for i, path in enumerate(paths):
+        start = time.perf_counter()
+        funcs[pipeline](path, os.path.join(out_dir, f'{pipeline}_{i}.jpg'))
+        timings.append((time.perf_counter() - start) * 1000)
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return timings, peak_rss_mb
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--corpus', help='directory of JPEG photos to benchmark on')
+    parser.add_argument('--synthetic', type=int, default=10, help='number of generated photos without --corpus')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.corpus:
+            paths = sorted(str(p) for p in Path(args.corpus).iterdir()
+                           if p.suffix.lower() in ('.jpg', '.jpeg', '.png', '.webp'))
+        else:
+            paths = make_corpus(tmp, args.synthetic)
+        total_mb = sum(os.path.getsize(p) for p in paths) / 1e6
+        print(f"{len(paths)} images, {total_mb:.1f} MB")
+        print(f"{'pipeline':<10} {'outputs':>8} {'mean ms':>9} {'p50 ms':>9} {'max ms':>9} {'peak RSS MB':>12}")
+        for pipeline, outputs in (('legacy', 1), ('pipeline', 3)):
+            # Fresh process per pipeline so ru_maxrss reflects only that run
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                timings, rss = pool.submit(run, pipeline, paths, tmp).result()
+            print(f"{pipeline:<10} {outputs:>8} {statistics.mean(timings):>9.1f} "
+                  f"{statistics.median(timings):>9.1f} {max(timings):>9.1f} {rss:>12.1f}")
+
+if __name__ == '__main__':
+    main()
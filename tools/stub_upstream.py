@@ -0,0 +1,105 @@
+"""
+Local stand-in for the outbound services, for load and failure testing.
+
+    python tools/stub_upstream.py --port 9200 --delay 0.2 --fail-rate 0.1
+    TURNSTILE_VERIFY_URL=http://127.0.0.1:9200/siteverify \
+    X_API_BASE=http://127.0.0.1:9200 AI_API_BASE=http://127.0.0.1:9200 python app.py
+
+Answers every GET/POST with a JSON body after --delay seconds. --fail-rate
+of the requests get --fail-status instead, and --hang-rate never answer
+within any sane timeout, which is how a stuck upstream looks to the client.
+
+/siteverify behaves like Turnstile: tokens starting with "invalid" fail and,
+as with the real service, a token can only be verified once; the number of
+verifications is logged so cache hit rates can be read off a load test.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Shaped enough like the real services for app.py to accept the replies
+RESPONSES = {
+    '/2/tweets/search/recent': {'data': [{'id': '1', 'text': 'Waterlogging near the underpass', 'lang': 'en'}]},
+    '/chat/completions': {'choices': [{'message': {'content': '{"summary": "stub"}'}}]},
+    '/api/search': {'urls': []},
+    '/api/extract': {'items': []},
+}
+
+
+def siteverify(form, seen, lock):
+    token = (form.get('response') or [''])[0]
+    with lock:
+        reused = token in seen
+        seen.add(token)
+        count = len(seen)
+    if count % 100 == 0:
+        print(f"siteverify: {count} distinct tokens verified")
+    if reused:
+        return {'success': False, 'error-codes': ['timeout-or-duplicate']}
+    if not token or token.startswith('invalid'):
+        return {'success': False, 'error-codes': ['invalid-input-response']}
+    return {'success': True}
+
+def make_handler(args):
+    seen_tokens = set()
+    seen_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'   # keep-alive, like the real services
+
+        def _reply(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            roll = random.random()
+            if roll < args.hang_rate:
+                time.sleep(args.hang_seconds)
+            elif args.delay:
+                time.sleep(args.delay)
+            if roll < args.hang_rate + args.fail_rate:
+                status, body = args.fail_status, {'error': 'stub failure'}
+            elif self.path.split('?')[0] == '/siteverify':
+                status, body = 200, siteverify(parse_qs(body.decode()), seen_tokens, seen_lock)
+            else:
+                status, body = 200, RESPONSES.get(self.path.split('?')[0], {'ok': True})
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = _reply
+        do_POST = _reply
+
+        def log_message(self, format, *log_args):
+            if not args.quiet:
+                super().log_message(format, *log_args)
+
+    return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9200)
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds before every reply')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of replies that fail')
+    parser.add_argument('--fail-status', type=int, default=503)
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='fraction of requests that hang')
+    parser.add_argument('--hang-seconds', type=float, default=300.0)
+    parser.add_argument('--quiet', action='store_true', help='do not log each request')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args))
+    print(f"Stub upstream on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
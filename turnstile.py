@@ -0,0 +1,194 @@
+"""
+Cloudflare Turnstile verification off the request thread.
+
+Verification starts as soon as the token is read and runs while the submit
+handler saves the photo. Results are cached by token and client IP, in
+memory and in a directory shared by the workers, so a client retrying a
+submit that timed out does not spend a second siteverify call on a token
+Cloudflare would now reject as a duplicate. A VALID result is single use:
+the first request to claim it removes it from the cache, and every other
+request with the same token, concurrent or later, gets INVALID.
+"""
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from pathlib import Path
+
+import requests
+
+VALID = 'valid'
+INVALID = 'invalid'
+UNAVAILABLE = 'unavailable'   # timed out or the upstream is down; never cached
+
+
+def token_hash(token, remote_ip=None):
+    return hashlib.sha256(f"{token}\0{remote_ip or ''}".encode('utf-8')).hexdigest()
+
+
+class TurnstileVerifier:
+    """Concurrent siteverify calls with a TTL cache and in-flight dedupe.
+
+    start(token) returns a future right away; outcome(future, timeout) waits
+    for at most timeout seconds and returns VALID, INVALID or UNAVAILABLE.
+    A future that times out keeps running, so callers can attach a done
+    callback that claim()s the result to settle a submission accepted in
+    degraded mode.
+    """
+
+    def __init__(self, http, upstream, secret, cache_dir=None, ttl=300, workers=8):
+        self.http = http
+        self.upstream = upstream
+        self.secret = secret
+        self.ttl = ttl
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.workers = workers
+        self._cache = {}      # hash -> (result, expires_at, also on disk)
+        self._inflight = {}   # hash -> future
+        self._lock = threading.RLock()
+        self._executor = None
+        self._pid = None
+        self._last_sweep = 0.0
+
+    def _get_executor(self):
+        # Like ThumbnailQueue: pools do not survive fork, start one per worker
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix='turnstile')
+                self._pid = os.getpid()
+            return self._executor
+
+    # Cache
+    def _cached(self, key):
+        """A cached result, without taking it; see claim()"""
+        now = time.time()
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit and hit[1] > now:
+                return hit[0]
+        if not self.cache_dir:
+            return None
+        path = self.cache_dir / key
+        try:
+            if path.stat().st_mtime + self.ttl <= now:
+                return None
+            result = path.read_text().strip()
+        except OSError:
+            return None
+        if result in (VALID, INVALID):
+            with self._lock:
+                self._cache.setdefault(key, (result, now + self.ttl, True))
+            return result
+        return None
+
+    def _take(self, key):
+        """Remove a cached VALID result; True for exactly one caller across the workers"""
+        with self._lock:
+            hit = self._cache.pop(key, None)
+        if hit and not hit[2]:
+            return hit[0] == VALID   # never reached the shared directory
+        if not self.cache_dir:
+            return False
+        try:
+            os.unlink(self.cache_dir / key)   # the worker whose unlink succeeds wins
+            return True
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            print(f"Turnstile cache error: {e}")
+            return False
+
+    def _remember(self, key, result):
+        now = time.time()
+        shared = False
+        if self.cache_dir:
+            # On disk first, so a claim made through the memory entry removes this file too
+            try:
+                tmp = self.cache_dir / f'.{key}.{os.getpid()}.tmp'
+                tmp.write_text(result)
+                os.replace(tmp, self.cache_dir / key)
+                shared = True
+            except OSError as e:
+                print(f"Turnstile cache error: {e}")
+        with self._lock:
+            self._cache[key] = (result, now + self.ttl, shared)   # (result, expires_at, on disk)
+            sweep = now - self._last_sweep > self.ttl
+            if sweep:
+                self._last_sweep = now
+                self._cache = {k: v for k, v in self._cache.items() if v[1] > now}
+        if sweep and self.cache_dir:
+            try:
+                self._sweep_dir(now)
+            except OSError as e:
+                print(f"Turnstile cache error: {e}")
+
+    def _sweep_dir(self, now):
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.stat().st_mtime + self.ttl <= now:
+                        os.unlink(entry.path)
+                except OSError:
+                    pass
+
+    # Verification
+    def _verify(self, key, token, remote_ip):
+        try:
+            data = {'secret': self.secret, 'response': token}
+            if remote_ip:
+                data['remoteip'] = remote_ip
+            try:
+                response = self.http.post(self.upstream, data=data)
+                if response.status_code >= 500:
+                    return UNAVAILABLE
+                body = response.json()
+            except (requests.RequestException, ValueError) as e:
+                print(f"Turnstile error: {e}")
+                return UNAVAILABLE
+            if 'internal-error' in (body.get('error-codes') or []):
+                return UNAVAILABLE
+            result = VALID if body.get('success') else INVALID
+            self._remember(key, result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def start(self, token, remote_ip=None):
+        """Begin verifying token; returns a future resolving to VALID/INVALID/UNAVAILABLE"""
+        key = token_hash(token, remote_ip)
+        cached = self._cached(key)
+        if cached:
+            future = Future()
+            future.set_result(cached)
+            future.key = key
+            return future
+        with self._lock:
+            # A retry arriving while the first call is still out shares its result
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = self._get_executor().submit(
+                    self._verify, key, token, remote_ip)
+                future.key = key
+            return future
+
+    def claim(self, future):
+        """Result of a finished future. VALID is single use: it is returned to the
+        first caller only, and any other waiter on the same token gets INVALID."""
+        result = future.result()
+        if result != VALID:
+            return result
+        return VALID if self._take(future.key) else INVALID
+
+    def outcome(self, future, timeout):
+        """Wait at most timeout seconds, then claim() the result"""
+        try:
+            future.result(timeout=timeout)
+        except FutureTimeout:
+            return UNAVAILABLE   # not claimed: a retry can still use the result
+        return self.claim(future)
+